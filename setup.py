@@ -13,6 +13,7 @@ setup(
     scripts=['example_script'],
     packages=find_packages(exclude=['test']),
     install_requires=[
-        'example_require'],
+        'jinja2',
+        'numpy'],
     include_package_data=True,
     zip_safe=False)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+#coding=utf-8
+#file: batch.py
+
+"""
+batch
+
+Scores a stream of profiles, writing the match probability of each profile in each sample set and
+for each theta as soon as it is calculated.
+
+    python -m strprofiles.batch -f ../data/ABresults.csv:AB\ :100 -n "AB Cau" -t 0.0 -t 0.01 < profiles.jsonl
+
+Profiles are read from a file, or standard input, in one of two formats:
+jsonl -- one JSON object per line, either {"id": ..., "profile": {"FGA": ["21", "22"], ...}} or the
+profile itself, {"FGA": ["21", "22"], ...}, identified by its line number
+csv -- a header row naming the markers, with an optional "id" column, then one row per profile with
+each genotype written as "21/22" (or "21,22"), blank if untyped
+
+Lines that cannot be read as a profile are skipped, and reported on standard error with their line
+numbers once the other profiles have been scored.
+
+Scores are written as JSON lines {"id", "name", "theta", "log10", "reciprocal"} or as .csv rows
+with those columns, or with the columns id, name, theta and log10 in the binary columnar format of
+the columnar module, for long runs to be read back with columnar.ColumnReader.
+
+"""
+
+import csv
+import json
+import sys
+from optparse import OptionParser
+
+import columnar
+import frequencies
+import sgm
+import strmarker
+
+
+def parse_genotype(cell):
+    """
+    Parse a .csv genotype cell, "21/22" or "21,22", into a pair of alleles, or None if blank
+    """
+    cell = cell.strip()
+    if not cell:
+        return None
+    alleles = cell.replace(',', '/').split('/')
+    if len(alleles) != 2:
+        raise ValueError('a genotype must have two alleles: %r' % cell)
+    return alleles[0].strip(), alleles[1].strip()
+
+
+def _json_profile(line, n):
+    """
+    Return the (id, profile) pair of a JSON line, see iter_profiles
+    """
+    record = json.loads(line)
+    if isinstance(record, dict) and 'profile' in record:
+        ident = record.get('id', n)
+        record = record['profile']
+    elif isinstance(record, dict) and 'id' in record:
+        raise ValueError('no profile')
+    else:
+        ident = n
+    if not isinstance(record, dict):
+        raise ValueError('a profile must be a JSON object')
+    profile = {}
+    for marker, alleles in record.items():
+        if not isinstance(alleles, list) or len(alleles) != 2:
+            raise ValueError('a genotype must have two alleles: %s %s' % (marker, json.dumps(alleles)))
+        profile[marker] = tuple(alleles)
+    return ident, profile
+
+
+def _line_error(errors, number, error):
+    """
+    Note an error reading a line, see iter_profiles
+    """
+    if errors is None:
+        raise ValueError('line %d: %s' % (number, error))
+    errors.append((number, str(error)))
+
+
+def iter_profiles(infile, input_format='jsonl', errors=None):
+    """
+    Read profiles from a stream, yielding (id, profile) pairs as each is read
+
+    Keyword arguments:
+    infile -- the file to be read, any file-like object or iterable of lines
+    input_format -- 'jsonl' or 'csv', see the module documentation
+    errors -- if given, a list to which a (line number, message) pair is appended for each line that
+    cannot be read as a profile, which is then skipped; otherwise such a line raises ValueError
+
+    Profiles are dicts in the form {'marker': (allele, allele), ...}.
+
+    """
+    if hasattr(infile, 'readline'):
+        # read line by line, rather than with the read-ahead of file iteration, so that each profile
+        # is available as soon as its line has been written to a pipe
+        infile = iter(infile.readline, '')
+    if input_format == 'csv':
+        reader = csv.reader(infile)
+        header = reader.next()
+        for n, row in enumerate(reader):
+            profile = {}
+            ident = n
+            try:
+                for column, cell in zip(header, row):
+                    if column == 'id':
+                        ident = cell
+                    else:
+                        genotype = parse_genotype(cell)
+                        if genotype is not None:
+                            profile[column] = genotype
+            except ValueError, e:
+                _line_error(errors, reader.line_num, e)
+                continue
+            yield ident, profile
+        return
+    for n, line in enumerate(infile):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            pair = _json_profile(line, n)
+        except ValueError, e:
+            _line_error(errors, n + 1, e)
+            continue
+        yield pair
+
+
+def score_profiles(data, profiles, names, thetas, chunk_size=256, minimum_frequency=0.0):
+    """
+    Calculate the log10 match probabilities of a stream of profiles, a chunk at a time
+
+    Each chunk of profiles is encoded once and evaluated for every sample set and theta with
+    strmarker.calc_profile_log_match_probabilities. Markers a profile does not have, or that a
+    sample set has no frequencies for, do not contribute.
+
+    Keyword arguments:
+    data -- the allele frequency data, a frequencies.FrequencyStore
+    profiles -- an iterable of (id, profile) pairs, see iter_profiles
+    names -- the names of the sample sets to score against
+    thetas -- the population subdivision coefficients to score with
+    chunk_size -- the number of profiles scored together
+    minimum_frequency -- the lowest frequency used for any allele, eg for alleles not seen in the
+    sample set
+
+    Yields a list for each chunk, of (id, name, theta, log10 match probability) tuples.
+
+    """
+    chunk = []
+    for item in profiles:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield _score_chunk(data, chunk, names, thetas, minimum_frequency)
+            chunk = []
+    if chunk:
+        yield _score_chunk(data, chunk, names, thetas, minimum_frequency)
+
+
+def _score_chunk(data, chunk, names, thetas, minimum_frequency):
+    """
+    Score one chunk of profiles, see score_profiles
+    """
+    markers = sorted(set([marker for ident, profile in chunk for marker in profile]))
+    genotypes = data.encode_profiles([profile for ident, profile in chunk], markers, grow=False)
+    ret = []
+    for name in names:
+        # markers the sample set has no frequencies for are treated as untyped
+        typed = [j for j, marker in enumerate(markers) if data.get(name, marker) is not None]
+        logs = strmarker.calc_profile_log_match_probabilities(genotypes[:, typed], data, name,
+            [markers[j] for j in typed], list(thetas), minimum_frequency=minimum_frequency).tolist()
+        for (ident, profile), row in zip(chunk, logs):
+            for theta, log10 in zip(thetas, row):
+                ret.append((ident, name, theta, log10))
+    return ret
+
+
+def write_scores(scores, out, output_format='jsonl'):
+    """
+    Write a list of scores, as yielded by score_profiles, to a stream
+
+    Keyword arguments:
+    scores -- a list of (id, name, theta, log10 match probability) tuples
+    out -- the stream to write to
+    output_format -- 'jsonl' or 'csv', see the module documentation
+
+    """
+    if output_format == 'csv':
+        writer = csv.writer(out, lineterminator='\n')
+    for ident, name, theta, log10 in scores:
+        if log10 == float('-inf'):
+            log10 = None
+            reciprocal = None
+        else:
+            reciprocal = 10 ** -log10
+        if output_format == 'csv':
+            writer.writerow([ident, name, theta, '' if log10 is None else repr(log10),
+                '' if reciprocal is None else repr(reciprocal)])
+        else:
+            out.write(json.dumps({'id': ident, 'name': name, 'theta': theta, 'log10': log10,
+                'reciprocal': reciprocal}, sort_keys=True))
+            out.write('\n')
+
+
+def main():
+    """
+    Read in the allele frequency data, then score the profiles read from a file or standard input
+
+    """
+    parser = OptionParser(usage="usage: %prog [options] [PROFILES]")
+    parser.add_option("-f", "--frequencies", action="append", dest="sources", default=[],
+        metavar="FILE[:PREFIX[:NORMALIZER]]", help="allele frequency .csv file, may be repeated")
+    parser.add_option("-n", "--name", action="append", dest="names", default=[],
+        help="sample set to score against, may be repeated; defaults to every sample set")
+    parser.add_option("-t", "--theta", action="append", type="float", dest="thetas", default=[],
+        help="population subdivision coefficient, may be repeated; defaults to 0.0")
+    parser.add_option("-i", "--input-format", dest="input_format", default="jsonl", choices=["jsonl", "csv"],
+        help="format of the profiles, jsonl or csv")
+    parser.add_option("-o", "--output-format", dest="output_format", default="jsonl",
+        choices=["jsonl", "csv", "columnar"], help="format of the scores, jsonl, csv or columnar")
+    parser.add_option("-c", "--chunk-size", type="int", dest="chunk_size", default=256,
+        help="number of profiles scored together")
+    parser.add_option("-m", "--minimum-frequency", type="float", dest="minimum_frequency", default=0.0,
+        help="lowest frequency used for any allele")
+    (options, args) = parser.parse_args()
+    if not options.sources:
+        parser.error("no allele frequency data given, use -f")
+
+    data = frequencies.FrequencyStore()
+    for source in options.sources:
+        data.extend(sgm.read_csv(*sgm.parse_source(source)))
+    names = options.names or data.names()
+    for name in names:
+        if name not in data.names():
+            parser.error("unknown sample set %s" % name)
+    thetas = options.thetas or [0.0]
+
+    infile = open(args[0], "rb") if args else sys.stdin
+    out = sys.stdout
+    if options.output_format == 'csv':
+        out.write('id,name,theta,log10,reciprocal\n')
+    errors = []
+    profiles = iter_profiles(infile, options.input_format, errors)
+    chunks = score_profiles(data, profiles, names, thetas, options.chunk_size, options.minimum_frequency)
+    if options.output_format == 'columnar':
+        # the scores are spooled, and the file written once they have all been calculated
+        with columnar.ColumnWriter(out, columnar.SCORE_COLUMNS) as writer:
+            for scores in chunks:
+                writer.write_rows(scores)
+    else:
+        for scores in chunks:
+            write_scores(scores, out, options.output_format)
+            out.flush()
+    for number, message in errors:
+        print >> sys.stderr, "line %d: %s" % (number, message)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
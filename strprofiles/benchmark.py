@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+#coding=utf-8
+#file: benchmark.py
+
+"""
+benchmark
+
+Times the strmarker and sgm hot paths on synthetic data of configurable scale, and compares the
+timings against a saved baseline.
+
+    python -m strprofiles.benchmark --populations 40 --loci 20 --alleles 30 --save baseline.json
+    python -m strprofiles.benchmark --populations 40 --loci 20 --alleles 30 --compare baseline.json
+
+"""
+
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import timeit
+from optparse import OptionParser
+
+import frequencies
+import mixture
+import sgm
+import strmarker
+import synthetic
+
+
+class Config(object):
+    """
+    The scale of the synthetic data used by the benchmarks.
+    """
+
+    def __init__(self, populations=5, loci=10, alleles=20, profiles=10000, repeat=3, seed=0):
+        self.populations = populations
+        self.loci = loci
+        self.alleles = alleles
+        self.profiles = profiles
+        self.repeat = repeat
+        self.seed = seed
+        self.csvfile = None
+
+
+class Fixture(object):
+    """
+    Synthetic data shared by the benchmarks, read from the configuration's .csv file.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.data = sgm.read_csv(config.csvfile, '', 1, cache=False)
+        self.store = frequencies.FrequencyStore(self.data)
+        self.names = self.store.names()
+        self.markers = synthetic.marker_names(config.loci)
+        self.genotypes = synthetic.random_profiles(self.store, self.names[0], self.markers, config.profiles,
+            config.seed)
+        # decoded here so that decoding is not timed by bench_calc_profile_match_probability
+        self.profiles = synthetic.decode_profiles(self.store, self.names[0], self.markers, self.genotypes[:10000])
+
+
+def bench_calc_marker_rmp(fixture):
+    """calc_marker_rmp over every sample set and marker"""
+    for d in fixture.data:
+        strmarker.calc_marker_rmp(d['alleles'], 0.01)
+    return len(fixture.data)
+
+
+def bench_pool_alleles(fixture):
+    """pool_alleles over every sample set and marker"""
+    for d in fixture.data:
+        strmarker.pool_alleles(d['alleles'], 5, 2 * d['count'])
+    return len(fixture.data)
+
+
+def bench_calc_cutoff_sweep(fixture):
+    """calc_cutoff_sweep over 20 cutoffs for every sample set, with empty caches"""
+    strmarker.clear_caches()
+    cutoffs = range(20)
+    for name in fixture.names:
+        strmarker.calc_cutoff_sweep(fixture.store, name, cutoffs, 0.01)
+    return len(fixture.names) * len(cutoffs)
+
+
+def bench_calc_rmps(fixture):
+    """calc_rmps for every sample set, with empty caches"""
+    strmarker.clear_caches()
+    for name in fixture.names:
+        strmarker.calc_rmps(fixture.store, name, 5, 0.01)
+    return len(fixture.names)
+
+
+def bench_calc_profile_match_probability(fixture):
+    """calc_profile_match_probability, one profile at a time"""
+    for profile in fixture.profiles:
+        strmarker.calc_profile_match_probability(profile, 0.01)
+    return len(fixture.profiles)
+
+
+def bench_calc_profile_log_match_probabilities(fixture):
+    """calc_profile_log_match_probabilities, all the profiles for three thetas"""
+    strmarker.calc_profile_log_match_probabilities(fixture.genotypes, fixture.store, fixture.names[0],
+        fixture.markers, [0.0, 0.01, 0.03])
+    return len(fixture.genotypes)
+
+
+def bench_calc_mixture_lr(fixture):
+    """calc_mixture_lr for 100 three person mixtures, with an empty cache"""
+    mixture.LOCUS_CACHE.clear()
+    mixtures = [fixture.profiles[i:i + 3] for i in range(0, len(fixture.profiles) - 2, 3)[:100]]
+    for profiles in mixtures:
+        observed = dict([(m, sorted(set([a[0] for p in profiles for a in p[m]]))) for m in fixture.markers])
+        mixture.calc_mixture_lr(observed, mixture.Hypothesis(profiles[:1], 2), mixture.Hypothesis([], 3),
+            fixture.store, fixture.names[0], 0.01)
+    return len(mixtures)
+
+
+def bench_read_csv(fixture):
+    """read_csv, parsing the .csv file"""
+    return len(sgm.read_csv(fixture.config.csvfile, '', 1, cache=False))
+
+
+def bench_read_csv_cached(fixture):
+    """read_csv, loading the binary cache"""
+    return len(sgm.read_csv(fixture.config.csvfile, '', 1))
+
+
+def bench_rmp_tables(fixture):
+    """rmp_table_text and rmp_table_html for every sample set"""
+    columns = sgm.calc_columns(fixture.store, [('rmp', name, 5, 0.01) for name in fixture.names])
+    sgm.format_rmps(columns, fixture.names, "text", "Benchmark")
+    sgm.format_rmps(columns, fixture.names, "html", "Benchmark")
+    return 2 * len(fixture.names)
+
+
+BENCHMARKS = [bench_calc_marker_rmp, bench_pool_alleles, bench_calc_cutoff_sweep, bench_calc_rmps,
+    bench_calc_profile_match_probability, bench_calc_profile_log_match_probabilities, bench_calc_mixture_lr,
+    bench_read_csv, bench_read_csv_cached, bench_rmp_tables]
+
+
+def _max_rss():
+    """Return the peak resident set size of this process, in kilobytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _proc_rss():
+    """
+    Return the current and peak resident set sizes of this process in kilobytes, from /proc/self/status,
+    or None where there is no /proc
+    """
+    sizes = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    sizes[line[:5]] = int(line.split()[1])
+    except IOError:
+        return None
+    if len(sizes) < 2:
+        return None
+    return sizes['VmRSS'], sizes['VmHWM']
+
+
+def _reset_peak_rss():
+    """
+    Reset the peak resident set size of this process to its current size, returning the current size
+    in kilobytes, or None if the peak cannot be reset (it can on Linux)
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except IOError:
+        return None
+    sizes = _proc_rss()
+    return sizes and sizes[0]
+
+
+def run_benchmark(name, config):
+    """
+    Run the named benchmark, returning a dict with its best time in seconds over config.repeat runs,
+    the number of items processed in each run, and the increase in peak memory in kilobytes
+    """
+    bench = globals()[name]
+    fixture = Fixture(config)
+    # the peak is a high water mark, which building the fixture may already have raised above anything
+    # the benchmark uses, so it is reset where possible; the baseline is taken before the first,
+    # warm-up, run, where caches and intermediate arrays first reach their peak size
+    reset = _reset_peak_rss()
+    rss = _max_rss() if reset is None else reset
+    bench(fixture)
+    best = None
+    items = 0
+    for _ in range(config.repeat):
+        start = timeit.default_timer()
+        items = bench(fixture)
+        elapsed = timeit.default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    peak = _max_rss() if reset is None else _proc_rss()[1]
+    return {'seconds': best, 'items': items, 'peak_kb': peak - rss}
+
+
+def run_benchmarks(config, names=None):
+    """
+    Run the benchmarks, each in a fresh worker process so that its peak memory is measured separately
+
+    Keyword arguments:
+    config -- the scale of the synthetic data
+    names -- the names of the benchmarks to run, defaults to all of them
+
+    Returns a dict of results keyed by benchmark name, see run_benchmark.
+
+    """
+    if names is None:
+        names = [bench.__name__ for bench in BENCHMARKS]
+    tmpdir = tempfile.mkdtemp()
+    try:
+        config.csvfile = os.path.join(tmpdir, 'synthetic.csv')
+        csvfile = open(config.csvfile, 'wb')
+        synthetic.write_csv(csvfile, synthetic.frequency_data(config.populations, config.loci, config.alleles,
+            config.seed))
+        csvfile.close()
+        results = {}
+        for name in names:
+            pool = multiprocessing.Pool(1)
+            try:
+                results[name] = pool.apply(run_benchmark, (name, config))
+            finally:
+                pool.close()
+                pool.join()
+        return results
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare benchmark results with a baseline, returning a list of (name, ratio) for those benchmarks
+    whose time has grown by more than the tolerance, eg 0.2 for 20%
+    """
+    regressions = []
+    for name in sorted(results):
+        if name in baseline:
+            ratio = results[name]['seconds'] / baseline[name]['seconds']
+            if ratio > 1.0 + tolerance:
+                regressions.append((name, ratio))
+    return regressions
+
+
+def format_results(results, baseline=None):
+    """
+    Format benchmark results as a text table, with the ratio to the baseline time if one is given
+    """
+    lines = ['%-45s %10s %12s %10s %8s' % ('benchmark', 'seconds', 'items/s', 'peak KB', 'ratio')]
+    for bench in BENCHMARKS:
+        name = bench.__name__
+        if name not in results:
+            continue
+        r = results[name]
+        ratio = ''
+        if baseline is not None and name in baseline:
+            ratio = '%8.2f' % (r['seconds'] / baseline[name]['seconds'])
+        lines.append('%-45s %10.4f %12.1f %10d %8s' % (name, r['seconds'], r['items'] / max(r['seconds'], 1e-9),
+            r['peak_kb'], ratio))
+    return '\n'.join(lines)
+
+
+def main():
+    """
+    Run the benchmarks and print the results, optionally saving them or comparing them with a baseline.
+    Exits with status 1 if any benchmark is slower than the baseline by more than the tolerance.
+    """
+    parser = OptionParser()
+    parser.add_option("--populations", type="int", dest="populations", default=5, help="number of sample sets")
+    parser.add_option("--loci", type="int", dest="loci", default=10, help="number of genetic markers")
+    parser.add_option("--alleles", type="int", dest="alleles", default=20, help="number of alleles per marker")
+    parser.add_option("--profiles", type="int", dest="profiles", default=10000, help="number of profiles")
+    parser.add_option("--repeat", type="int", dest="repeat", default=3, help="runs per benchmark, the best is kept")
+    parser.add_option("--seed", type="int", dest="seed", default=0, help="random seed for the synthetic data")
+    parser.add_option("-b", "--bench", action="append", dest="names", help="run only this benchmark")
+    parser.add_option("--save", dest="save", help="save the results as a baseline to this file")
+    parser.add_option("--compare", dest="compare", help="compare the results with the baseline in this file")
+    parser.add_option("--tolerance", type="float", dest="tolerance", default=0.2,
+        help="allowed slow down relative to the baseline, default 0.2")
+    (options, args) = parser.parse_args()
+
+    config = Config(options.populations, options.loci, options.alleles, options.profiles, options.repeat,
+        options.seed)
+    results = run_benchmarks(config, options.names)
+    baseline = None
+    if options.compare:
+        baseline = json.load(open(options.compare))
+    print format_results(results, baseline)
+    if options.save:
+        json.dump(results, open(options.save, 'w'), indent=1, sort_keys=True)
+    if baseline is not None:
+        regressions = compare(results, baseline, options.tolerance)
+        for name, ratio in regressions:
+            print "REGRESSION: %s is %.2f times slower than the baseline" % (name, ratio)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
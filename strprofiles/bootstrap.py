@@ -0,0 +1,131 @@
+"""
+bootstrap
+
+Bootstrap confidence intervals for random match probabilities, reflecting the sampling error of
+allele frequencies estimated from small samples.
+"""
+
+import numpy
+
+import kits
+import parallel
+import strmarker
+
+
+def pooled_rmps(frequencies, limit, theta):
+    """
+    Calculate the random match probability of each row of an array of allele frequencies, after
+    pooling as by strmarker.pool_alleles, and leaving out alleles with frequency zero
+
+    Each row is sorted, and the alleles pooled are the prefix ending at the first allele whose
+    frequency and preceding cumulative sum have both reached the limit, see strmarker.SortedAlleles.
+
+    Keyword arguments:
+    frequencies -- an array of shape (rows, alleles)
+    limit -- the frequency below which alleles are pooled
+    theta -- the population subdivision coefficient, used to correct for subdivided populations
+
+    """
+    f = numpy.sort(frequencies, axis=1)
+    rows, alleles = f.shape
+    # cumulative[:, i] is the sum of the i lowest frequencies
+    cumulative = numpy.zeros((rows, alleles + 1))
+    numpy.cumsum(f, axis=1, out=cumulative[:, 1:])
+    k = numpy.maximum((f < limit).sum(axis=1), (cumulative[:, :-1] < limit).sum(axis=1))
+    other = cumulative[numpy.arange(rows), k]
+    padded = numpy.empty((rows, alleles + 1))
+    padded[:, 0] = other
+    padded[:, 1:] = f
+    mask = (numpy.arange(-1, alleles) >= k[:, numpy.newaxis]) & (padded > 0)
+    mask[:, 0] = other != 0
+    return strmarker.calc_marker_rmp_array(padded, theta, mask)
+
+
+def _interval(estimate, replicates, confidence):
+    """
+    Return the point estimate with the two sided percentile interval and the one sided upper bound of
+    the bootstrap replicates, at the given confidence level
+    """
+    tail = 100.0 * (1.0 - confidence)
+    lower, upper, bound = numpy.percentile(replicates, [tail / 2, 100.0 - tail / 2, 100.0 - tail]).tolist()
+    return {'estimate': estimate, 'lower': lower, 'upper': upper, 'bound': bound}
+
+
+def bootstrap_rmps(data, name, cutoff, theta, replicates=1000, confidence=0.95, seed=0, kit=None):
+    """
+    Calculate bootstrap confidence intervals for the random match probabilities of the named sample set
+
+    For each marker, replicate allele counts are drawn from a multinomial distribution with the
+    sample's allele frequencies and its size (two alleles per person), and each replicate table is
+    pooled with the cutoff and its random match probability calculated, all replicates together as
+    arrays. Combined random match probabilities are the products over the markers of each replicate.
+
+    Keyword arguments:
+    data -- the allele frequency data
+    name -- the name of the sample set to be used
+    cutoff -- the minimum size of a frequency bin, items with a frequency lower than this will be pooled
+    theta -- the population subdivision coefficient, used to correct for subdivided populations
+    replicates -- the number of bootstrap replicates
+    confidence -- the confidence level of the intervals, eg 0.95
+    seed -- the random seed, or a numpy RandomState
+    kit -- the marker kit, see kits.get_kit; defaults to SGM Plus
+
+    Returns a dict with 'count', 'replicates', and for each marker and for 'combined' a dict with the
+    point 'estimate' of calc_rmps, the 'lower' and 'upper' limits of the percentile interval and the
+    one sided upper 'bound'.
+
+    Raises ValueError if the sample size of a marker is not known, or if the sample set has
+    frequencies for none of the kit's markers.
+
+    """
+    rng = seed if isinstance(seed, numpy.random.RandomState) else numpy.random.RandomState(seed)
+    samples = {}
+    combined = numpy.ones(replicates)
+    kit = kits.get_kit(kit)
+    for d in strmarker.select_markers(data, name, kit.markers):
+        try:
+            # note, count doubled since two allele values per person in sample
+            size = 2 * d['count']
+        except KeyError:
+            raise ValueError('the sample size of %s %s is not known' % (d['name'], d['marker']))
+        p = numpy.array(d['alleles'].values(), dtype=float)
+        counts = rng.multinomial(size, p / p.sum(), replicates)
+        samples[d['marker']] = pooled_rmps(counts / float(size), strmarker.pool_limit(cutoff, size), theta)
+        combined *= samples[d['marker']]
+    if not samples:
+        raise ValueError('sample set %s has none of the markers %s' % (name, ', '.join(kit.markers)))
+    samples['combined'] = combined
+    estimates = strmarker.calc_rmps(data, name, cutoff, theta, kit)
+    ret = {'count': estimates['count'], 'replicates': replicates}
+    for key, rmps in samples.items():
+        ret[key] = _interval(estimates[key], rmps, confidence)
+    return ret
+
+
+def _bootstrap_task(task, args):
+    """
+    Bootstrap one sample set, task being its (index, name)
+    """
+    data, cutoff, theta, replicates, confidence, seed, kit = args
+    index, name = task
+    rng = numpy.random.RandomState([seed, index])
+    return bootstrap_rmps(data, name, cutoff, theta, replicates, confidence, rng, kit)
+
+
+def bootstrap_samples(data, names, cutoff, theta, replicates=1000, confidence=0.95, seed=0, jobs=1, kit=None):
+    """
+    Calculate bootstrap confidence intervals for several sample sets, see bootstrap_rmps
+
+    Each sample set has its own random stream, seeded from seed and its position in names, see
+    parallel.imap_tasks.
+
+    Keyword arguments:
+    names -- the names of the sample sets
+    jobs -- the number of worker processes, see parallel.imap_tasks
+
+    Returns a dict of results keyed by name.
+
+    """
+    tasks = list(enumerate(names))
+    args = (data, cutoff, theta, replicates, confidence, seed, kits.get_kit(kit))
+    return dict(zip(names, parallel.map_tasks(_bootstrap_task, tasks, args, jobs)))
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+#coding=utf-8
+#file: builder.py
+
+"""
+builder
+
+Builds allele frequency data from raw genotype calls, counting alleles incrementally so that new
+samples can be added to the counts, and counts made in parallel merged, without re-reading the
+genotypes already counted.
+
+    python -m strprofiles.builder --counts counts.json --output frequencies.csv new_samples.csv
+
+Genotypes are read in one of two formats:
+csv -- a header row with a "population" column, an optional "id" column and one column per marker,
+then one row per sample with each genotype written as "21/22" (or "21,22"), blank if untyped
+jsonl -- one JSON object per line, {"population": ..., "profile": {"FGA": ["21", "22"], ...}}
+
+"""
+
+import csv
+import json
+import sys
+from collections import Counter
+from optparse import OptionParser
+
+import batch
+import parallel
+import sgm
+
+
+def iter_genotypes(infile, input_format='csv'):
+    """
+    Read raw genotype calls from a stream, yielding a (population, profile) pair for each sample
+
+    Keyword arguments:
+    infile -- the file to be read, a filename or any file-like object or iterable of lines
+    input_format -- 'csv' or 'jsonl', see the module documentation
+
+    Profiles are dicts in the form {'marker': (allele, allele), ...}.
+
+    """
+    if isinstance(infile, basestring):
+        infile = open(infile, "rb")
+    if input_format == 'jsonl':
+        for line in infile:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                yield record['population'], dict([(marker, tuple(alleles))
+                    for marker, alleles in record['profile'].items()])
+        return
+    reader = csv.reader(infile)
+    header = reader.next()
+    for row in reader:
+        population = None
+        profile = {}
+        for column, cell in zip(header, row):
+            if column == 'population':
+                population = cell
+            elif column != 'id':
+                genotype = batch.parse_genotype(cell)
+                if genotype is not None:
+                    profile[column] = genotype
+        yield population, profile
+
+
+class AlleleCounts(object):
+    """
+    Allele counts for each marker in each population, from which allele frequency data are built.
+
+    Counts can be added to at any time, and counts made separately, eg from different files in
+    parallel, can be merged. The (population, marker) pairs whose counts have changed since the
+    frequencies were last written to a store are tracked, so update_store replaces only those records;
+    the records it leaves alone keep their version, and with it their cached pooled tables and RMPs.
+
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._samples = Counter()
+        self._keys = []
+        self._changed = set()
+
+    def _counter(self, key):
+        """Return the allele counter for a (population, marker) pair, creating it if necessary"""
+        counter = self._counts.get(key)
+        if counter is None:
+            counter = self._counts[key] = Counter()
+            self._keys.append(key)
+        return counter
+
+    def add_genotype(self, population, marker, genotype):
+        """
+        Count the two alleles of one sample's genotype at a marker
+        """
+        key = (population, marker)
+        self._counter(key).update(genotype)
+        self._samples[key] += 1
+        self._changed.add(key)
+
+    def add_profile(self, population, profile):
+        """
+        Count the alleles of one sample's profile, a dict in the form {'marker': (allele, allele), ...}
+        """
+        for marker in sorted(profile):
+            self.add_genotype(population, marker, profile[marker])
+
+    def add_profiles(self, profiles):
+        """
+        Count the alleles of an iterable of (population, profile) pairs, eg as yielded by iter_genotypes
+        """
+        for population, profile in profiles:
+            self.add_profile(population, profile)
+        return self
+
+    def merge(self, other):
+        """
+        Add the counts of another AlleleCounts to these counts
+        """
+        for key in other._keys:
+            self._counter(key).update(other._counts[key])
+            self._samples[key] += other._samples[key]
+            self._changed.add(key)
+        return self
+
+    def samples(self, population, marker):
+        """Return the number of samples typed at the marker in the population"""
+        return self._samples[(population, marker)]
+
+    def counts(self, population, marker):
+        """Return the allele counts at the marker in the population, a dict in the form {'value': count, ...}"""
+        return dict(self._counts.get((population, marker), {}))
+
+    def record(self, key):
+        """
+        Return the allele frequency record for a (population, marker) pair, in the form returned by
+        sgm.read_csv; the count is the number of samples, each contributing two alleles
+        """
+        population, marker = key
+        counter = self._counts[key]
+        total = float(2 * self._samples[key])
+        alleles = dict([(allele, n / total) for allele, n in counter.items()])
+        return {'name': population, 'marker': marker, 'count': self._samples[key], 'alleles': alleles}
+
+    def data(self):
+        """
+        Return the allele frequency data, in the form returned by sgm.read_csv, in the order the
+        population and marker pairs were first counted
+        """
+        return [self.record(key) for key in self._keys]
+
+    def update_store(self, store):
+        """
+        Write the frequencies that have changed since the last update to a frequencies.FrequencyStore
+
+        Returns the number of records written.
+
+        """
+        changed = [key for key in self._keys if key in self._changed]
+        for key in changed:
+            d = self.record(key)
+            store.add(d['name'], d['marker'], d['count'], d['alleles'])
+        self._changed.clear()
+        return len(changed)
+
+    def dump(self, outfile):
+        """
+        Save the counts as JSON to a stream, to be read back with AlleleCounts.load
+        """
+        json.dump([{'population': population, 'marker': marker, 'samples': self._samples[(population, marker)],
+            'counts': self._counts[(population, marker)]} for population, marker in self._keys], outfile)
+
+    @classmethod
+    def load(cls, infile):
+        """
+        Read counts saved with dump from a stream
+        """
+        ret = cls()
+        for d in json.load(infile):
+            key = (d['population'], d['marker'])
+            ret._counter(key).update(d['counts'])
+            ret._samples[key] += d['samples']
+            ret._changed.add(key)
+        return ret
+
+
+def _count_file(filename, input_format):
+    """
+    Count the genotypes in one file
+    """
+    return AlleleCounts().add_profiles(iter_genotypes(filename, input_format))
+
+
+def count_files(filenames, input_format='csv', jobs=1):
+    """
+    Count the genotypes in a list of files, each counted separately, and the counts merged
+
+    Keyword arguments:
+    filenames -- the files to be read
+    input_format -- 'csv' or 'jsonl', see the module documentation
+    jobs -- the number of worker processes, see parallel.imap_tasks
+
+    """
+    ret = AlleleCounts()
+    for part in parallel.imap_tasks(_count_file, filenames, input_format, jobs):
+        ret.merge(part)
+    return ret
+
+
+def main():
+    """
+    Add the genotypes in the given files to the saved counts, and write out the allele frequencies
+
+    """
+    parser = OptionParser(usage="usage: %prog [options] GENOTYPES ...")
+    parser.add_option("-c", "--counts", dest="counts", help="file of saved counts to add to and update")
+    parser.add_option("-o", "--output", dest="output", help="allele frequency .csv file to write, default stdout")
+    parser.add_option("-i", "--input-format", dest="input_format", default="csv", choices=["csv", "jsonl"],
+        help="format of the genotypes, csv or jsonl")
+    parser.add_option("-j", "--jobs", type="int", dest="jobs", default=1,
+        help="number of worker processes used to count the files, 0 for one per CPU")
+    (options, args) = parser.parse_args()
+
+    counts = AlleleCounts()
+    if options.counts:
+        try:
+            with open(options.counts) as infile:
+                counts = AlleleCounts.load(infile)
+        except IOError:
+            pass
+    counts.merge(count_files(args, options.input_format, options.jobs))
+    if options.counts:
+        with open(options.counts, 'w') as outfile:
+            counts.dump(outfile)
+    if options.output:
+        with open(options.output, 'wb') as outfile:
+            sgm.write_frequencies(outfile, counts.data())
+    else:
+        sgm.write_frequencies(sys.stdout, counts.data())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+"""
+columnar
+
+Machine readable export of random match probabilities, modal profile match probabilities and batch
+profile scores: streaming .csv, and a compact typed binary columnar format that is read back by
+memory mapping each column.
+
+A table is a list of (name, type) columns and an iterable of rows. A column type is a numpy dtype,
+eg 'f8' or 'i8', 'category' for strings with few distinct values, stored as int32 codes into a list
+of categories, or 'str' for other strings, stored as utf-8 bytes with int64 offsets. Missing values
+(None) are written as NaN in floating point columns, -1 in integer columns, and blank in .csv files.
+
+The binary format is the 8 byte magic string, the data of each column in turn, each block aligned to 8
+bytes, then a JSON footer describing the columns and their offsets, the footer's length as a little
+endian uint64 and the magic string again. All numbers are little endian. Rows are spooled to a
+temporary file for each column as they are written, so writing needs memory only for the buffered
+rows and the categories, and the file itself is written sequentially and may be a pipe.
+
+"""
+
+import csv
+import json
+import shutil
+import struct
+import tempfile
+
+import numpy
+
+
+MAGIC = 'STRCOL01'
+
+# the columns of random match probabilities, one row per marker and one with the 'combined' marker
+RMP_COLUMNS = [('name', 'category'), ('cutoff', 'f8'), ('theta', 'f8'), ('count', 'i8'), ('marker', 'category'),
+    ('rmp', 'f8')]
+
+# the columns of modal profile match probabilities, see sgm.calc_column
+PMP_COLUMNS = [('name', 'category'), ('theta', 'f8'), ('reciprocal', 'f8')]
+
+# the columns of batch profile scores, see batch.score_profiles; ids are written as strings
+SCORE_COLUMNS = [('id', 'str'), ('name', 'category'), ('theta', 'f8'), ('log10', 'f8')]
+
+
+def rmp_rows(name, cutoff, theta, result, markers=None):
+    """
+    Yield the rows, in the form of RMP_COLUMNS, of a result of strmarker.calc_rmps
+
+    Keyword arguments:
+    name -- the name of the sample set
+    cutoff -- the cutoff the result was calculated with
+    theta -- the theta the result was calculated with
+    result -- the result
+    markers -- the order of the markers, defaults to sorted; markers not in the result are left out
+
+    """
+    count = result.get('count')
+    if markers is None:
+        markers = sorted([key for key in result if key not in ('count', 'combined', 'reciprocal')])
+    for marker in markers:
+        if marker in result:
+            yield (name, cutoff, theta, count, marker, result[marker])
+    yield (name, cutoff, theta, count, 'combined', result['combined'])
+
+
+def pmp_rows(name, column):
+    """
+    Yield the rows, in the form of PMP_COLUMNS, of a column of modal profile match probabilities
+
+    Keyword arguments:
+    name -- the name of the sample set
+    column -- the reciprocal match probabilities keyed by theta, see sgm.calc_column
+
+    """
+    for theta in sorted(column, key=float):
+        yield (name, float(theta), column[theta])
+
+
+def _csv_cell(value):
+    """Format a value for a .csv file, floats exactly and None blank"""
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def write_csv(rows, out, columns, header=True):
+    """
+    Write rows to a .csv stream as they are iterated, returning the number of rows written
+
+    Keyword arguments:
+    rows -- an iterable of rows, each a sequence with a value for each column
+    out -- the stream to write to
+    columns -- the (name, type) columns
+    header -- write a header row of the column names
+
+    """
+    writer = csv.writer(out, lineterminator='\n')
+    if header:
+        writer.writerow([name for name, kind in columns])
+    n = 0
+    for row in rows:
+        writer.writerow([_csv_cell(value) for value in row])
+        n += 1
+    return n
+
+
+class _Column(object):
+    """
+    The spooled data of one column, see ColumnWriter
+    """
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.spool = tempfile.TemporaryFile()
+        if kind == 'category':
+            self.categories = {}
+        elif kind == 'str':
+            self.offsets = tempfile.TemporaryFile()
+            self.length = 0
+            # the offset of the start of the first string
+            numpy.zeros(1, '<i8').tofile(self.offsets)
+        else:
+            self.dtype = numpy.dtype(kind).newbyteorder('<')
+            self.missing = numpy.nan if self.dtype.kind == 'f' else -1
+
+    def extend(self, values):
+        """
+        Spool a list of values
+        """
+        if self.kind == 'category':
+            codes = [self.categories.setdefault(value, len(self.categories)) for value in values]
+            numpy.array(codes, '<i4').tofile(self.spool)
+        elif self.kind == 'str':
+            encoded = [(value if isinstance(value, unicode) else str(value)).encode('utf-8') if value is not None
+                else '' for value in values]
+            ends = self.length + numpy.cumsum([len(value) for value in encoded], dtype='<i8')
+            ends.astype('<i8').tofile(self.offsets)
+            self.spool.write(''.join(encoded))
+            if len(ends):
+                self.length = int(ends[-1])
+        else:
+            values = [self.missing if value is None else value for value in values]
+            numpy.array(values, self.dtype).tofile(self.spool)
+
+    def close(self):
+        """
+        Discard the spooled data
+        """
+        self.spool.close()
+        if self.kind == 'str':
+            self.offsets.close()
+
+
+class ColumnWriter(object):
+    """
+    Writes rows to a stream in the binary columnar format, see the module documentation.
+
+    Rows are buffered and spooled to a temporary file per column; the stream is written by close.
+
+    """
+
+    def __init__(self, out, columns, buffer_rows=65536):
+        """
+        Keyword arguments:
+        out -- the binary stream to write to
+        columns -- the (name, type) columns
+        buffer_rows -- the number of rows buffered before they are spooled
+
+        """
+        self.out = out
+        self.rows = 0
+        self.buffer_rows = buffer_rows
+        self._columns = [_Column(name, kind) for name, kind in columns]
+        self._buffer = []
+        self._closed = False
+
+    def write_rows(self, rows):
+        """
+        Write an iterable of rows, each a sequence with a value for each column
+        """
+        for row in rows:
+            self._buffer.append(row)
+            if len(self._buffer) >= self.buffer_rows:
+                self._spool()
+
+    def _spool(self):
+        """
+        Spool the buffered rows
+        """
+        if not self._buffer:
+            return
+        for column, values in zip(self._columns, zip(*self._buffer)):
+            column.extend(values)
+        self.rows += len(self._buffer)
+        self._buffer = []
+
+    def _copy(self, spool, position):
+        """
+        Copy a spooled block to the stream, aligned to 8 bytes, returning its offset and the new position
+        """
+        padding = -position % 8
+        self.out.write('\0' * padding)
+        position += padding
+        spool.seek(0)
+        shutil.copyfileobj(spool, self.out)
+        return position, position + spool.tell()
+
+    def close(self):
+        """
+        Write the columns and the footer to the stream, and discard the spooled data
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._spool()
+            self.out.write(MAGIC)
+            position = len(MAGIC)
+            footer = {'rows': self.rows, 'columns': []}
+            for column in self._columns:
+                description = {'name': column.name, 'type': column.kind}
+                if column.kind == 'str':
+                    description['offsets'], position = self._copy(column.offsets, position)
+                    description['data'], position = self._copy(column.spool, position)
+                    description['length'] = column.length
+                else:
+                    description['offset'], position = self._copy(column.spool, position)
+                    if column.kind == 'category':
+                        categories = sorted(column.categories, key=column.categories.get)
+                        description['categories'] = [value if isinstance(value, unicode) else str(value)
+                            for value in categories]
+                    else:
+                        description['dtype'] = column.dtype.str
+                footer['columns'].append(description)
+            text = json.dumps(footer, sort_keys=True)
+            self.out.write(text)
+            self.out.write(struct.pack('<Q', len(text)))
+            self.out.write(MAGIC)
+        finally:
+            for column in self._columns:
+                column.close()
+
+    def discard(self):
+        """
+        Discard the spooled data without writing anything to the stream
+        """
+        self._closed = True
+        for column in self._columns:
+            column.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif not self._closed:
+            self.discard()
+        return False
+
+
+def write_columnar(rows, out, columns):
+    """
+    Write rows to a binary stream in the columnar format, returning the number of rows written
+    """
+    with ColumnWriter(out, columns) as writer:
+        writer.write_rows(rows)
+    return writer.rows
+
+
+def write_table(rows, out, columns, output_format='csv'):
+    """
+    Write rows to a stream as .csv or in the columnar format, returning the number of rows written
+
+    Keyword arguments:
+    rows -- an iterable of rows, each a sequence with a value for each column
+    out -- the stream to write to, which must be binary for the columnar format
+    columns -- the (name, type) columns
+    output_format -- 'csv' or 'columnar'
+
+    """
+    if output_format == 'csv':
+        return write_csv(rows, out, columns)
+    return write_columnar(rows, out, columns)
+
+
+def _memmap(filename, dtype, offset, count):
+    """Map count items of dtype at the offset of a file, read only"""
+    if count == 0:
+        return numpy.zeros(0, dtype)
+    return numpy.memmap(filename, dtype, 'r', offset, (count,))
+
+
+class StringColumn(object):
+    """
+    A column of strings read from a columnar file, decoded as they are accessed.
+    """
+
+    def __init__(self, offsets, data):
+        """
+        Keyword arguments:
+        offsets -- the array of the offset of each string in data, and of the end of the last string
+        data -- the array of the utf-8 bytes of the strings
+
+        """
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('column index out of range')
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tostring().decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class CategoryColumn(object):
+    """
+    A column of strings with few distinct values read from a columnar file, as codes into its categories.
+    """
+
+    def __init__(self, codes, categories):
+        """
+        Keyword arguments:
+        codes -- the array of the index of each value in categories
+        categories -- the list of distinct values
+
+        """
+        self.codes = codes
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.categories[code] for code in self.codes[i].tolist()]
+        return self.categories[self.codes[i]]
+
+    def __iter__(self):
+        for code in self.codes:
+            yield self.categories[code]
+
+    def mask(self, value):
+        """
+        Return a boolean array, True for rows with the given value
+        """
+        try:
+            return self.codes == self.categories.index(value)
+        except ValueError:
+            return numpy.zeros(len(self.codes), dtype=bool)
+
+
+class ColumnReader(object):
+    """
+    Reads a file in the binary columnar format, mapping each column into memory as it is first used.
+
+    Numeric columns are read only numpy.memmap arrays, see the module documentation.
+
+    """
+
+    def __init__(self, filename):
+        """
+        Keyword arguments:
+        filename -- the name of the file
+
+        """
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('%s is not a columnar file' % filename)
+            f.seek(-(8 + len(MAGIC)), 2)
+            trailer = f.read(8 + len(MAGIC))
+            if trailer[8:] != MAGIC:
+                raise ValueError('%s is truncated' % filename)
+            length = struct.unpack('<Q', trailer[:8])[0]
+            f.seek(-(8 + len(MAGIC) + length), 2)
+            footer = json.loads(f.read(length))
+        self.rows = footer['rows']
+        self.columns = [(c['name'], c['type']) for c in footer['columns']]
+        self._descriptions = dict([(c['name'], c) for c in footer['columns']])
+        self._mapped = {}
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, name):
+        return name in self._descriptions
+
+    def __getitem__(self, name):
+        """
+        Return a column: a numpy array for numeric columns, a CategoryColumn or a StringColumn
+        """
+        column = self._mapped.get(name)
+        if column is None:
+            c = self._descriptions[name]
+            if c['type'] == 'str':
+                column = StringColumn(_memmap(self.filename, '<i8', c['offsets'], self.rows + 1),
+                    _memmap(self.filename, 'u1', c['data'], c['length']))
+            elif c['type'] == 'category':
+                column = CategoryColumn(_memmap(self.filename, '<i4', c['offset'], self.rows), c['categories'])
+            else:
+                column = _memmap(self.filename, c['dtype'], c['offset'], self.rows)
+            self._mapped[name] = column
+        return column
+
+    def iter_rows(self, block_size=65536):
+        """
+        Yield the rows as tuples, decoding a block of rows at a time
+        """
+        columns = [self[name] for name, kind in self.columns]
+        for start in range(0, self.rows, block_size):
+            stop = min(start + block_size, self.rows)
+            values = [column[start:stop] for column in columns]
+            values = [v.tolist() if isinstance(v, numpy.ndarray) else v for v in values]
+            for row in zip(*values):
+                yield row
@@ -0,0 +1,206 @@
+"""
+dbmatch
+
+Searching a database of profiles for pairs of profiles that match at many of their genetic markers.
+"""
+
+import itertools
+
+import numpy
+
+import parallel
+import strmarker
+
+
+def genotype_keys(genotypes, width=None):
+    """
+    Return an integer array of shape (profiles, markers) identifying each genotype in an integer
+    genotype array, independently of the order of its alleles; untyped genotypes are given -1
+
+    Keyword arguments:
+    genotypes -- an integer array of shape (profiles, markers, 2), see FrequencyStore.encode_profiles
+    width -- more than the largest allele code, so that keys made from several arrays are comparable;
+    defaults to one more than the largest code in genotypes
+
+    """
+    genotypes = numpy.asarray(genotypes)
+    if not genotypes.size:
+        return numpy.empty(genotypes.shape[:2] if genotypes.ndim == 3 else (0, 0), dtype=numpy.int64)
+    if width is None:
+        width = max(int(genotypes.max()) + 1, 1)
+    lo = numpy.minimum(genotypes[:, :, 0], genotypes[:, :, 1]).astype(numpy.int64)
+    hi = numpy.maximum(genotypes[:, :, 0], genotypes[:, :, 1]).astype(numpy.int64)
+    return numpy.where(lo >= 0, lo * width + hi, -1)
+
+
+def marker_groups(keys, min_matches):
+    """
+    Partition the genetic markers into groups such that any two profiles matching at min_matches
+    markers have identical genotypes at every marker of at least one group
+
+    With n markers there are n - min_matches + 1 groups. A pair mismatches, or is untyped, at no
+    more than n - min_matches markers, which can spoil at most that many groups, so at least one
+    group matches in full. Markers are shared out so the groups are about equally selective.
+
+    Keyword arguments:
+    keys -- the genotype keys of the profiles, as returned by genotype_keys
+    min_matches -- the minimum number of matching markers
+
+    Returns a list of lists of marker (column) indexes.
+
+    """
+    markers = keys.shape[1]
+    if not 1 <= min_matches <= markers:
+        raise ValueError('min_matches must be between 1 and the number of markers')
+    # the log of the probability that two random profiles share their genotype, for each marker
+    selectivity = numpy.zeros(markers)
+    for j in range(markers):
+        counts = numpy.unique(keys[keys[:, j] >= 0, j], return_counts=True)[1].astype(float)
+        if counts.sum() > 0:
+            selectivity[j] = numpy.log(max((counts * counts).sum() / (counts.sum() ** 2), 1e-300))
+    groups = [[] for _ in range(markers - min_matches + 1)]
+    totals = numpy.zeros(len(groups))
+    for j in numpy.argsort(selectivity, kind='mergesort').tolist():
+        g = int(numpy.argmax(totals))
+        groups[g].append(j)
+        totals[g] += selectivity[j]
+    return groups
+
+
+def hash_keys(keys):
+    """
+    Combine the genotype keys of each profile into one 64 bit value by a multiplicative hash, so
+    distinct genotypes may occasionally share a value
+
+    Keyword arguments:
+    keys -- the genotype keys of the profiles, as returned by genotype_keys
+
+    Returns an unsigned integer array of shape (profiles,).
+
+    """
+    multipliers = numpy.random.RandomState(0x5eed).randint(1, 2 ** 62, size=keys.shape[1]).astype(numpy.uint64)
+    multipliers |= numpy.uint64(1)
+    with numpy.errstate(over='ignore'):
+        return (keys.astype(numpy.uint64) * multipliers).sum(axis=1, dtype=numpy.uint64)
+
+
+def group_keys(keys, groups):
+    """
+    Return an array of shape (profiles, groups) identifying the genotypes at each group of markers,
+    or -1 where any marker of the group is untyped
+
+    The genotype keys of a group are combined by hash_keys, so distinct genotypes may occasionally
+    share a key; matches found through them must be checked marker by marker.
+
+    """
+    ret = numpy.empty((len(keys), len(groups)), dtype=numpy.int64)
+    for g, group in enumerate(groups):
+        hashed = hash_keys(keys[:, group]) >> numpy.uint64(1)
+        ret[:, g] = numpy.where((keys[:, group] >= 0).all(axis=1), hashed.astype(numpy.int64), -1)
+    return ret
+
+
+class GenotypeIndex(object):
+    """
+    An inverted index, for each group of genetic markers, from the genotypes at the group's markers to
+    the profiles that have them; see marker_groups.
+    """
+
+    def __init__(self, keys, min_matches):
+        """
+        Keyword arguments:
+        keys -- the genotype keys of the profiles, as returned by genotype_keys
+        min_matches -- the minimum number of matching markers that searches will look for
+
+        """
+        self.keys = keys
+        self.groups = marker_groups(keys, min_matches)
+        self.group_keys = group_keys(keys, self.groups)
+        self._order = numpy.argsort(self.group_keys, axis=0, kind='mergesort')
+        self._sorted = self.group_keys[self._order, numpy.arange(len(self.groups))]
+
+    def lookup(self, group, key):
+        """
+        Return the indexes of the profiles with the given key (see group_keys) for the group
+        """
+        column = self._sorted[:, group]
+        lo = numpy.searchsorted(column, key, 'left')
+        hi = numpy.searchsorted(column, key, 'right')
+        return self._order[lo:hi, group]
+
+
+def _match_block(genotypes, index, start, stop, min_matches, table, theta):
+    """
+    Return the matching pairs (i, j), i < j, for the profiles i in [start, stop), see find_matches
+    """
+    keys = index.keys
+    ret = []
+    for i in range(start, stop):
+        searched = numpy.flatnonzero(index.group_keys[i] >= 0)
+        if len(searched) == 0:
+            continue
+        candidates = numpy.concatenate([index.lookup(g, index.group_keys[i, g]) for g in searched])
+        candidates = numpy.unique(candidates[candidates > i])
+        if len(candidates) == 0:
+            continue
+        full = (keys[candidates] == keys[i]) & (keys[i] >= 0)
+        matches = full.sum(axis=1)
+        found = matches >= min_matches
+        if not found.any():
+            continue
+        candidates = candidates[found]
+        full = full[found]
+        matches = matches[found]
+        a = genotypes[i, :, 0]
+        b = genotypes[i, :, 1]
+        other = genotypes[candidates]
+        shared = ((other == a[:, numpy.newaxis]) | (other == b[:, numpy.newaxis])).any(axis=2) & (a >= 0)
+        partial = (shared & ~full).sum(axis=1)
+        if table is None:
+            weights = [None] * len(candidates)
+        else:
+            matched = numpy.where(full[:, :, numpy.newaxis], other, -1)
+            weights = strmarker.log_match_probabilities(matched, table, theta).tolist()
+        for j, m, p, w in zip(candidates.tolist(), matches.tolist(), partial.tolist(), weights):
+            ret.append((i, j, m, p, w))
+    return ret
+
+
+def _match_task(block, args):
+    """
+    Search one block of profiles
+    """
+    genotypes, index, min_matches, table, theta = args
+    return _match_block(genotypes, index, block[0], block[1], min_matches, table, theta)
+
+
+def find_matches(genotypes, min_matches, table=None, theta=0.0, block_size=1024, jobs=1):
+    """
+    Find every pair of profiles in a database that match at min_matches or more genetic markers
+
+    Genotypes are indexed by groups of markers, see marker_groups. Each profile is compared only
+    with the profiles that share its genotypes at every marker of some group, since any pair
+    matching at min_matches markers must do so for at least one group. Profiles are searched in
+    blocks, in a pool of worker processes if jobs is not 1, and the pairs are yielded as each block
+    completes, in order of the first profile.
+
+    Keyword arguments:
+    genotypes -- an integer array of shape (profiles, markers, 2), see FrequencyStore.encode_profiles
+    min_matches -- the minimum number of markers at which the genotypes must match
+    table -- optionally, an array of allele frequencies of shape (markers, codes), as returned by
+    FrequencyStore.frequency_table, used to weigh each pair
+    theta -- the population subdivision coefficient used to weigh each pair
+    block_size -- the number of profiles searched in each task
+    jobs -- the number of worker processes, see parallel.imap_tasks
+
+    Yields tuples (i, j, matches, partial, weight) with i < j the indexes of the profiles, matches the
+    number of markers at which their genotypes match, partial the number of other markers at which
+    they share an allele, and weight the log10 probability that a random individual matches at the
+    matching markers (see strmarker.calc_profile_log_match_probabilities), or None without a table.
+
+    """
+    genotypes = numpy.asarray(genotypes)
+    index = GenotypeIndex(genotype_keys(genotypes), min_matches)
+    blocks = [(start, min(start + block_size, len(genotypes))) for start in range(0, len(genotypes), block_size)]
+    results = parallel.imap_tasks(_match_task, blocks, (genotypes, index, min_matches, table, theta), jobs)
+    return itertools.chain.from_iterable(results)
@@ -0,0 +1,141 @@
+"""
+distribution
+
+The exact distribution of profile match probabilities over all possible genotypes, found by
+convolving binned per-marker distributions in the log domain.
+"""
+
+import numpy
+
+import strmarker
+
+
+# convolutions larger than this (in multiply-adds) are done with an FFT
+FFT_THRESHOLD = 1 << 16
+
+
+def genotype_distribution(alleles, theta):
+    """
+    Return the log10 match probability and the frequency of every genotype at a genetic marker
+
+    Both use the Balding and Nichols formulae: the match probabilities are those of
+    strmarker.calc_profile_match_probability, and the genotype frequencies are p^2 + theta * p * (1 - p)
+    for homozygotes and 2 * p * q * (1 - theta) for heterozygotes. Genotypes with a frequency of zero
+    are left out.
+
+    Keyword arguments:
+    alleles -- a dict of allele frequencies in the form {'value': frequency, ...}
+    theta -- the population subdivision coefficient, used to correct for subdivided populations
+
+    Returns a pair of arrays, (log10 match probabilities, genotype frequencies).
+
+    """
+    p = numpy.array(alleles.values(), dtype=float)
+    i, j = numpy.triu_indices(len(p))
+    pi = p[i]
+    pj = p[j]
+    hom = i == j
+    denom = (1 + theta) * (1 + 2 * theta)
+    mp = numpy.where(hom, (2 * theta + (1 - theta) * pi) * (3 * theta + (1 - theta) * pi),
+        2 * (theta + (1 - theta) * pi) * (theta + (1 - theta) * pj)) / denom
+    freq = numpy.where(hom, pi * pi + theta * pi * (1 - pi), 2 * pi * pj * (1 - theta))
+    keep = freq > 0
+    return numpy.log10(mp[keep]), freq[keep]
+
+
+def _convolve(a, b):
+    """
+    Convolve two arrays of probability masses, with an FFT when they are large
+    """
+    if len(a) * len(b) <= FFT_THRESHOLD:
+        return numpy.convolve(a, b)
+    n = len(a) + len(b) - 1
+    size = 1 << (n - 1).bit_length()
+    ret = numpy.fft.irfft(numpy.fft.rfft(a, size) * numpy.fft.rfft(b, size), size)[:n]
+    # rounding in the FFT can leave tiny negative masses
+    return numpy.maximum(ret, 0.0)
+
+
+class ProfileDistribution(object):
+    """
+    The distribution of log10 profile match probability, over random profiles weighted by their
+    frequency, as probability masses on a grid of bin_width spaced values.
+
+    Each marker's match probabilities are rounded to the grid before the markers are combined, so any
+    profile's log10 match probability is placed within error_bound (markers * bin_width / 2) of its
+    exact value.
+
+    """
+
+    def __init__(self, offset, masses, bin_width, markers):
+        """
+        Keyword arguments:
+        offset -- the grid index of the first mass, so that its value is offset * bin_width
+        masses -- the probability masses, in increasing order of value
+        bin_width -- the spacing of the grid of log10 values
+        markers -- the number of markers combined
+
+        """
+        self.offset = offset
+        self.masses = masses
+        self.bin_width = bin_width
+        self.error_bound = markers * bin_width / 2.0
+
+    @property
+    def values(self):
+        """The log10 match probabilities of the grid points"""
+        return (self.offset + numpy.arange(len(self.masses))) * self.bin_width
+
+    def cdf(self, value):
+        """
+        Return the probability that a random profile has log10 match probability at most value
+        """
+        return float(self.masses[self.values <= value + self.bin_width / 2.0].sum())
+
+    def quantile(self, q):
+        """
+        Return the smallest log10 match probability v such that a random profile has a log10 match
+        probability of at most v with probability q, eg quantile(0.99) for the profile that only 1%
+        of profiles are more common than
+        """
+        cumulative = numpy.cumsum(self.masses)
+        index = numpy.searchsorted(cumulative, q * cumulative[-1])
+        return float(self.values[min(index, len(cumulative) - 1)])
+
+    def mean(self):
+        """Return the mean log10 match probability"""
+        return float(numpy.dot(self.masses, self.values) / self.masses.sum())
+
+
+def profile_distribution(data, name, markers, theta=0.0, bin_width=0.001, cutoff=0):
+    """
+    Calculate the distribution of profile match probability over all genotypes at the given markers
+
+    The genotype distributions of the markers (see genotype_distribution) are binned on a grid of
+    log10 values and combined by convolution, since the log match probability of a profile is the
+    sum of those of its markers. Each marker's genotype frequencies are normalized to sum to 1.0.
+
+    Keyword arguments:
+    data -- the allele frequency data
+    name -- the name of the sample set to be used
+    markers -- the genetic markers to be combined
+    theta -- the population subdivision coefficient, used to correct for subdivided populations
+    bin_width -- the spacing, in log10 units, of the grid the match probabilities are rounded to
+    cutoff -- the minimum size of a frequency bin, items with a frequency lower than this will be pooled
+
+    Returns a ProfileDistribution.
+
+    """
+    offset = 0
+    masses = numpy.ones(1)
+    records = strmarker.select_markers(data, name, markers)
+    for d in records:
+        alleles = d['alleles']
+        if cutoff:
+            alleles = strmarker.pooled_alleles(data, d, cutoff)
+        values, freq = genotype_distribution(alleles, theta)
+        index = numpy.rint(values / bin_width).astype(int)
+        low = index.min()
+        offset += low
+        masses = _convolve(masses, numpy.bincount(index - low, weights=freq / freq.sum()))
+    return ProfileDistribution(offset, masses, bin_width, len(records))
@@ -0,0 +1,231 @@
+"""
+equilibrium
+
+Tests of Hardy-Weinberg equilibrium at each genetic marker, and of linkage equilibrium between pairs
+of markers, on integer genotype arrays (see FrequencyStore.encode_profiles).
+
+Both tests are permutation tests: alleles or genotypes are shuffled among the samples in batches of
+permutations evaluated together as arrays. Each marker, or pair of markers, is tested with its own
+random stream, seeded from the seed and its index, see parallel.imap_tasks.
+
+"""
+
+import numpy
+
+import parallel
+
+
+def _log_factorials(n):
+    """Return an array of log(k!) for k = 0 ... n"""
+    return numpy.concatenate([[0.0], numpy.cumsum(numpy.log(numpy.arange(1, n + 1)))])
+
+
+def _shuffled(rng, values, size):
+    """
+    Return an array of shape (size, len(values)), each row a random permutation of values, drawn
+    together by sorting a batch of uniform keys
+    """
+    order = numpy.argsort(rng.random_sample((size, len(values))), axis=1)
+    return numpy.asarray(values)[order]
+
+
+def _hwe_statistic(a, b, alleles, log_factorials):
+    """
+    Return the log probability, less a constant fixed by the allele counts, of the genotype counts of
+    each row of allele pairs under Hardy-Weinberg equilibrium: H * log(2) - sum(log(n_ij!)), for H
+    heterozygotes and n_ij samples of genotype ij
+    """
+    rows = len(a)
+    lo = numpy.minimum(a, b)
+    hi = numpy.maximum(a, b)
+    keys = (lo * alleles + hi) + (numpy.arange(rows) * alleles * alleles)[:, numpy.newaxis]
+    counts = numpy.bincount(keys.ravel(), minlength=rows * alleles * alleles).reshape(rows, -1)
+    return (a != b).sum(axis=1) * numpy.log(2.0) - log_factorials[counts].sum(axis=1)
+
+
+def _hwe_exact_biallelic(n, minor):
+    """
+    Return the log probabilities of each possible number of heterozygotes, under Hardy-Weinberg
+    equilibrium, for n samples with minor copies of the less common of two alleles
+    """
+    log_factorials = _log_factorials(2 * n)
+    hets = numpy.arange(minor % 2, minor + 1, 2)
+    rare = (minor - hets) // 2
+    common = n - hets - rare
+    return hets, (log_factorials[n] - log_factorials[rare] - log_factorials[common] - log_factorials[hets]
+        + hets * numpy.log(2.0) + log_factorials[minor] + log_factorials[2 * n - minor]
+        - log_factorials[2 * n])
+
+
+def hwe_test(genotypes, permutations=1000, seed=0, batch_size=100):
+    """
+    Test a genetic marker for Hardy-Weinberg equilibrium
+
+    The p-value is the probability, given the allele counts, of genotype counts no more probable than
+    those observed. For a marker with two alleles it is found exactly, by summing over the possible
+    numbers of heterozygotes. Otherwise it is estimated by shuffling the alleles among the samples:
+    each permutation pairs the 2n alleles into n genotypes, and the estimate is (k + 1) / (B + 1) for
+    k of B permutations no more probable than the observed genotypes.
+
+    Keyword arguments:
+    genotypes -- an integer array of shape (samples, 2) of allele codes; samples with a negative
+    code are untyped and left out
+    permutations -- the number of permutations for markers with more than two alleles
+    seed -- the random seed, or a numpy RandomState
+    batch_size -- the number of permutations evaluated together
+
+    Returns a dict with 'p_value', 'exact' (True if found exactly), 'samples', 'alleles' and the
+    'observed_heterozygosity' and 'expected_heterozygosity'.
+
+    """
+    genotypes = numpy.asarray(genotypes)
+    genotypes = genotypes[(genotypes >= 0).all(axis=1)]
+    n = len(genotypes)
+    codes, alleles = numpy.unique(genotypes, return_inverse=True)
+    k = len(codes)
+    alleles = alleles.reshape(n, 2)
+    frequencies = numpy.bincount(alleles.ravel(), minlength=k) / float(max(2 * n, 1))
+    ret = {'samples': n, 'alleles': k,
+        'observed_heterozygosity': float((alleles[:, 0] != alleles[:, 1]).mean()) if n else 0.0,
+        'expected_heterozygosity': float(1.0 - (frequencies * frequencies).sum()) if n else 0.0}
+    if k < 2:
+        ret.update({'p_value': 1.0, 'exact': True})
+        return ret
+    log_factorials = _log_factorials(2 * n)
+    observed = _hwe_statistic(alleles[numpy.newaxis, :, 0], alleles[numpy.newaxis, :, 1], k, log_factorials)[0]
+    tolerance = 1e-9 * max(1.0, abs(observed))
+    if k == 2:
+        hets, logs = _hwe_exact_biallelic(n, int(min(numpy.bincount(alleles.ravel()))))
+        observed_logs = logs[hets == (alleles[:, 0] != alleles[:, 1]).sum()][0]
+        p = numpy.exp(logs[logs <= observed_logs + tolerance]).sum()
+        ret.update({'p_value': float(min(p, 1.0)), 'exact': True})
+        return ret
+
+    rng = seed if isinstance(seed, numpy.random.RandomState) else numpy.random.RandomState(seed)
+    flat = alleles.ravel()
+    extreme = 0
+    for start in range(0, permutations, batch_size):
+        shuffled = _shuffled(rng, flat, min(batch_size, permutations - start))
+        statistic = _hwe_statistic(shuffled[:, 0::2], shuffled[:, 1::2], k, log_factorials)
+        extreme += int((statistic <= observed + tolerance).sum())
+    ret.update({'p_value': (extreme + 1.0) / (permutations + 1.0), 'exact': False})
+    return ret
+
+
+def _genotype_indexes(genotypes):
+    """
+    Return the index of each sample's genotype among the distinct genotypes, independently of allele
+    order, and the number of distinct genotypes
+    """
+    lo = numpy.minimum(genotypes[:, 0], genotypes[:, 1]).astype(numpy.int64)
+    hi = numpy.maximum(genotypes[:, 0], genotypes[:, 1]).astype(numpy.int64)
+    distinct, indexes = numpy.unique(lo * (int(hi.max()) + 1) + hi, return_inverse=True)
+    return indexes, len(distinct)
+
+
+def _ld_statistic(rows, columns, r, c, logs):
+    """
+    Return sum(n log n) over the cells of the r by c contingency table of rows against each row of
+    columns, found as the sum over the samples of the log of the count of their cell
+    """
+    size = len(columns)
+    keys = rows * c + columns + (numpy.arange(size) * r * c)[:, numpy.newaxis]
+    counts = numpy.bincount(keys.ravel(), minlength=size * r * c)
+    return logs[counts[keys]].sum(axis=1)
+
+
+def ld_test(first, second, permutations=1000, seed=0, batch_size=100):
+    """
+    Test a pair of genetic markers for linkage equilibrium, that is for independence of their genotypes
+
+    The statistic is the likelihood ratio (G) statistic of the two-marker genotype contingency table.
+    The genotypes at the second marker are shuffled among the samples, which keeps both margins of
+    the table, so only sum(n log n) over its cells varies. The p-value is estimated as (k + 1) / (B + 1)
+    for k of B permutations with a statistic at least that observed.
+
+    Keyword arguments:
+    first -- an integer array of shape (samples, 2) of allele codes at the first marker
+    second -- the same at the second marker; samples untyped at either marker are left out
+    permutations -- the number of permutations
+    seed -- the random seed, or a numpy RandomState
+    batch_size -- the most permutations evaluated together
+
+    Returns a dict with 'p_value', 'samples' and 'statistic', the G statistic.
+
+    """
+    first = numpy.asarray(first)
+    second = numpy.asarray(second)
+    typed = (first >= 0).all(axis=1) & (second >= 0).all(axis=1)
+    n = int(typed.sum())
+    if n == 0:
+        return {'p_value': 1.0, 'samples': 0, 'statistic': 0.0}
+    rows, r = _genotype_indexes(first[typed])
+    columns, c = _genotype_indexes(second[typed])
+    # log(k), indexed by k; the count of a sample's cell is never zero
+    logs = numpy.log(numpy.maximum(numpy.arange(n + 1), 1))
+    observed = _ld_statistic(rows, columns[numpy.newaxis], r, c, logs)[0]
+    margins = logs[numpy.bincount(rows)[rows]].sum() + logs[numpy.bincount(columns)[columns]].sum()
+    tolerance = 1e-9 * max(1.0, abs(observed))
+    rng = seed if isinstance(seed, numpy.random.RandomState) else numpy.random.RandomState(seed)
+    # bound the size of the batched contingency tables
+    batch_size = max(1, min(batch_size, (1 << 22) // (r * c)))
+    extreme = 0
+    for start in range(0, permutations, batch_size):
+        shuffled = _shuffled(rng, columns, min(batch_size, permutations - start))
+        extreme += int((_ld_statistic(rows, shuffled, r, c, logs) >= observed - tolerance).sum())
+    return {'p_value': (extreme + 1.0) / (permutations + 1.0), 'samples': n,
+        'statistic': float(2 * (observed - margins + n * logs[n]))}
+
+
+def _test_task(task, args):
+    """
+    Run one test, ('hwe', index, marker) or ('ld', index, marker, marker)
+    """
+    genotypes, permutations, seed = args
+    rng = numpy.random.RandomState([seed, task[1]])
+    if task[0] == 'hwe':
+        return hwe_test(genotypes[:, task[2]], permutations, rng)
+    return ld_test(genotypes[:, task[2]], genotypes[:, task[3]], permutations, rng)
+
+
+def _run_tests(genotypes, tasks, permutations, seed, jobs):
+    """
+    Run a list of tests, in a pool of worker processes if jobs is not 1
+    """
+    return parallel.map_tasks(_test_task, tasks, (numpy.asarray(genotypes), permutations, seed), jobs)
+
+
+def hwe_tests(genotypes, permutations=1000, seed=0, jobs=1):
+    """
+    Test every genetic marker for Hardy-Weinberg equilibrium, see hwe_test
+
+    Keyword arguments:
+    genotypes -- an integer array of shape (samples, markers, 2), see FrequencyStore.encode_profiles
+    permutations -- the number of permutations for markers with more than two alleles
+    seed -- the random seed
+    jobs -- the number of worker processes, see parallel.imap_tasks
+
+    Returns a list of results, one per marker.
+
+    """
+    tasks = [('hwe', j, j) for j in range(numpy.shape(genotypes)[1])]
+    return _run_tests(genotypes, tasks, permutations, seed, jobs)
+
+
+def ld_tests(genotypes, permutations=1000, seed=0, jobs=1):
+    """
+    Test every pair of genetic markers for linkage equilibrium, see ld_test
+
+    Keyword arguments:
+    genotypes -- an integer array of shape (samples, markers, 2), see FrequencyStore.encode_profiles
+    permutations -- the number of permutations for each pair
+    seed -- the random seed
+    jobs -- the number of worker processes, see parallel.imap_tasks
+
+    Returns a dict of results keyed by the pairs (i, j), i < j, of marker indexes.
+
+    """
+    markers = numpy.shape(genotypes)[1]
+    pairs = [(i, j) for i in range(markers) for j in range(i + 1, markers)]
+    tasks = [('ld', index, i, j) for index, (i, j) in enumerate(pairs)]
+    return dict(zip(pairs, _run_tests(genotypes, tasks, permutations, seed, jobs)))
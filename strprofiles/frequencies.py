@@ -0,0 +1,268 @@
+"""
+frequencies
+
+Indexed storage for STR allele frequency data.
+"""
+
+import itertools
+
+import numpy
+
+
+_STORE_TOKENS = itertools.count()
+
+
+class MarkerFrequencies(object):
+    """
+    The allele frequencies at one genetic marker for one sample set.
+
+    The allele values and their frequencies are held as parallel arrays. For compatibility with the
+    list of dicts returned by sgm.read_csv, the fields can also be read as a read-only dict, eg
+    record['alleles'], record.get('count') or 'count' in record; the count is only present if known.
+
+    """
+    __slots__ = ('name', 'marker', 'count', 'labels', 'frequencies', 'version')
+
+    def __init__(self, name, marker, count, labels, frequencies, version=0):
+        self.name = name
+        self.marker = marker
+        self.count = count
+        self.labels = tuple(labels)
+        self.frequencies = numpy.asarray(frequencies, dtype=float)
+        self.version = version
+
+    def keys(self):
+        """Return the keys of the fields, as for the dicts returned by sgm.read_csv"""
+        if self.count is None:
+            return ['name', 'marker', 'alleles']
+        return ['name', 'marker', 'count', 'alleles']
+
+    def get(self, key, default=None):
+        """Return the value of a field, or default if the record does not have it"""
+        if key in self:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        if key in self:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in ('name', 'marker', 'alleles') or (key == 'count' and self.count is not None)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __repr__(self):
+        return 'MarkerFrequencies(%r, %r, %r, %d alleles)' % (self.name, self.marker, self.count, len(self))
+
+    @property
+    def alleles(self):
+        """The allele frequencies as a dict in the form {'value': frequency, ...}"""
+        return dict(zip(self.labels, self.frequencies.tolist()))
+
+
+class FrequencyStore(object):
+    """
+    Allele frequency data indexed by sample set name and genetic marker.
+
+    Iterating over the store yields its MarkerFrequencies records in the order they were added, so a
+    store can be used anywhere the list of dicts returned by sgm.read_csv is iterated over and read,
+    eg by sgm.write_frequencies; it cannot be indexed by position or modified as a list.
+
+    Each store has a unique token, and its version is incremented whenever a record is added or
+    replaced; records carry the version at which they were added. Together these identify the data
+    that a cached result was calculated from.
+
+    """
+
+    def __init__(self, data=None):
+        """
+        Keyword arguments:
+        data -- optional allele frequency data to add, in the form returned by sgm.read_csv
+
+        """
+        self._records = {}
+        self._keys = []
+        self._names = []
+        self._markers = []
+        self._codes = {}
+        self._labels = {}
+        self._indexes = {}
+        self.token = _STORE_TOKENS.next()
+        self.version = 0
+        if data is not None:
+            self.extend(data)
+
+    def add(self, name, marker, count, alleles):
+        """
+        Add, or replace, the allele frequencies for a marker in a sample set
+
+        Keyword arguments:
+        name -- the name of the sample set
+        marker -- the name of the genetic marker
+        count -- the size of the sample from which the frequencies were derived, or None if unknown
+        alleles -- a dict of allele frequencies in the form {'value': frequency, ...}
+
+        """
+        key = (name, marker)
+        if key not in self._records:
+            self._keys.append(key)
+            if name not in self._names:
+                self._names.append(name)
+            if marker not in self._markers:
+                self._markers.append(marker)
+        labels = alleles.keys()
+        for label in labels:
+            self._code(marker, label)
+        self.version += 1
+        record = MarkerFrequencies(name, marker, count, labels, [alleles[i] for i in labels], self.version)
+        self._records[key] = record
+        return record
+
+    def extend(self, data):
+        """
+        Add allele frequency data in the form returned by sgm.read_csv
+        """
+        for d in data:
+            try:
+                count = d['count']
+            except KeyError:
+                count = None
+            self.add(d['name'], d['marker'], count, d['alleles'])
+
+    def get(self, name, marker, default=None):
+        """
+        Return the frequencies for the marker in the named sample set, or default if there are none
+        """
+        return self._records.get((name, marker), default)
+
+    def select(self, name, markers):
+        """
+        Return the records for the named sample set at each of the given markers that it has,
+        in the order of markers
+        """
+        ret = []
+        for marker in markers:
+            record = self._records.get((name, marker))
+            if record is not None:
+                ret.append(record)
+        return ret
+
+    def _code(self, marker, label):
+        """
+        Return the integer code for an allele value at a marker, assigning the next code if it is new
+        """
+        codes = self._codes.setdefault(marker, {})
+        code = codes.get(label)
+        if code is None:
+            labels = self._labels.setdefault(marker, [])
+            code = len(labels)
+            codes[label] = code
+            labels.append(label)
+        return code
+
+    def allele_labels(self, marker):
+        """
+        Return the allele values seen at a marker, in any sample set, indexed by their integer codes
+        """
+        return list(self._labels.get(marker, []))
+
+    def encode_profiles(self, profiles, markers, grow=True):
+        """
+        Encode profiles as an integer genotype array of shape (profiles, markers, 2)
+
+        Allele values are replaced by their integer codes for the marker, so that profiles encoded once
+        can be scored against every sample set. Allele values not yet seen at a marker are given new
+        codes (with frequency zero in every sample set), or with grow False are all given the code
+        after the last code at the marker, a slot with frequency zero in every frequency_table, and
+        the store is left unchanged. Markers missing from a profile are encoded -1.
+
+        Keyword arguments:
+        profiles -- a list of profiles, each a dict in the form {'marker': (allele, allele), ...}; each
+        allele may be either a value or a (value, frequency) pair, as returned by
+        strmarker.get_modal_profile
+        markers -- the genetic markers to be encoded, giving the order of the second axis
+        grow -- whether to give new codes to new allele values; encodings made with grow False are
+        only valid until new allele values are added to the store, eg for queries that should not
+        add to a long lived store
+
+        """
+        genotypes = numpy.empty((len(profiles), len(markers), 2), dtype=numpy.int32)
+        genotypes.fill(-1)
+        for i, profile in enumerate(profiles):
+            for j, marker in enumerate(markers):
+                pair = profile.get(marker)
+                if pair is None:
+                    continue
+                for k in (0, 1):
+                    allele = pair[k]
+                    if isinstance(allele, tuple):
+                        allele = allele[0]
+                    if grow:
+                        genotypes[i, j, k] = self._code(marker, allele)
+                    else:
+                        codes = self._codes.get(marker, {})
+                        genotypes[i, j, k] = codes.get(allele, len(codes))
+        return genotypes
+
+    def frequency_table(self, name, markers, minimum_frequency=0.0):
+        """
+        Return the named sample set's allele frequencies as an array of shape (markers, codes)
+
+        Row j holds the frequencies at markers[j], indexed by allele code; alleles that the sample set
+        does not have are given minimum_frequency. There is always a column beyond the last code at each
+        marker, for the allele values not in the store, see encode_profiles.
+
+        Keyword arguments:
+        name -- the name of the sample set
+        markers -- the genetic markers, giving the order of the rows
+        minimum_frequency -- the lowest frequency used for any allele
+
+        """
+        width = max([len(self._labels.get(marker, [])) for marker in markers] + [0]) + 1
+        table = numpy.zeros((len(markers), width))
+        for j, marker in enumerate(markers):
+            record = self._records.get((name, marker))
+            if record is not None:
+                codes = self._codes[marker]
+                table[j, [codes[label] for label in record.labels]] = record.frequencies
+        return numpy.maximum(table, minimum_frequency)
+
+    def marker_indexes(self, markers):
+        """
+        Return an integer array of the index of each of the given markers in markers(), -1 for markers
+        the store does not have
+
+        The arrays are cached until markers are added to the store, see kits.Kit.
+
+        """
+        key = tuple(markers)
+        cached = self._indexes.get(key)
+        if cached is None or cached[0] != len(self._markers):
+            positions = dict([(marker, i) for i, marker in enumerate(self._markers)])
+            indexes = numpy.array([positions.get(marker, -1) for marker in key], dtype=int)
+            cached = self._indexes[key] = (len(self._markers), indexes)
+        return cached[1]
+
+    def names(self):
+        """Return the sample set names, in the order they were added"""
+        return list(self._names)
+
+    def markers(self):
+        """Return the genetic marker names, in the order they were added"""
+        return list(self._markers)
+
+    def __getitem__(self, key):
+        return self._records[key]
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def __iter__(self):
+        for key in self._keys:
+            yield self._records[key]
+
+    def __len__(self):
+        return len(self._keys)
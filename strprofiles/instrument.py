@@ -0,0 +1,288 @@
+"""
+instrument
+
+Opt-in instrumentation of the strmarker and sgm hot paths: per-function call counts, cumulative and
+percentile timings, cache hit rates and peak memory.
+
+Functions are marked with the hot_path decorator, and caches with register_cache. Nothing is
+recorded unless a Profile is active, see profiling:
+
+    with instrument.profiling() as profile:
+        sgm.tabulate_rmps(data, samples, "text", "RMPs", 5, 0.01)
+    print profile.report()
+    profile.dump_json("profile.json")
+    profile.dump_stats("profile.pstats")  # python -m pstats profile.pstats
+
+When no Profile is active a hot path costs one extra function call and a test of a module global.
+Only calls made in the profiling process are recorded, not those made in pool worker processes.
+
+"""
+
+import contextlib
+import functools
+import json
+import marshal
+import os
+import resource
+import sys
+import threading
+import time
+from collections import deque
+
+import numpy
+
+
+# the caches whose hits and misses are reported, keyed by name, see register_cache
+CACHES = {}
+
+# the active Profile, or None
+_active = None
+
+
+def register_cache(name, cache):
+    """
+    Register a cache, with hits and misses attributes, to have its hit rate reported, and return it
+
+    Keyword arguments:
+    name -- the name the cache is reported under
+    cache -- the cache, eg a memo.LRUCache
+
+    """
+    CACHES[name] = cache
+    return cache
+
+
+def _function_key(func):
+    """
+    Return the (filename, line number, label) of a function, the key of its statistics
+    """
+    code = func.__code__
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return (code.co_filename, code.co_firstlineno, '%s.%s' % (module, func.__name__))
+
+
+def hot_path(func):
+    """
+    Decorate a function so its calls are recorded by the active Profile
+    """
+    key = _function_key(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = _active
+        if profile is None:
+            return func(*args, **kwargs)
+        return profile.call(key, func, args, kwargs)
+    return wrapper
+
+
+def _peak_memory():
+    """Return the peak resident memory of this process, in kilobytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on OS X, kilobytes elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class _Frame(object):
+    """
+    A hot path call in progress, see Profile.call
+    """
+    __slots__ = ('key', 'start', 'children')
+
+    def __init__(self, key, start):
+        self.key = key
+        self.start = start
+        self.children = 0.0
+
+
+class Profile(object):
+    """
+    The statistics of the hot path calls made while it is active.
+
+    For each function it records the number of calls, the total and longest call durations, the
+    durations of the most recent calls, from which the percentiles are estimated, and the time spent
+    in the function itself, excluding the hot paths it calls, broken down by the calling hot path.
+
+    """
+
+    def __init__(self, window=4096):
+        """
+        Keyword arguments:
+        window -- the number of most recent call durations kept for the percentiles of each function
+
+        """
+        self.window = window
+        self.durations = {}
+        self.elapsed = {}
+        self.longest = {}
+        self.calls = {}
+        self.primitive = {}
+        self.own = {}
+        self.total = {}
+        self.callers = {}
+        self.caches = {}
+        self.wall_time = 0.0
+        self.start_memory = self.peak_memory = _peak_memory()
+        self._cache_counts = {}
+        self._started = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Make this the active profile, and note the starting cache counts, time and memory
+        """
+        global _active
+        self._cache_counts = dict([(name, (cache.hits, cache.misses)) for name, cache in CACHES.items()])
+        self.start_memory = _peak_memory()
+        self._started = time.time()
+        _active = self
+
+    def stop(self):
+        """
+        Stop recording, and note the cache hits and misses, time and peak memory since start
+        """
+        global _active
+        if _active is self:
+            _active = None
+        self.wall_time += time.time() - self._started
+        self.peak_memory = _peak_memory()
+        for name, cache in CACHES.items():
+            hits, misses = self._cache_counts.get(name, (0, 0))
+            previous = self.caches.get(name, {'hits': 0, 'misses': 0})
+            hits = previous['hits'] + cache.hits - hits
+            misses = previous['misses'] + cache.misses - misses
+            self.caches[name] = {'hits': hits, 'misses': misses,
+                'hit_rate': float(hits) / (hits + misses) if hits + misses else None}
+
+    def call(self, key, func, args, kwargs):
+        """
+        Call a hot path function, recording its duration
+        """
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        frame = _Frame(key, time.time())
+        stack.append(frame)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.time() - frame.start
+            stack.pop()
+            caller = stack[-1].key if stack else None
+            if stack:
+                stack[-1].children += elapsed
+            recursive = any([f.key == key for f in stack])
+            self._record(key, caller, elapsed, elapsed - frame.children, recursive)
+
+    def _record(self, key, caller, elapsed, own, recursive):
+        """
+        Add one call to the statistics
+        """
+        with self._lock:
+            durations = self.durations.get(key)
+            if durations is None:
+                durations = self.durations[key] = deque(maxlen=self.window)
+            durations.append(elapsed)
+            self.elapsed[key] = self.elapsed.get(key, 0.0) + elapsed
+            self.longest[key] = max(self.longest.get(key, 0.0), elapsed)
+            self.calls[key] = self.calls.get(key, 0) + 1
+            self.own[key] = self.own.get(key, 0.0) + own
+            if not recursive:
+                # time in recursive calls is already counted in the outermost call
+                self.primitive[key] = self.primitive.get(key, 0) + 1
+                self.total[key] = self.total.get(key, 0.0) + elapsed
+            callers = self.callers.setdefault(key, {})
+            calls, primitive, own_time, total = callers.get(caller, (0, 0, 0.0, 0.0))
+            callers[caller] = (calls + 1, primitive + (not recursive), own_time + own,
+                total + (0.0 if recursive else elapsed))
+
+    def functions(self):
+        """
+        Return a dict, keyed by function label, of the 'calls', the 'total' time including the hot paths
+        called, the 'own' time excluding them, the 'mean' and 'max' call durations, and the 'p50', 'p90'
+        and 'p99' call durations of the most recent calls
+        """
+        ret = {}
+        for key, durations in self.durations.items():
+            p50, p90, p99 = numpy.percentile(numpy.array(durations), [50, 90, 99]).tolist()
+            ret[key[2]] = {'calls': self.calls[key], 'total': self.total.get(key, 0.0), 'own': self.own[key],
+                'mean': self.elapsed[key] / self.calls[key], 'p50': p50, 'p90': p90, 'p99': p99,
+                'max': self.longest[key]}
+        return ret
+
+    def as_dict(self):
+        """
+        Return the statistics as a dict of plain values, see functions
+        """
+        return {'wall_time': self.wall_time, 'peak_memory_kb': self.peak_memory,
+            'memory_increase_kb': self.peak_memory - self.start_memory, 'functions': self.functions(),
+            'caches': self.caches}
+
+    def dump_json(self, filename):
+        """
+        Write the statistics to a .json file, see as_dict
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+
+    def stats(self):
+        """
+        Return the statistics in the form of pstats.Stats.stats, {function: (primitive calls, calls, own
+        time, total time, {caller: (calls, primitive calls, own time, total time)})}
+        """
+        ret = {}
+        for key in self.calls:
+            callers = dict([(caller, counts) for caller, counts in self.callers[key].items() if caller is not None])
+            ret[key] = (self.primitive.get(key, 0), self.calls[key], self.own[key], self.total.get(key, 0.0), callers)
+        return ret
+
+    def dump_stats(self, filename):
+        """
+        Write the statistics to a file in the format written by cProfile, to be read by pstats.Stats
+        """
+        with open(filename, 'wb') as f:
+            marshal.dump(self.stats(), f)
+
+    def report(self, limit=None):
+        """
+        Return a text table of the functions in order of their total time, the cache hit rates and
+        memory use
+
+        Keyword arguments:
+        limit -- the most functions listed, defaults to all
+
+        """
+        functions = sorted(self.functions().items(), key=lambda item: -item[1]['total'])[:limit]
+        lines = ['%-40s %8s %10s %10s %10s %10s %10s' % ('function', 'calls', 'total s', 'own s', 'p50 ms',
+            'p90 ms', 'p99 ms')]
+        for label, f in functions:
+            lines.append('%-40s %8d %10.4f %10.4f %10.4f %10.4f %10.4f' % (label, f['calls'], f['total'], f['own'],
+                1000 * f['p50'], 1000 * f['p90'], 1000 * f['p99']))
+        for name, c in sorted(self.caches.items()):
+            rate = '-' if c['hit_rate'] is None else '%.1f%%' % (100 * c['hit_rate'])
+            lines.append('%s cache: %d hits, %d misses, hit rate %s' % (name, c['hits'], c['misses'], rate))
+        lines.append('wall time %.3f s, peak memory %d kB (%+d kB)' % (self.wall_time, self.peak_memory,
+            self.peak_memory - self.start_memory))
+        return '\n'.join(lines)
+
+
+@contextlib.contextmanager
+def profiling(profile=None):
+    """
+    A context manager that records the hot path calls made within it to a Profile, which it returns
+
+    Keyword arguments:
+    profile -- the Profile to record to, defaults to a new one; recording to the same profile again adds
+    to its statistics
+
+    """
+    global _active
+    profile = profile or Profile()
+    previous = _active
+    profile.start()
+    try:
+        yield profile
+    finally:
+        profile.stop()
+        _active = previous
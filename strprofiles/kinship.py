@@ -0,0 +1,138 @@
+"""
+kinship
+
+Match probabilities and likelihood ratios for relatives, for familial searching of profile databases.
+"""
+
+import numpy
+
+
+# the IBD coefficients (k0, k1, k2), the probabilities that two relatives share zero, one or two
+# alleles identical by descent
+RELATIONSHIPS = {
+    'unrelated': (1.0, 0.0, 0.0),
+    'parent-child': (0.0, 1.0, 0.0),
+    'full-siblings': (0.25, 0.5, 0.25),
+    'half-siblings': (0.5, 0.5, 0.0),
+    'grandparent-grandchild': (0.5, 0.5, 0.0),
+    'uncle-nephew': (0.5, 0.5, 0.0),
+    'first-cousins': (0.75, 0.25, 0.0)}
+
+
+def ibd_coefficients(relationship):
+    """
+    Return the IBD coefficients (k0, k1, k2) of a relationship, given either its name in
+    RELATIONSHIPS or the coefficients themselves
+    """
+    if relationship in RELATIONSHIPS:
+        return RELATIONSHIPS[relationship]
+    k0, k1, k2 = relationship
+    if abs(k0 + k1 + k2 - 1.0) > 1e-9:
+        raise ValueError('IBD coefficients must sum to 1.0')
+    return k0, k1, k2
+
+
+def kinship_terms(query, genotypes, table, theta):
+    """
+    Return, for each marker, the probabilities of the query genotype given a genotype from the
+    database when the two share zero, one or two alleles identical by descent
+
+    Alleles not shared by descent are drawn with the Balding and Nichols sampling formula, having
+    seen the two alleles of the database genotype: an allele seen m times is drawn with probability
+    (m * theta + (1 - theta) * p) / (1 + (n - 1) * theta) after n alleles have been seen. With the
+    query equal to the database genotype the first term is the match probability of
+    strmarker.calc_profile_match_probability.
+
+    Keyword arguments:
+    query -- an integer genotype array of shape (..., markers, 2)
+    genotypes -- an integer genotype array that query broadcasts against
+    table -- an array of allele frequencies of shape (markers, codes), see FrequencyStore.frequency_table
+    theta -- the population subdivision coefficient, used to correct for subdivided populations
+
+    Returns a tuple of three arrays (t0, t1, t2), of the broadcast shape less the last axis.
+
+    """
+    rows = numpy.arange(len(table))
+    a = query[..., 0]
+    b = query[..., 1]
+    c = genotypes[..., 0]
+    d = genotypes[..., 1]
+    pa = table[rows, numpy.maximum(a, 0)]
+    pb = table[rows, numpy.maximum(b, 0)]
+    ma = (c == a).astype(float) + (d == a)
+    mb = (c == b).astype(float) + (d == b)
+    hom = a == b
+    # the probabilities of drawing a and b with two alleles seen
+    sa = (ma * theta + (1 - theta) * pa) / (1 + theta)
+    sb = (mb * theta + (1 - theta) * pb) / (1 + theta)
+    t0 = numpy.where(hom, sa * ((ma + 1) * theta + (1 - theta) * pa), 2 * sa * (mb * theta + (1 - theta) * pb))
+    t0 /= 1 + 2 * theta
+    t1 = numpy.where(hom, ma / 2 * sa, (ma * sb + mb * sa) / 2)
+    t2 = (((a == c) & (b == d)) | ((a == d) & (b == c))).astype(float)
+    return t0, t1, t2
+
+
+def relative_match_probabilities(genotypes, table, relationship, theta, chunk_size=65536):
+    """
+    Calculate, for each profile, the log10 probability that a relative of its donor has the same profile
+
+    For the IBD coefficients (k0, k1, k2) of the relationship the probability at a marker is
+    k0 * t0 + k1 * t1 + k2, with t0 and t1 as given by kinship_terms; for homozygotes t1 is
+    (2 * theta + (1 - theta) * p) / (1 + theta) and for heterozygotes
+    (2 * theta + (1 - theta) * (p + q)) / (2 * (1 + theta)).
+
+    Keyword arguments:
+    genotypes -- an integer array of shape (profiles, markers, 2), see FrequencyStore.encode_profiles;
+    markers encoded -1 are untyped and do not contribute
+    table -- an array of allele frequencies of shape (markers, codes), see FrequencyStore.frequency_table
+    relationship -- the name of a relationship in RELATIONSHIPS, or its IBD coefficients (k0, k1, k2)
+    theta -- the population subdivision coefficient, used to correct for subdivided populations
+    chunk_size -- the number of profiles evaluated in each pass
+
+    Returns an array of shape (profiles,).
+
+    """
+    k0, k1, k2 = ibd_coefficients(relationship)
+    genotypes = numpy.asarray(genotypes)
+    ret = numpy.empty(len(genotypes))
+    for start in range(0, len(genotypes), chunk_size):
+        chunk = genotypes[start:start + chunk_size]
+        t0, t1, t2 = kinship_terms(chunk, chunk, table, theta)
+        typed = (chunk >= 0).all(axis=-1)
+        with numpy.errstate(divide='ignore'):
+            logs = numpy.log10(k0 * t0 + k1 * t1 + k2 * t2)
+        ret[start:start + chunk_size] = numpy.where(typed, logs, 0.0).sum(axis=1)
+    return ret
+
+
+def kinship_indices(query, genotypes, table, relationship, theta, chunk_size=65536):
+    """
+    Calculate, for each database profile, the log10 likelihood ratio that its donor is the given
+    relative of the query's donor rather than unrelated
+
+    At each marker the ratio is k0 + (k1 * t1 + k2 * t2) / t0, with t0, t1 and t2 as given by
+    kinship_terms; markers untyped in either profile do not contribute.
+
+    Keyword arguments:
+    query -- an integer genotype array of shape (markers, 2), the profile being searched for
+    genotypes -- an integer array of shape (profiles, markers, 2), the database
+    table -- an array of allele frequencies of shape (markers, codes), see FrequencyStore.frequency_table
+    relationship -- the name of a relationship in RELATIONSHIPS, or its IBD coefficients (k0, k1, k2)
+    theta -- the population subdivision coefficient, used to correct for subdivided populations
+    chunk_size -- the number of profiles evaluated in each pass
+
+    Returns an array of shape (profiles,).
+
+    """
+    k0, k1, k2 = ibd_coefficients(relationship)
+    query = numpy.asarray(query)
+    genotypes = numpy.asarray(genotypes)
+    ret = numpy.empty(len(genotypes))
+    for start in range(0, len(genotypes), chunk_size):
+        chunk = genotypes[start:start + chunk_size]
+        t0, t1, t2 = kinship_terms(query, chunk, table, theta)
+        typed = (chunk >= 0).all(axis=-1) & (query >= 0).all(axis=-1)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            ratio = numpy.log10(k0 + (k1 * t1 + k2 * t2) / t0)
+        ret[start:start + chunk_size] = numpy.where(typed, ratio, 0.0).sum(axis=1)
+    return ret
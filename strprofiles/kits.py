@@ -0,0 +1,88 @@
+"""
+kits
+
+A registry of STR marker kits, the sets of genetic markers typed together.
+"""
+
+
+class Kit(object):
+    """
+    A named set of genetic markers, in a fixed order.
+
+    A kit's position in a frequencies.FrequencyStore, the index of each of its markers among the
+    store's markers, is calculated once per store (see FrequencyStore.marker_indexes), so results
+    calculated for every marker of a store can be gathered for any number of kits.
+
+    """
+
+    def __init__(self, name, markers):
+        """
+        Keyword arguments:
+        name -- the name of the kit, or None for a kit that is not registered
+        markers -- the names of the kit's genetic markers
+
+        """
+        self.name = name
+        self.markers = tuple(markers)
+
+    def __iter__(self):
+        return iter(self.markers)
+
+    def __len__(self):
+        return len(self.markers)
+
+    def __contains__(self, marker):
+        return marker in self.markers
+
+    def __repr__(self):
+        return 'Kit(%r, %r)' % (self.name, self.markers)
+
+    def indexes(self, store):
+        """
+        Return an integer array of the index of each of the kit's markers among the markers of a
+        frequencies.FrequencyStore, -1 for markers the store does not have
+        """
+        return store.marker_indexes(self.markers)
+
+
+KITS = {}
+
+
+def register_kit(name, markers):
+    """
+    Register a kit, replacing any kit of the same name, and return it
+
+    Keyword arguments:
+    name -- the name of the kit
+    markers -- the names of the kit's genetic markers
+
+    """
+    kit = KITS[name] = Kit(name, markers)
+    return kit
+
+
+def get_kit(kit=None):
+    """
+    Return a Kit, given a Kit, the name of a registered kit, a sequence of marker names for an
+    unregistered kit, or None for SGM Plus
+    """
+    if kit is None:
+        return SGM_PLUS
+    if isinstance(kit, Kit):
+        return kit
+    if isinstance(kit, basestring):
+        try:
+            return KITS[kit]
+        except KeyError:
+            raise ValueError('unknown kit %s' % kit)
+    return Kit(None, kit)
+
+
+SGM_PLUS = register_kit('SGM Plus', ['FGA', 'TH01', 'VWA', 'D2S1338', 'D3S1358', 'D8S1179', 'D16S539', 'D18S51',
+    'D19S433', 'D21S11'])
+
+CODIS_CORE = register_kit('CODIS core', ['CSF1PO', 'FGA', 'TH01', 'TPOX', 'VWA', 'D3S1358', 'D5S818', 'D7S820',
+    'D8S1179', 'D13S317', 'D16S539', 'D18S51', 'D21S11'])
+
+ESS = register_kit('ESS', ['D3S1358', 'VWA', 'D8S1179', 'D21S11', 'D18S51', 'TH01', 'FGA', 'D1S1656', 'D2S441',
+    'D10S1248', 'D12S391', 'D22S1045'])
@@ -0,0 +1,67 @@
+"""
+memo
+
+Bounded memoization for repeated calculations on allele frequency data.
+"""
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A mapping of bounded size that discards its least recently used entries first, and counts the
+    hits and misses of its lookups.
+    """
+
+    def __init__(self, maxsize):
+        """
+        Keyword arguments:
+        maxsize -- the maximum number of entries held
+
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        """
+        Return the value for key, marking it as most recently used, or default if there is none
+        """
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Set the value for key, discarding the least recently used entry if the cache is full
+        """
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Discard all the entries, and reset the hit and miss counts
+        """
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """
+        Return a dict of the hit and miss counts, and the current and maximum sizes
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxsize': self.maxsize}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
@@ -0,0 +1,145 @@
+"""
+mixture
+
+Likelihood ratios for DNA mixtures of two or more contributors, without drop-out or drop-in.
+"""
+
+import numpy
+
+import instrument
+import strmarker
+from memo import LRUCache
+
+
+# the probabilities of the observed alleles at a marker, keyed by everything they depend on, see
+# locus_probability
+LOCUS_CACHE = instrument.register_cache('mixture.locus', LRUCache(65536))
+
+
+class Hypothesis(object):
+    """
+    An explanation of a mixture: the typed profiles of the known contributors, and the number of
+    unknown contributors, who are taken to be unrelated members of the population.
+    """
+
+    def __init__(self, known, unknowns):
+        """
+        Keyword arguments:
+        known -- a list of profiles, each a dict in the form {'marker': (allele, allele), ...}
+        unknowns -- the number of unknown contributors
+
+        """
+        self.known = list(known)
+        self.unknowns = unknowns
+
+    def __repr__(self):
+        return 'Hypothesis(%d known, %d unknowns)' % (len(self.known), self.unknowns)
+
+
+def _allele(allele):
+    """Return an allele value, given either the value or a (value, frequency) pair"""
+    if isinstance(allele, tuple):
+        return allele[0]
+    return allele
+
+
+def locus_probability(observed, known, unknowns, frequencies, seen, theta):
+    """
+    Calculate the probability that the unknown contributors' alleles, together with those of the known
+    contributors, are exactly the observed alleles at a marker
+
+    The 2 * unknowns unknown alleles must all lie in the observed set and include every observed
+    allele that the known contributors do not have. By inclusion and exclusion over the subsets S of
+    those uncovered alleles, this is the sum of (-1)^|S| times the probability that all the unknown
+    alleles lie in the observed set less S. Only genotypes consistent with the observed alleles are
+    counted, and no genotype combination is enumerated. Under the Balding and Nichols sampling formula
+    a set of alleles A behaves as a single allele of frequency p_A, so after n alleles, m_A of them in
+    A, have been seen, all 2 * unknowns alleles lie in A with probability
+    prod_t ((m_A + t) * theta + (1 - theta) * p_A) / (1 + (n + t - 1) * theta). All the subsets are
+    evaluated together as arrays. Results are cached in LOCUS_CACHE.
+
+    Keyword arguments:
+    observed -- the alleles observed in the mixture at the marker
+    known -- a list of the known contributors' genotypes at the marker, each a pair of alleles
+    unknowns -- the number of unknown contributors
+    frequencies -- a dict of allele frequencies in the form {'value': frequency, ...}
+    seen -- the alleles of all the typed profiles conditioned on, a list with repeats
+    theta -- the population subdivision coefficient, used to correct for subdivided populations
+
+    """
+    observed = frozenset(observed)
+    known_alleles = frozenset([a for genotype in known for a in genotype])
+    if not known_alleles <= observed:
+        return 0.0
+    uncovered = sorted(observed - known_alleles)
+    if len(uncovered) > 2 * unknowns:
+        return 0.0
+    if unknowns == 0:
+        return 1.0
+    alleles = sorted(observed)
+    p = numpy.array([frequencies.get(a, 0.0) for a in alleles])
+    m = numpy.array([seen.count(a) for a in alleles], dtype=float)
+    key = (tuple(alleles), tuple(p.tolist()), tuple(m.tolist()), tuple(uncovered), unknowns, len(seen), theta)
+    ret = LOCUS_CACHE.get(key)
+    if ret is not None:
+        return ret
+
+    # removed[s, i] is True if allele i is in the s'th subset of the uncovered alleles
+    subsets = numpy.arange(1 << len(uncovered))
+    removed = numpy.zeros((len(subsets), len(alleles)), dtype=bool)
+    for k, a in enumerate(uncovered):
+        removed[:, alleles.index(a)] = (subsets >> k) & 1
+    inside = ~removed
+    p_set = numpy.dot(inside, p)
+    m_set = numpy.dot(inside, m)
+    t = numpy.arange(2 * unknowns)
+    numer = (m_set[:, numpy.newaxis] + t) * theta + (1 - theta) * p_set[:, numpy.newaxis]
+    denom = 1 + (len(seen) + t - 1) * theta
+    sign = numpy.where(removed.sum(axis=1) % 2, -1.0, 1.0)
+    ret = float(numpy.dot(sign, (numer / denom).prod(axis=1)))
+    ret = max(ret, 0.0)
+    LOCUS_CACHE.put(key, ret)
+    return ret
+
+
+def calc_mixture_lr(mixture, prosecution, defence, data, name, theta, minimum_frequency=0.0, typed=None):
+    """
+    Calculate the likelihood ratio of two hypotheses for a mixture, see locus_probability
+
+    Keyword arguments:
+    mixture -- the observed alleles, a dict in the form {'marker': [allele, ...], ...}
+    prosecution -- the prosecution Hypothesis
+    defence -- the defence Hypothesis
+    data -- the allele frequency data
+    name -- the name of the sample set to be used
+    theta -- the population subdivision coefficient, used to correct for subdivided populations
+    minimum_frequency -- the lowest frequency used for any allele, eg for alleles not seen in the
+    sample set
+    typed -- the typed profiles whose alleles are conditioned on under both hypotheses; defaults to
+    the known contributors of either hypothesis
+
+    Returns a dict with 'lr', 'log10_lr' and 'markers', a dict of the (prosecution, defence)
+    probabilities at each marker.
+
+    """
+    if typed is None:
+        typed = []
+        for profile in prosecution.known + defence.known:
+            if profile not in typed:
+                typed.append(profile)
+    markers = {}
+    log10_lr = 0.0
+    for d in strmarker.select_markers(data, name, mixture.keys()):
+        marker = d['marker']
+        alleles = d['alleles']
+        observed = [_allele(a) for a in mixture[marker]]
+        frequencies = dict([(a, max(alleles.get(a, 0.0), minimum_frequency)) for a in observed])
+        seen = [_allele(a) for profile in typed if marker in profile for a in profile[marker]]
+        probabilities = []
+        for hypothesis in (prosecution, defence):
+            known = [[_allele(a) for a in profile[marker]] for profile in hypothesis.known if marker in profile]
+            probabilities.append(locus_probability(observed, known, hypothesis.unknowns, frequencies, seen, theta))
+        markers[marker] = tuple(probabilities)
+        with numpy.errstate(divide='ignore'):
+            log10_lr += numpy.log10(probabilities[0]) - numpy.log10(probabilities[1])
+    return {'lr': 10 ** log10_lr, 'log10_lr': log10_lr, 'markers': markers}
@@ -0,0 +1,65 @@
+"""
+parallel
+
+Running a list of tasks in a pool of worker processes, each holding its own copy of arguments shared
+by every task.
+
+Tasks that draw random numbers should seed their own random stream from the task, eg from its index,
+so the results do not depend on the number of jobs.
+
+"""
+
+import multiprocessing
+
+
+# the task function and shared arguments of a pool worker process, see imap_tasks
+_worker = None
+
+
+def _init_worker(func, shared_args):
+    """
+    Initialize a pool worker process with the task function and the arguments shared by every task
+    """
+    global _worker
+    _worker = (func, shared_args)
+
+
+def _run_task(task):
+    """
+    Run one task in a pool worker process
+    """
+    func, shared_args = _worker
+    return func(task, shared_args)
+
+
+def imap_tasks(func, tasks, shared_args, jobs=1):
+    """
+    Yield func(task, shared_args) for each task, in the order of tasks, as each result is ready
+
+    Keyword arguments:
+    func -- a module level function of (task, shared_args)
+    tasks -- a list of tasks
+    shared_args -- the arguments shared by every task, copied once to each worker process
+    jobs -- the number of worker processes to use, 1 to run the tasks in this process, 0 for one per CPU
+
+    The pool is terminated if the results are not all consumed.
+
+    """
+    if jobs == 1 or len(tasks) < 2:
+        for task in tasks:
+            yield func(task, shared_args)
+        return
+    pool = multiprocessing.Pool(jobs or None, _init_worker, (func, shared_args))
+    try:
+        for result in pool.imap(_run_task, tasks):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def map_tasks(func, tasks, shared_args, jobs=1):
+    """
+    Return the list of func(task, shared_args) for each task, see imap_tasks
+    """
+    return list(imap_tasks(func, tasks, shared_args, jobs))
@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+#coding=utf-8
+#file: server.py
+
+"""
+server
+
+A long running HTTP server that holds allele frequency data in memory and answers JSON queries for
+random match probabilities, profile match probabilities and modal profiles.
+
+    python -m strprofiles.server --port 8080 ../data/JFS2003IDresults.csv:JSF\ :1 ../data/ABresults.csv:AB\ :100
+
+    POST /rmps {"name": "AB Cau", "cutoff": 5, "theta": 0.01, "kit": "SGM Plus"}
+    POST /pmp {"name": "AB Cau", "profile": {"FGA": ["21", "22"], ...}, "theta": 0.01}
+    POST /modal {"name": "AB Cau", "thetas": [0.0, 0.01], "kit": "SGM Plus"}
+    GET /names
+    GET /metrics
+
+Queries are answered by a single evaluation thread, which gathers the queries that arrive together
+into micro-batches: profile match probabilities for the same sample set and theta are encoded and
+evaluated as one genotype array, and identical random match probability and modal profile queries
+are calculated once. The optional kit is the name of a registered marker kit or a list of markers,
+see kits.get_kit.
+
+"""
+
+import BaseHTTPServer
+import json
+import Queue
+import SocketServer
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from optparse import OptionParser
+
+import numpy
+
+import frequencies
+import kits
+import sgm
+import strmarker
+
+
+class Metrics(object):
+    """
+    Thread safe counts and latencies of the queries answered by a server.
+    """
+
+    def __init__(self, window=4096):
+        """
+        Keyword arguments:
+        window -- the number of most recent query latencies kept for the percentiles
+
+        """
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = defaultdict(int)
+        self.errors = 0
+        self.batches = 0
+        self.batched = 0
+        self.latencies = deque(maxlen=window)
+
+    def record(self, kind, latency, error=False):
+        """
+        Record a query of the given kind, answered in latency seconds
+        """
+        with self._lock:
+            self.requests[kind] += 1
+            if error:
+                self.errors += 1
+            self.latencies.append(latency)
+
+    def record_batch(self, size):
+        """
+        Record a batch of size queries evaluated together
+        """
+        with self._lock:
+            self.batches += 1
+            self.batched += size
+
+    def snapshot(self):
+        """
+        Return the metrics as a dict, with latencies in milliseconds and throughput in queries per second
+        """
+        with self._lock:
+            uptime = time.time() - self.started
+            total = sum(self.requests.values())
+            latencies = numpy.array(self.latencies) * 1000.0
+            ret = {'uptime': uptime, 'requests': dict(self.requests), 'total': total, 'errors': self.errors,
+                'throughput': total / uptime if uptime > 0 else 0.0, 'batches': self.batches,
+                'mean_batch_size': float(self.batched) / self.batches if self.batches else 0.0}
+        if len(latencies):
+            p50, p90, p99 = numpy.percentile(latencies, [50, 90, 99]).tolist()
+            ret['latency'] = {'mean': float(latencies.mean()), 'p50': p50, 'p90': p90, 'p99': p99,
+                'max': float(latencies.max())}
+        return ret
+
+
+class _Query(object):
+    """
+    A query waiting to be answered by the Batcher.
+    """
+    __slots__ = ('kind', 'args', 'done', 'result', 'error')
+
+    def __init__(self, kind, args):
+        self.kind = kind
+        self.args = args
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Batcher(object):
+    """
+    Answers queries against allele frequency data in a single thread, evaluating the queries that
+    arrive within max_delay of each other together.
+
+    Only the batcher's thread reads the data, so it needs no locking; encoding profiles can add new
+    allele codes to the store.
+
+    """
+
+    def __init__(self, data, metrics=None, max_batch=256, max_delay=0.002):
+        """
+        Keyword arguments:
+        data -- the allele frequency data, a frequencies.FrequencyStore
+        metrics -- the Metrics that batch sizes are recorded in
+        max_batch -- the largest number of queries evaluated together
+        max_delay -- the longest time, in seconds, to wait for more queries once one has arrived
+
+        """
+        self.data = data
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = Queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='batcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, kind, args, timeout=None):
+        """
+        Queue a query and wait for its answer, raising any exception raised in answering it
+
+        Keyword arguments:
+        kind -- the kind of query, 'rmps', 'pmp' or 'modal'
+        args -- a tuple of the query's arguments, see evaluate
+        timeout -- the longest time to wait, in seconds
+
+        """
+        query = _Query(kind, args)
+        self._queue.put(query)
+        if not query.done.wait(timeout):
+            raise RuntimeError('query timed out')
+        if query.error is not None:
+            raise query.error
+        return query.result
+
+    def stop(self):
+        """
+        Stop the batcher's thread once the queries already queued have been answered
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        """
+        Gather queries into batches and answer them, until stopped
+        """
+        while True:
+            query = self._queue.get()
+            if query is None:
+                return
+            batch = [query]
+            deadline = time.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.time()
+                try:
+                    query = self._queue.get(remaining > 0, max(remaining, 0))
+                except Queue.Empty:
+                    break
+                if query is None:
+                    self._queue.put(None)
+                    break
+                batch.append(query)
+            self.evaluate(batch)
+            if self.metrics is not None:
+                self.metrics.record_batch(len(batch))
+
+    def evaluate(self, batch):
+        """
+        Answer a batch of queries, grouping those that can be evaluated together
+
+        The arguments of each kind of query are:
+        'rmps' -- (name, cutoff, theta, kit), see strmarker.calc_rmps
+        'pmp' -- (name, profile, theta, minimum_frequency), where the profile is a dict in the form
+        {'marker': (allele, allele), ...}
+        'modal' -- (name, thetas, kit), see strmarker.get_modal_profile
+
+        """
+        groups = defaultdict(list)
+        for query in batch:
+            if query.kind == 'pmp':
+                name, profile, theta, minimum_frequency = query.args
+                groups[('pmp', name, theta, minimum_frequency)].append(query)
+            else:
+                groups[(query.kind,) + query.args].append(query)
+        for key, queries in groups.items():
+            try:
+                if key[0] == 'pmp':
+                    results = self._profile_match_probabilities(key[1], [q.args[1] for q in queries], key[2], key[3])
+                elif key[0] == 'rmps':
+                    results = [strmarker.calc_rmps(self.data, key[1], key[2], key[3], key[4])] * len(queries)
+                else:
+                    results = [self._modal(key[1], key[2], key[3])] * len(queries)
+                for query, result in zip(queries, results):
+                    query.result = result
+            except Exception, e:
+                for query in queries:
+                    query.error = e
+            for query in queries:
+                query.done.set()
+
+    def _profile_match_probabilities(self, name, profiles, theta, minimum_frequency):
+        """
+        Calculate the match probabilities of a list of profiles with one vectorized evaluation
+        """
+        # markers the sample set has no frequencies for are treated as untyped, as by batch.score_profiles
+        markers = sorted(set([marker for profile in profiles for marker in profile
+            if self.data.get(name, marker) is not None]))
+        # allele values the store does not have share a zero frequency slot, rather than being added to it
+        genotypes = self.data.encode_profiles(profiles, markers, grow=False)
+        logs = strmarker.calc_profile_log_match_probabilities(genotypes, self.data, name, markers, theta,
+            minimum_frequency=minimum_frequency)
+        ret = []
+        for log10 in logs.tolist():
+            pmp = 10 ** log10
+            if pmp:
+                ret.append({'pmp': pmp, 'log10': log10, 'reciprocal': 1.0 / pmp})
+            else:
+                ret.append({'pmp': 0.0, 'log10': None, 'reciprocal': None})
+        return ret
+
+    def _modal(self, name, thetas, kit):
+        """
+        Find the modal profile of a sample set, and its reciprocal match probabilities
+        """
+        profile = strmarker.get_modal_profile(self.data, name, kit)
+        pmp = dict([(repr(theta), 1.0 / strmarker.calc_profile_match_probability(profile, theta)) for theta in thetas])
+        return {'profile': profile, 'reciprocal': pmp}
+
+
+class QueryHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Handles one HTTP query, see the module documentation.
+    """
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._reply(200, self.server.metrics.snapshot())
+        elif self.path == '/names':
+            self._reply(200, {'names': self.server.data.names()})
+        else:
+            self._reply(404, {'error': 'unknown path %s' % self.path})
+
+    def do_POST(self):
+        start = time.time()
+        kind = self.path.strip('/')
+        if kind not in ('rmps', 'pmp', 'modal'):
+            self._reply(404, {'error': 'unknown path %s' % self.path})
+            return
+        try:
+            length = int(self.headers.getheader('content-length') or 0)
+            query = json.loads(self.rfile.read(length) or '{}')
+            args = self.server.query_args(kind, query)
+        except (ValueError, KeyError, TypeError), e:
+            self.server.metrics.record(kind, time.time() - start, True)
+            self._reply(400, {'error': str(e)})
+            return
+        try:
+            result = self.server.batcher.submit(kind, args, self.server.query_timeout)
+        except Exception, e:
+            self.server.metrics.record(kind, time.time() - start, True)
+            self._reply(500, {'error': str(e)})
+            return
+        self.server.metrics.record(kind, time.time() - start)
+        self._reply(200, result)
+
+    def _reply(self, status, body):
+        """
+        Send a JSON response
+        """
+        text = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class QueryServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    An HTTP server answering queries against allele frequency data held in memory.
+
+    Each connection is handled in its own thread, and the queries are answered by a shared Batcher.
+
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, data, max_batch=256, max_delay=0.002, query_timeout=30.0, verbose=False):
+        """
+        Keyword arguments:
+        address -- the (host, port) to listen on; port 0 picks a free port, see server_address
+        data -- the allele frequency data, a frequencies.FrequencyStore
+        max_batch -- the largest number of queries evaluated together
+        max_delay -- the longest time, in seconds, a query waits for others to batch with
+        query_timeout -- the longest time, in seconds, a query waits to be answered
+        verbose -- log each request to stderr
+
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, address, QueryHandler)
+        self.data = data
+        self.query_timeout = query_timeout
+        self.verbose = verbose
+        self.metrics = Metrics()
+        self.batcher = Batcher(data, self.metrics, max_batch, max_delay)
+
+    def query_args(self, kind, query):
+        """
+        Validate a decoded JSON query, returning the arguments for Batcher.submit
+        """
+        name = query['name']
+        if name not in self.data.names():
+            raise KeyError('unknown sample set %s' % name)
+        kit = query.get('kit')
+        if isinstance(kit, list):
+            kit = tuple(kit)
+        if kind != 'pmp' and not self.data.select(name, kits.get_kit(kit).markers):
+            raise ValueError('sample set %s has none of the markers of the kit' % name)
+        if kind == 'rmps':
+            return (name, float(query.get('cutoff', 0)), float(query.get('theta', 0.0)), kit)
+        if kind == 'pmp':
+            profile = dict([(marker, tuple(alleles)) for marker, alleles in query['profile'].items()])
+            for alleles in profile.values():
+                if len(alleles) != 2:
+                    raise ValueError('a genotype must have two alleles')
+                for allele in alleles:
+                    # numbers are rejected rather than guessed at, since 9.3 and "9.30" are different labels
+                    if not isinstance(allele, basestring):
+                        raise ValueError('allele values must be strings, eg "9.3", not %r' % (allele,))
+            return (name, profile, float(query.get('theta', 0.0)), float(query.get('minimum_frequency', 0.0)))
+        thetas = query.get('thetas', [float(theta) for theta in sgm.PMP_THETAS])
+        return (name, tuple([float(theta) for theta in thetas]), kit)
+
+    def server_close(self):
+        BaseHTTPServer.HTTPServer.server_close(self)
+        self.batcher.stop()
+
+
+def main():
+    """
+    Read in the allele frequency data, then answer queries until interrupted
+
+    """
+    parser = OptionParser(usage="usage: %prog [options] FILE[:PREFIX[:NORMALIZER]] ...")
+    parser.add_option("--host", dest="host", default="127.0.0.1", help="address to listen on")
+    parser.add_option("-p", "--port", type="int", dest="port", default=8080, help="port to listen on")
+    parser.add_option("--max-batch", type="int", dest="max_batch", default=256,
+        help="largest number of queries evaluated together")
+    parser.add_option("--max-delay", type="float", dest="max_delay", default=0.002,
+        help="longest time in seconds a query waits for others to batch with")
+    parser.add_option("-v", action="store_true", dest="verbose", default=False, help="log each request")
+    (options, args) = parser.parse_args()
+    if not args:
+        args = ["../data/JFS2003IDresults.csv:JSF :1", "../data/ABresults.csv:AB :100"]
+
+    data = frequencies.FrequencyStore()
+    for source in args:
+        data.extend(sgm.read_csv(*sgm.parse_source(source)))
+
+    server = QueryServer((options.host, options.port), data, options.max_batch, options.max_delay,
+        verbose=options.verbose)
+    print >> sys.stderr, "serving %d sample sets on http://%s:%d" % ((len(data.names()),) + server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,13 +8,26 @@ sgm
 
 #import strprofiles.strmarker as strmarker
 import strmarker
+import columnar
+import frequencies
+import instrument
+import kits
+import parallel
 import csv
-from jinja2 import Template
+import os
+import sys
+import zipfile
+import numpy
 from collections import defaultdict
 from optparse import OptionParser
 
 
-def read_csv(filename, prefix, normalizer):
+CACHE_SUFFIX = '.cache.npz'
+CACHE_FORMAT = 1
+
+
+@instrument.hot_path
+def read_csv(filename, prefix, normalizer, cache=True):
     """
     Read genetic marker allele frequency data from a .csv file
 
@@ -22,6 +35,8 @@ def read_csv(filename, prefix, normalizer):
     filename -- the file to be read
     normalizer -- used to normalize the data, use 100 if the data are percentages, 1 if they are
     fractions in the range [0.0, 1.0]
+    cache -- if True the parsed table is saved in binary form to filename + CACHE_SUFFIX, and is
+    loaded from there, without parsing, while the size and modification time of filename are unchanged
 
     Format of file is:
     First row - each cell is a SGM Marker name, cell A1 blank
@@ -34,74 +49,388 @@ def read_csv(filename, prefix, normalizer):
     7, , 0.05253, 0.02143, , , , ...
 
     """
-    data = []
-    reader = csv.reader(open(filename, "rb"), 'excel')
+    table = None
+    if cache:
+        table = load_cache(filename)
+    if table is None:
+        table = parse_csv(open(filename, "rb"))
+        if cache:
+            save_cache(filename, table)
+    return table_data(table, prefix, normalizer)
+
+
+def parse_source(source):
+    """
+    Parse a FILE[:PREFIX[:NORMALIZER]] command line argument into the arguments of read_csv
+    """
+    parts = source.split(':')
+    filename = parts[0]
+    prefix = parts[1] if len(parts) > 1 else ''
+    normalizer = int(parts[2]) if len(parts) > 2 else 1
+    return filename, prefix, normalizer
+
+
+def parse_sample(cell, prefix=''):
+    """
+    Parse a sample cell of a .csv file, "NAME" or "COUNT NAME", into a dict with the 'name', with the
+    prefix prepended, and the 'count' if it is given; the name may contain spaces after a count
+    """
+    vals = cell.split(None, 1)
+    if len(vals) == 1:
+        return {'name': prefix + vals[0]}
+    return {'count': int(vals[0]), 'name': prefix + vals[1].strip()}
+
+
+def _allele_order(label):
+    """Sort key for allele values: numeric values in numeric order, then any others, eg 'X', 'OL'"""
+    try:
+        return (0, float(label), label)
+    except ValueError:
+        return (1, 0.0, label)
+
+
+def write_frequencies(csvfile, data):
+    """
+    Write allele frequency data, in the form returned by read_csv, as a .csv file in the format read
+    by read_csv, with one column per record
+
+    Allele values are written in numeric order, followed by any that are not numbers.
+
+    Keyword arguments:
+    csvfile -- a file-like object
+    data -- the allele frequency data; the sample set names are written without any prefix
+
+    Raises ValueError for a sample set name that read_csv would read back differently: one that is
+    blank or has leading or trailing whitespace, or one containing whitespace without a count.
+
+    """
+    writer = csv.writer(csvfile, 'excel')
+    labels = set()
+    samples = []
+    for d in data:
+        labels.update(d['alleles'].keys())
+        name = d['name']
+        if not name or name != name.strip() or ('count' not in d and len(name.split()) > 1):
+            raise ValueError('sample set name %r cannot be written' % name)
+        samples.append('%d %s' % (d['count'], name) if 'count' in d else name)
+    writer.writerow([''] + [d['marker'] for d in data] + [''])
+    writer.writerow(['Allele'] + samples + ['Allele'])
+    for label in sorted(labels, key=_allele_order):
+        row = [label]
+        for d in data:
+            value = d['alleles'].get(label)
+            row.append('' if value is None else repr(value))
+        row.append(label)
+        writer.writerow(row)
+
+
+@instrument.hot_path
+def parse_csv(csvfile):
+    """
+    Parse a .csv file of allele frequency data, in the format described in read_csv, into a table
+
+    Returns a tuple (markers, samples, alleles, values): the marker and sample name cells of each
+    column, the allele value of each row, and a 2D array of the raw frequency values, NaN where blank.
+
+    """
+    reader = csv.reader(csvfile, 'excel')
 
     # read in the first row, which contains the SMG Marker names
     row = reader.next()
-    for i in range(1, len(row) - 1):
-        data.append({'marker': row[i], 'alleles': {}})
+    markers = row[1:len(row) - 1]
 
     # read in the second row, which contains the sample names
     row = reader.next()
-    for i in range(1, len(row) - 1):
-        vals = row[i].split()
-        if len(vals) == 1:
-            data[i - 1]['name'] = prefix + vals[0]
-        else:
-            data[i - 1]['count'] = int(vals[0])
-            data[i - 1]['name'] = prefix + vals[1]
+    samples = row[1:len(row) - 1]
 
     # read in the allele frequencies
-    try:
-        while 1:
-            row = reader.next()
-            for i in range(1, len(row) - 1):
-                if row[i] != '':
-                    data[i - 1]['alleles'][row[0]] = float(row[i]) / normalizer
-    except StopIteration:
-        pass
+    alleles = []
+    rows = []
+    for row in reader:
+        vals = [numpy.nan] * len(markers)
+        for i in range(1, len(row) - 1):
+            if row[i] != '':
+                vals[i - 1] = float(row[i])
+        alleles.append(row[0])
+        rows.append(vals)
+    values = numpy.array(rows, dtype=float).reshape(len(rows), len(markers))
+    return markers, samples, alleles, values
+
+
+@instrument.hot_path
+def table_data(table, prefix, normalizer):
+    """
+    Convert a table returned by parse_csv into a list of dicts, one per column, in the form
+    {'marker': marker, 'name': name, 'count': count, 'alleles': {'value': frequency, ...}}
+    """
+    markers, samples, alleles, values = table
+    data = []
+    for i, marker in enumerate(markers):
+        d = {'marker': marker, 'alleles': {}}
+        d.update(parse_sample(samples[i], prefix))
+        for j, value in enumerate(values[:, i].tolist()):
+            if value == value:
+                d['alleles'][alleles[j]] = value / normalizer
+        data.append(d)
     return data
 
 
-def rmp_table_text(data, caption, rowheaders, colheaders):
+def iter_csv(csvfile, prefix, normalizer, names=None, markers=None):
     """
-    Format data into a text table formatted using whitespace
+    Read genetic marker allele frequency data from a .csv file, yielding one record per column
+
+    Only the columns for the requested sample sets and markers are parsed and held in memory, so
+    large files with many sample sets can be read a few columns at a time. Each column is complete
+    only once the last row has been read; records are then yielded one at a time and not retained.
 
     Keyword arguments:
-    data -- a 2D dict of the data to be formatted
-    caption -- the table's caption
-    rowheaders -- the table's row headings
-    colheaders -- the table's column headings
+    csvfile -- the file to be read, a filename or any file-like object or iterable of lines
+    prefix -- prepended to each sample name
+    normalizer -- used to normalize the data, use 100 if the data are percentages, 1 if they are
+    fractions in the range [0.0, 1.0]
+    names -- if given, only the sample sets with these names (including the prefix) are read
+    markers -- if given, only these markers are read
 
+    Records are dicts in the form returned by read_csv, yielded in column order.
+
+    """
+    if isinstance(csvfile, basestring):
+        csvfile = open(csvfile, "rb")
+    if names is not None:
+        names = frozenset(names)
+    if markers is not None:
+        markers = frozenset(markers)
+    reader = csv.reader(csvfile, 'excel')
+
+    # read in the first two rows, which contain the SMG Marker names and the sample names
+    marker_row = reader.next()
+    sample_row = reader.next()
+    columns = []
+    records = []
+    for i in range(1, len(marker_row) - 1):
+        d = {'marker': marker_row[i], 'alleles': {}}
+        d.update(parse_sample(sample_row[i], prefix))
+        if (names is None or d['name'] in names) and (markers is None or d['marker'] in markers):
+            columns.append(i)
+            records.append(d)
+
+    # read in the allele frequencies for the selected columns
+    for row in reader:
+        last = len(row) - 1
+        for i, d in zip(columns, records):
+            if i < last and row[i] != '':
+                d['alleles'][row[0]] = float(row[i]) / normalizer
+
+    records.reverse()
+    while records:
+        yield records.pop()
+
+
+def _cache_signature(filename):
+    """Return the signature, used to detect changes, of a .csv file"""
+    stat = os.stat(filename)
+    return numpy.array([CACHE_FORMAT, stat.st_size, stat.st_mtime], dtype=float)
+
+
+@instrument.hot_path
+def load_cache(filename):
+    """
+    Load the table cached for a .csv file, returning None if there is no cache, or it is out of date
+    or cannot be read, eg if it was truncated
+    """
+    try:
+        signature = _cache_signature(filename)
+        cached = numpy.load(filename + CACHE_SUFFIX)
+        try:
+            if not numpy.array_equal(cached['signature'], signature):
+                return None
+            return (cached['markers'].tolist(), cached['samples'].tolist(), cached['alleles'].tolist(),
+                cached['values'])
+        finally:
+            cached.close()
+    except (IOError, OSError, KeyError, ValueError, zipfile.BadZipfile):
+        return None
+
+
+@instrument.hot_path
+def save_cache(filename, table):
+    """
+    Save a table returned by parse_csv as the cache for a .csv file, ignoring any failure to write it
     """
-    template = Template('\n{{caption}}\n'
-        '{{"%8s"|format("")}} '
+    markers, samples, alleles, values = table
+    cachename = filename + CACHE_SUFFIX
+    tmpname = '%s.%d.tmp' % (cachename, os.getpid())
+    try:
+        tmpfile = open(tmpname, 'wb')
+        try:
+            numpy.savez(tmpfile, signature=_cache_signature(filename), markers=numpy.array(markers, dtype=str),
+                samples=numpy.array(samples, dtype=str), alleles=numpy.array(alleles, dtype=str), values=values)
+        finally:
+            tmpfile.close()
+        os.rename(tmpname, cachename)
+    except (IOError, OSError):
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+
+
+# Jinja template sources for the tables, compiled on first use by render_template
+RMP_TABLE_TEXT = ('\n{{caption}}\n'
+    '{{"%8s"|format("")}} '
+    '{% for colheader in colheaders %}'
+        '{{"%8s"|format(colheader)}} '
+    '{% endfor %}\n'
+    '{{"%8s"|format("Count")}} '
+    '{% for colheader in colheaders %}'
+        '{{"%8d"|format(data[colheader]["count"])|escape}} '
+    '{% endfor %}\n'
+    '{% for rowheader in rowheaders %}'
+        '{{"%8s"|format(rowheader)}} '
         '{% for colheader in colheaders %}'
-            '{{"%8s"|format(colheader)}} '
+            '{% if rowheader in data[colheader] %}'
+                '{{"   %1.3f"|format(data[colheader][rowheader])|escape}} '
+            '{% else %}'
+                '{{"%8s"|format("-")}} '
+            '{% endif %}'
         '{% endfor %}\n'
-        '{{"%8s"|format("Count")}} '
+    '{% endfor %}'
+    '{{"%8s"|format("Combined")}} '
+    '{% for colheader in colheaders %}'
+        '{{"%1.2e"|format(data[colheader]["combined"])|escape}} '
+    '{% endfor %}\n'
+    '{{"%8s"|format("Recip")}} '
+    '{% for colheader in colheaders %}'
+        '{{"%1.2e"|format(data[colheader]["reciprocal"])|escape}} '
+    '{% endfor %}')
+
+
+PMP_TABLE_HTML = ('<html>\n<table>\n'
+    '<caption>{{caption}}</caption>\n'
+    '<thead>\n'
+    '<tr> '
+    '<th></th> '
+    '{% for colheader in colheaders %}'
+        '<th>{{colheader|replace(" ", "<br />")}}</th> '
+    '{% endfor %}'
+    '</tr>\n'
+    '</thead>\n'
+    '<tbody>\n'
+    '{% for rowheader in rowheaders %}'
+        '<tr> '
+        '<th>{{rowheader}}</th> '
         '{% for colheader in colheaders %}'
-            '{{"%8d"|format(data[colheader]["count"])|escape}} '
-        '{% endfor %}\n'
-        '{% for rowheader in rowheaders %}'
-            '{{"%8s"|format(rowheader)}} '
-            '{% for colheader in colheaders %}'
-                '{{"   %1.3f"|format(data[colheader][rowheader])|escape}} '
-            '{% endfor %}\n'
+            '<td>{{"%1.2e"|format(data[colheader][rowheader])|escape}}</td> '
         '{% endfor %}'
-        '{{"%8s"|format("Combined")}} '
+        '</tr>\n'
+    '{% endfor %}'
+    '</tbody>\n'
+    '</table>\n</html>\n')
+
+
+PMP_TABLE_TEXT = ('\n{{caption}}\n'
+    '{{"%8s"|format("")}} '
+    '{% for colheader in colheaders %}'
+        '{{"%8s"|format(colheader)}} '
+    '{% endfor %}\n'
+    '{% for rowheader in rowheaders %}'
+        '{{"%8s"|format(rowheader)}} '
         '{% for colheader in colheaders %}'
-            '{{"%1.2e"|format(data[colheader]["combined"])|escape}} '
+            '{{"%1.2e"|format(data[colheader][rowheader])|escape}} '
         '{% endfor %}\n'
-        '{{"%8s"|format("Recip")}} '
+    '{% endfor %}')
+
+
+RMP_TABLE_HTML = ('<html>\n<table>\n'
+    '<caption>{{caption}}</caption>\n'
+    '<thead>\n'
+    '<tr> '
+    '<th></th> '
+    '{% for colheader in colheaders %}'
+        '<th>{{colheader|replace(" ", "<br />")}}</th> '
+    '{% endfor %}'
+    '</tr>\n'
+    '<tr> '
+    '<th>Count</th> '
+    '{% for colheader in colheaders %}'
+        '<th>{{data[colheader]["count"]|escape}}</th> '
+    '{% endfor %}\n'
+    '</tr>\n'
+    '</thead>\n'
+    '<tbody>\n'
+    '{% for rowheader in rowheaders %}'
+        '<tr> '
+        '<th>{{"%8s"|format(rowheader)}}</th> '
         '{% for colheader in colheaders %}'
-            '{{"%1.2e"|format(data[colheader]["reciprocal"])|escape}} '
-        '{% endfor %}')
-    return template.render(data=data, caption=caption, rowheaders=rowheaders, colheaders=colheaders)
+            '{% if rowheader in data[colheader] %}'
+                '<td>{{"%1.3f"|format(data[colheader][rowheader])|escape}}</td> '
+            '{% else %}'
+                '<td></td> '
+            '{% endif %}'
+        '{% endfor %}'
+        '</tr>\n'
+    '{% endfor %}'
+    '</tbody>\n'
+    '<tfoot>\n'
+    '<tr> '
+    '<th>Combined  </th> '
+    '{% for colheader in colheaders %}'
+        '<td>{{"%1.2e"|format(data[colheader]["combined"])|escape}}</td> '
+    '{% endfor %}'
+    '</tr>\n'
+    '<tr> '
+    '<th>Reciprocal</th> '
+    '{% for colheader in colheaders %}'
+        '<td>{{"%1.2e"|format(data[colheader]["reciprocal"])|escape}}</td> '
+    '{% endfor %}'
+    '</tr>\n'
+    '</tfoot>\n'
+    '</table>\n</html>\n')
+
+
+# compiled templates, keyed by their source, see render_template
+_templates = {}
+
+
+@instrument.hot_path
+def render_template(source, out=None, **context):
+    """
+    Render a Jinja template, compiling it the first time it is used
+
+    Keyword arguments:
+    source -- the template source, eg RMP_TABLE_TEXT
+    out -- if given, the output is written to this stream as it is generated, rather than returned
+    context -- the template variables
+
+    """
+    template = _templates.get(source)
+    if template is None:
+        # jinja2 is only imported when a table is first rendered, so other commands start faster
+        from jinja2 import Template
+        template = _templates[source] = Template(source)
+    if out is None:
+        return template.render(**context)
+    for chunk in template.generate(**context):
+        out.write(chunk)
+
+
+@instrument.hot_path
+def rmp_table_text(data, caption, rowheaders, colheaders, out=None):
+    """
+    Format data into a text table formatted using whitespace
+
+    Keyword arguments:
+    data -- a 2D dict of the data to be formatted
+    caption -- the table's caption
+    rowheaders -- the table's row headings
+    colheaders -- the table's column headings
+    out -- if given, the table is written to this stream as it is rendered, and None is returned
+
+    """
+    return render_template(RMP_TABLE_TEXT, out, data=data, caption=caption, rowheaders=rowheaders,
+        colheaders=colheaders)
 
 
-def pmp_table_html(data, caption, rowheaders, colheaders):
+@instrument.hot_path
+def pmp_table_html(data, caption, rowheaders, colheaders, out=None):
     """
     Format data into an HTML table
 
@@ -110,33 +439,15 @@ def pmp_table_html(data, caption, rowheaders, colheaders):
     caption -- the table's caption
     rowheaders -- the table's row headings
     colheaders -- the table's column headings
+    out -- if given, the table is written to this stream as it is rendered, and None is returned
 
     """
-    template = Template('<html>\n<table>\n'
-        '<caption>{{caption}}</caption>\n'
-        '<thead>\n'
-        '<tr> '
-        '<th></th> '
-        '{% for colheader in colheaders %}'
-            '<th>{{colheader|replace(" ", "<br />")}}</th> '
-        '{% endfor %}'
-        '</tr>\n'
-        '</thead>\n'
-        '<tbody>\n'
-        '{% for rowheader in rowheaders %}'
-            '<tr> '
-            '<th>{{rowheader}}</th> '
-            '{% for colheader in colheaders %}'
-                '<td>{{"%1.2e"|format(data[colheader][rowheader])|escape}}</td> '
-            '{% endfor %}'
-            '</tr>\n'
-        '{% endfor %}'
-        '</tbody>\n'
-        '</table>\n</html>\n')
-    return template.render(data=data, caption=caption, rowheaders=rowheaders, colheaders=colheaders)
+    return render_template(PMP_TABLE_HTML, out, data=data, caption=caption, rowheaders=rowheaders,
+        colheaders=colheaders)
 
 
-def pmp_table_text(data, caption, rowheaders, colheaders):
+@instrument.hot_path
+def pmp_table_text(data, caption, rowheaders, colheaders, out=None):
     """
     Format data into a text table formatted using whitespace
 
@@ -145,23 +456,15 @@ def pmp_table_text(data, caption, rowheaders, colheaders):
     caption -- the table's caption
     rowheaders -- the table's row headings
     colheaders -- the table's column headings
+    out -- if given, the table is written to this stream as it is rendered, and None is returned
 
     """
-    template = Template('\n{{caption}}\n'
-        '{{"%8s"|format("")}} '
-        '{% for colheader in colheaders %}'
-            '{{"%8s"|format(colheader)}} '
-        '{% endfor %}\n'
-        '{% for rowheader in rowheaders %}'
-            '{{"%8s"|format(rowheader)}} '
-            '{% for colheader in colheaders %}'
-                '{{"%1.2e"|format(data[colheader][rowheader])|escape}} '
-            '{% endfor %}\n'
-        '{% endfor %}')
-    return template.render(data=data, caption=caption, rowheaders=rowheaders, colheaders=colheaders)
+    return render_template(PMP_TABLE_TEXT, out, data=data, caption=caption, rowheaders=rowheaders,
+        colheaders=colheaders)
 
 
-def rmp_table_html(data, caption, rowheaders, colheaders):
+@instrument.hot_path
+def rmp_table_html(data, caption, rowheaders, colheaders, out=None):
     """
     Format data into an HTML table
 
@@ -170,83 +473,97 @@ def rmp_table_html(data, caption, rowheaders, colheaders):
     caption -- the table's caption
     rowheaders -- the table's row headings
     colheaders -- the table's column headings
+    out -- if given, the table is written to this stream as it is rendered, and None is returned
 
     """
-    template = Template('<html>\n<table>\n'
-        '<caption>{{caption}}</caption>\n'
-        '<thead>\n'
-        '<tr> '
-        '<th></th> '
-        '{% for colheader in colheaders %}'
-            '<th>{{colheader|replace(" ", "<br />")}}</th> '
-        '{% endfor %}'
-        '</tr>\n'
-        '<tr> '
-        '<th>Count</th> '
-        '{% for colheader in colheaders %}'
-            '<th>{{data[colheader]["count"]|escape}}</th> '
-        '{% endfor %}\n'
-        '</tr>\n'
-        '</thead>\n'
-        '<tbody>\n'
-        '{% for rowheader in rowheaders %}'
-            '<tr> '
-            '<th>{{"%8s"|format(rowheader)}}</th> '
-            '{% for colheader in colheaders %}'
-                '<td>{{"%1.3f"|format(data[colheader][rowheader])|escape}}</td> '
-            '{% endfor %}'
-            '</tr>\n'
-        '{% endfor %}'
-        '</tbody>\n'
-        '<tfoot>\n'
-        '<tr> '
-        '<th>Combined  </th> '
-        '{% for colheader in colheaders %}'
-            '<td>{{"%1.2e"|format(data[colheader]["combined"])|escape}}</td> '
-        '{% endfor %}'
-        '</tr>\n'
-        '<tr> '
-        '<th>Reciprocal</th> '
-        '{% for colheader in colheaders %}'
-            '<td>{{"%1.2e"|format(data[colheader]["reciprocal"])|escape}}</td> '
-        '{% endfor %}'
-        '</tr>\n'
-        '</tfoot>\n'
-        '</table>\n</html>\n')
-    return template.render(data=data, caption=caption, rowheaders=rowheaders, colheaders=colheaders)
+    return render_template(RMP_TABLE_HTML, out, data=data, caption=caption, rowheaders=rowheaders,
+        colheaders=colheaders)
 
 
-def tabulate_rmps(data, samples, table_format, caption, cutoff, theta):
+PMP_THETAS = ['0.0', '0.01', '0.03']
+
+@instrument.hot_path
+def calc_column(task, data):
     """
-    Calculate the random match probabilities and format them into a table
+    Calculate one column of a table
+
+    Keyword arguments:
+    task -- ('rmp', sample, cutoff, theta) for a column of random match probabilities, or
+    ('pmp', sample) for a column of modal profile match probabilities, either optionally followed by
+    the marker kit, see kits.get_kit
+    data -- the allele frequency data
+
+    """
+    if task[0] == 'rmp':
+        return strmarker.calc_rmps(data, task[1], task[2], task[3], *task[4:])
+    column = {}
+    profile = strmarker.get_modal_profile(data, task[1], *task[2:])
+    for theta in PMP_THETAS:
+        column[theta] = 1.0 / strmarker.calc_profile_match_probability(profile, float(theta))
+    return column
+
+
+@instrument.hot_path
+def calc_columns(data, tasks, jobs=1):
+    """
+    Calculate the columns of one or more tables, see calc_column
+
+    With more than one job the columns are calculated in a pool of worker processes, each holding
+    its own copy of the data. The columns are returned in the order of tasks either way.
+
+    Keyword arguments:
+    data -- the allele frequency data
+    tasks -- a list of column tasks
+    jobs -- the number of worker processes, see parallel.imap_tasks
+
+    """
+    return parallel.map_tasks(calc_column, tasks, data, jobs)
+
+
+def format_rmps(columns, samples, table_format, caption, out=None, kit=None):
+    """
+    Format columns of random match probabilities into a table, written to out if it is given, with a
+    row for each marker of the kit (see kits.get_kit)
     """
     table = defaultdict(dict)
-    column_headers = []
-    for sample in samples:
-        column_headers.append(sample)
-        table[sample] = strmarker.calc_rmps(data, sample, cutoff, theta)
+    for sample, column in zip(samples, columns):
+        table[sample] = column
+    markers = list(kits.get_kit(kit).markers)
     if table_format == "html":
-        return rmp_table_html(table, caption, strmarker.SGM_PLUS_MARKERS, column_headers)
+        return rmp_table_html(table, caption, markers, samples, out)
     else:
-        return rmp_table_text(table, caption, strmarker.SGM_PLUS_MARKERS, column_headers)
+        return rmp_table_text(table, caption, markers, samples, out)
 
 
-def tabulate_pmps(data, samples, table_format, caption):
+def format_pmps(columns, samples, table_format, caption, out=None):
     """
-    Calculate the profile match probabilities for the modal profile and format them into a table
+    Format columns of modal profile match probabilities into a table, written to out if it is given
     """
     table = defaultdict(dict)
-    column_headers = []
-    for sample in samples:
-        column_headers.append(sample)
-        profile = strmarker.get_modal_profile(data, sample)
-        table[sample]['0.0'] = 1.0 / strmarker.calc_profile_match_probability(profile, 0.0)
-        table[sample]['0.01'] = 1.0 / strmarker.calc_profile_match_probability(profile, 0.01)
-        table[sample]['0.03'] = 1.0 / strmarker.calc_profile_match_probability(profile, 0.03)
+    for sample, column in zip(samples, columns):
+        table[sample] = column
     if table_format == "html":
-        return pmp_table_html(table, caption, ['0.0', '0.01', '0.03'], column_headers)
+        return pmp_table_html(table, caption, PMP_THETAS, samples, out)
     else:
-        return pmp_table_text(table, caption, ['0.0', '0.01', '0.03'], column_headers)
+        return pmp_table_text(table, caption, PMP_THETAS, samples, out)
+
+
+def tabulate_rmps(data, samples, table_format, caption, cutoff, theta, jobs=1, out=None, kit=None):
+    """
+    Calculate the random match probabilities and format them into a table
+    """
+    kit = kits.get_kit(kit)
+    columns = calc_columns(data, [('rmp', sample, cutoff, theta, kit) for sample in samples], jobs)
+    return format_rmps(columns, samples, table_format, caption, out, kit)
+
+
+def tabulate_pmps(data, samples, table_format, caption, jobs=1, out=None, kit=None):
+    """
+    Calculate the profile match probabilities for the modal profile and format them into a table
+    """
+    kit = kits.get_kit(kit)
+    columns = calc_columns(data, [('pmp', sample, kit) for sample in samples], jobs)
+    return format_pmps(columns, samples, table_format, caption, out)
 
 
 def main():
@@ -260,7 +577,29 @@ def main():
     parser = OptionParser()
     parser.add_option("-t", action="store_true", dest="text_format", default=False, help="use text format tables")
     parser.add_option("-v", action="store_true", dest="verbose", default=False, help="print status messages to stdout")
+    parser.add_option("-j", "--jobs", type="int", dest="jobs", default=1,
+        help="number of worker processes used to calculate the tables, 0 for one per CPU")
+    parser.add_option("-k", "--kit", dest="kit", default=kits.SGM_PLUS.name,
+        help="the marker kit tabulated, one of: %s" % ", ".join(sorted(kits.KITS)))
+    parser.add_option("--profile", dest="profile", metavar="FILE",
+        help="record the calls and timings of the hot paths, cache hit rates and peak memory to a .json file")
+    parser.add_option("--pstats", dest="pstats", metavar="FILE",
+        help="record the calls and timings of the hot paths to a file read by pstats")
+    parser.add_option("--rmp-file", dest="rmp_file", metavar="FILE",
+        help="also write the random match probabilities of every table to FILE, see --export-format")
+    parser.add_option("--pmp-file", dest="pmp_file", metavar="FILE",
+        help="also write the modal profile match probabilities to FILE, see --export-format")
+    parser.add_option("--export-format", dest="export_format", default="csv", choices=["csv", "columnar"],
+        help="format of the --rmp-file and --pmp-file files, csv or columnar")
     (options, args) = parser.parse_args()
+    try:
+        kit = kits.get_kit(options.kit)
+    except ValueError, e:
+        parser.error(str(e))
+    profile = None
+    if options.profile or options.pstats:
+        profile = instrument.Profile()
+        profile.start()
     if options.text_format:
         text_format = "text"
     else:
@@ -271,15 +610,50 @@ def main():
 
     # read in the NIST/JSF allele frequency data
     dataAB = read_csv("../data/ABresults.csv", "AB ", 100)
-    data = dataJFS + dataAB
+    data = frequencies.FrequencyStore(dataJFS + dataAB)
 
     samples = ['JSF AA', 'JSF Cau', 'JSF His', 'AB AA', 'AB Cau']
 
-    print tabulate_rmps(data, samples, text_format, "Raw Probability of Identity values", 0, 0.0)
-    print tabulate_rmps(data, samples, text_format, "Rare alleles pooled", 5, 0.0)
-    print tabulate_rmps(data, samples, text_format, "Theta = 0.01", 5, 0.01)
-    print tabulate_rmps(data, samples, text_format, "Theta = 0.03", 5, 0.03)
-    print tabulate_pmps(data, samples, text_format, "Modal Man")
+    rmp_tables = [("Raw Probability of Identity values", 0, 0.0), ("Rare alleles pooled", 5, 0.0),
+        ("Theta = 0.01", 5, 0.01), ("Theta = 0.03", 5, 0.03)]
+
+    # calculate the columns of every table together, so they can all be shared between the workers
+    tasks = []
+    for caption, cutoff, theta in rmp_tables:
+        tasks.extend([('rmp', sample, cutoff, theta, kit) for sample in samples])
+    tasks.extend([('pmp', sample, kit) for sample in samples])
+    columns = calc_columns(data, tasks, options.jobs)
+
+    # stream each table to stdout as it is rendered
+    for i, (caption, cutoff, theta) in enumerate(rmp_tables):
+        format_rmps(columns[i * len(samples):(i + 1) * len(samples)], samples, text_format, caption, sys.stdout, kit)
+        print
+    format_pmps(columns[-len(samples):], samples, text_format, "Modal Man", sys.stdout)
+    print
+
+    if options.rmp_file:
+        rows = (row for task, column in zip(tasks, columns) if task[0] == 'rmp'
+            for row in columnar.rmp_rows(task[1], task[2], task[3], column, kit.markers))
+        with open(options.rmp_file, "wb") as out:
+            columnar.write_table(rows, out, columnar.RMP_COLUMNS, options.export_format)
+    if options.pmp_file:
+        rows = (row for sample, column in zip(samples, columns[-len(samples):])
+            for row in columnar.pmp_rows(sample, column))
+        with open(options.pmp_file, "wb") as out:
+            columnar.write_table(rows, out, columnar.PMP_COLUMNS, options.export_format)
+
+    if options.verbose:
+        for name, info in sorted(strmarker.cache_info().items()):
+            print "%s cache: %d hits, %d misses, %d entries" % (name, info['hits'], info['misses'], info['size'])
+
+    if profile is not None:
+        profile.stop()
+        if options.profile:
+            profile.dump_json(options.profile)
+        if options.pstats:
+            profile.dump_stats(options.pstats)
+        if options.verbose:
+            print >> sys.stderr, profile.report()
 
 
 if __name__ == "__main__":
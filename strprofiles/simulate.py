@@ -0,0 +1,104 @@
+"""
+simulate
+
+Monte Carlo simulation of random profiles, for the empirical distribution of profile match
+probabilities in a population and the number of adventitious matches in a database.
+"""
+
+import numpy
+
+import dbmatch
+import parallel
+import strmarker
+import synthetic
+
+
+def _simulate_chunk(chunk, args):
+    """
+    Simulate one chunk of profiles, returning the histogram counts, sum, minimum and maximum of their
+    log10 match probabilities, and the hashes of their genotypes
+    """
+    table, size, chunk_size, theta, seed, edges = args
+    n = min(chunk_size, size - chunk * chunk_size)
+    rng = numpy.random.RandomState([seed, chunk])
+    genotypes = synthetic.draw_genotypes(table, n, rng)
+    logs = strmarker.log_match_probabilities(genotypes, table, theta)
+    counts = numpy.histogram(logs, edges)[0]
+    hashes = dbmatch.hash_keys(dbmatch.genotype_keys(genotypes, table.shape[1]))
+    return counts, logs.sum(), logs.min(), logs.max(), hashes
+
+
+def histogram_quantile(edges, counts, q):
+    """
+    Return the q quantile, 0.0 <= q <= 1.0, of a histogram, interpolating linearly within bins, or None
+    if the histogram is empty
+    """
+    cumulative = numpy.concatenate([[0.0], numpy.cumsum(counts, dtype=float)])
+    if not cumulative[-1]:
+        return None
+    return float(numpy.interp(q * cumulative[-1], cumulative, edges))
+
+
+def simulate_profiles(data, name, markers, n, theta=0.0, seed=0, chunk_size=100000, jobs=1, bins=200,
+        quantiles=(0.001, 0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 0.999)):
+    """
+    Simulate a database of random profiles drawn from the named sample set's allele frequencies
+
+    Profiles are drawn with alleles sampled independently from the frequencies, in chunks of
+    chunk_size so the memory used is bounded, each with its own random stream seeded from seed and
+    the chunk's index, see parallel.imap_tasks. For every profile the
+    log10 match probability is found as by strmarker.calc_profile_log_match_probabilities, and the
+    profiles are hashed to count the pairs in the database with identical profiles.
+
+    Keyword arguments:
+    data -- the allele frequency data, a frequencies.FrequencyStore
+    name -- the name of the sample set
+    markers -- the genetic markers to be typed; markers the sample set has no frequencies for are left out
+    n -- the number of profiles
+    theta -- the population subdivision coefficient used for the match probabilities
+    seed -- the random seed
+    chunk_size -- the number of profiles simulated at a time
+    jobs -- the number of worker processes, see parallel.imap_tasks
+    bins -- the number of histogram bins, spanning from the least probable possible profile to 1.0
+    quantiles -- the quantiles of log10 match probability to be reported
+
+    Returns a dict with:
+    'edges', 'counts' -- the histogram of log10 match probability
+    'mean', 'min', 'max' -- the mean, minimum and maximum log10 match probability
+    'quantiles' -- a dict of the requested quantiles, estimated from the histogram
+    'matching_pairs' -- the number of pairs of simulated profiles that match at every marker
+    'expected_matching_pairs' -- the expected number of such pairs, from the marker random match
+    probabilities with theta = 0
+    'markers' -- the markers simulated
+
+    If n is 0 the mean, minimum, maximum and quantiles are None.
+
+    Raises ValueError if the sample set has frequencies for none of the markers.
+
+    """
+    markers = [marker for marker in markers if data.get(name, marker) is not None]
+    if not markers:
+        raise ValueError('sample set %s has no frequencies for any of the markers' % name)
+    table = data.frequency_table(name, markers)
+    smallest = numpy.where(table > 0, table, numpy.inf).min(axis=1)
+    lowest = numpy.floor(numpy.log10(smallest * smallest).sum())
+    edges = numpy.linspace(lowest, 0.0, bins + 1)
+    args = (table, n, chunk_size, theta, seed, edges)
+    chunks = range((n + chunk_size - 1) // chunk_size)
+    results = parallel.map_tasks(_simulate_chunk, chunks, args, jobs)
+
+    counts = numpy.zeros(bins, dtype=int)
+    for r in results:
+        counts += r[0]
+    hashes = numpy.sort(numpy.concatenate([numpy.empty(0, dtype=numpy.uint64)] + [r[4] for r in results]))
+    boundaries = numpy.flatnonzero(numpy.diff(hashes)) + 1
+    sizes = numpy.diff(numpy.concatenate([[0], boundaries, [len(hashes)]]))
+    if n:
+        mean, least, most = sum([r[1] for r in results]) / n, min([r[2] for r in results]), max([r[3] for r in results])
+    else:
+        mean = least = most = None
+    rmp = numpy.prod(strmarker.calc_marker_rmp_array(table / table.sum(axis=1)[:, numpy.newaxis], 0.0))
+    return {'edges': edges, 'counts': counts, 'mean': mean, 'min': least, 'max': most,
+        'quantiles': dict([(q, histogram_quantile(edges, counts, q)) for q in quantiles]),
+        'matching_pairs': int((sizes * (sizes - 1) // 2).sum()),
+        'expected_matching_pairs': n * (n - 1) / 2.0 * rmp, 'markers': markers}
@@ -6,10 +6,25 @@ Utilities for STR (short tandem repeat) genetic markers and allele frequency dat
 
 from operator import itemgetter
 
+import numpy
 
-SGM_PLUS_MARKERS = ['FGA', 'TH01', 'VWA', 'D2S1338', 'D3S1358', 'D8S1179', 'D16S539', 'D18S51', 'D19S433', 'D21S11']
+import frequencies
+import instrument
+import kits
+from memo import LRUCache
 
 
+SGM_PLUS_MARKERS = list(kits.SGM_PLUS.markers)
+
+# sorted allele tables, pooled allele tables and marker random match probabilities calculated from a
+# FrequencyStore, keyed by (store token, name, marker, record version), (..., cutoff) and
+# (..., cutoff, theta)
+SORTED_CACHE = instrument.register_cache('strmarker.sorted', LRUCache(4096))
+POOL_CACHE = instrument.register_cache('strmarker.pool', LRUCache(4096))
+RMP_CACHE = instrument.register_cache('strmarker.rmp', LRUCache(16384))
+
+
+@instrument.hot_path
 def calc_marker_rmp(alleles, theta):
     """
     Calculate the random match probability for at a genetic marker, given the allele frequencies
@@ -19,19 +34,42 @@ def calc_marker_rmp(alleles, theta):
     theta -- the population subdivision coefficient, used to correct for subdivided populations
 
     """
-    rmp = 0.0
+    return calc_marker_rmp_array(alleles.values(), theta)
+
+
+@instrument.hot_path
+def calc_marker_rmp_array(frequencies, theta, mask=None):
+    """
+    Calculate the random match probability at a genetic marker from an array of allele frequencies.
+
+    The Balding and Nichols formulae are summed in closed form, so the cost is linear in the number
+    of alleles. Summing the heterozygote terms over every ordered pair of distinct alleles i, j gives
+    2 * ((sum a_i^2)^2 - sum a_i^4), where a_i = theta + (1 - theta) * p_i.
+
+    Keyword arguments:
+    frequencies -- an array of allele frequencies, the last axis indexing the alleles; any leading
+    axes (eg one row per population) are evaluated in the same pass
+    theta -- the population subdivision coefficient, used to correct for subdivided populations
+    mask -- optional boolean array, the same shape as frequencies, marking which entries are alleles;
+    used when rows with different numbers of alleles are padded into a single array
+
+    """
+    p = numpy.asarray(frequencies, dtype=float)
     denom = (1 + theta) * (1 + 2 * theta)
-    for i in alleles:
-        for j in alleles:
-            if i == j:
-                p = (2 * theta + (1 - theta) * alleles[i]) * (3 * theta + (1 - theta) * alleles[i]) / denom
-                rmp += p * p
-            else:
-                p = (theta + (1 - theta) * alleles[i]) * (theta + (1 - theta) * alleles[j]) / denom
-                rmp += 2 * p * p
+    het = theta + (1 - theta) * p
+    hom = (2 * theta + (1 - theta) * p) * (3 * theta + (1 - theta) * p)
+    if mask is not None:
+        het = numpy.where(mask, het, 0.0)
+        hom = numpy.where(mask, hom, 0.0)
+    het2 = het * het
+    sum2 = het2.sum(axis=-1)
+    rmp = ((hom * hom).sum(axis=-1) + 2 * (sum2 * sum2 - (het2 * het2).sum(axis=-1))) / (denom * denom)
+    if numpy.ndim(rmp) == 0:
+        return float(rmp)
     return rmp
 
 
+@instrument.hot_path
 def pool_alleles(alleles, cutoff, count):
     """
     Pool low frequency alleles together
@@ -59,7 +97,194 @@ def pool_alleles(alleles, cutoff, count):
     return ret
 
 
-def calc_rmps(data, name, cutoff, theta):
+def pool_limit(cutoff, count):
+    """
+    Return the frequency below which alleles are pooled, see pool_alleles
+    """
+    if count != 0:
+        return float(cutoff) / float(count)
+    return float(cutoff)
+
+
+class SortedAlleles(object):
+    """
+    A marker's allele frequencies in increasing order, with their cumulative sums, so that alleles can
+    be pooled for any cutoff with a binary search.
+
+    Pooling, as in pool_alleles, takes alleles in increasing order of frequency while either the
+    allele's frequency or the total pooled so far is below the limit. Both only grow along the sorted
+    order, so the pooled alleles are always a prefix, ending at the first allele whose frequency and
+    preceding cumulative sum have both reached the limit.
+
+    """
+    __slots__ = ('labels', 'frequencies', 'cumulative')
+
+    def __init__(self, alleles):
+        """
+        Keyword arguments:
+        alleles -- a dict of allele frequencies in the form {'value': frequency, ...}
+
+        """
+        items = alleles.items()
+        items.sort(key=itemgetter(1))
+        self.labels = [i[0] for i in items]
+        self.frequencies = numpy.array([i[1] for i in items], dtype=float)
+        # cumulative[i] is the sum of the i lowest frequencies, added in the same order as pool_alleles
+        self.cumulative = numpy.concatenate([[0.0], numpy.cumsum(self.frequencies)])
+
+    def __len__(self):
+        return len(self.labels)
+
+    def pooled_counts(self, limits):
+        """
+        Return the number of alleles pooled for each of an array of frequency limits
+        """
+        limits = numpy.asarray(limits, dtype=float)
+        by_frequency = numpy.searchsorted(self.frequencies, limits, 'left')
+        by_total = numpy.minimum(numpy.searchsorted(self.cumulative, limits, 'left'), len(self))
+        return numpy.maximum(by_frequency, by_total)
+
+    def pool(self, cutoff, count):
+        """
+        Pool low frequency alleles together, returning the same dict as pool_alleles
+
+        Keyword arguments:
+        cutoff -- the minimum size of a frequency bin, items with a frequency lower than this will be pooled
+        count -- the size of the sample from which the frequencies were derived
+
+        """
+        k = int(self.pooled_counts(pool_limit(cutoff, count)))
+        ret = dict(zip(self.labels[k:], self.frequencies[k:].tolist()))
+        other_count = float(self.cumulative[k])
+        if other_count != 0:
+            ret['other'] = other_count
+        return ret
+
+    def pooled_rmps(self, cutoffs, count, theta):
+        """
+        Calculate the random match probability after pooling at each of a sequence of cutoffs
+
+        The pooled tables are padded into a single array, one row per cutoff, and evaluated together
+        with calc_marker_rmp_array.
+
+        """
+        k = self.pooled_counts([pool_limit(cutoff, count) for cutoff in cutoffs])
+        other = self.cumulative[k]
+        padded = numpy.empty((len(k), len(self) + 1))
+        padded[:, 0] = other
+        padded[:, 1:] = self.frequencies
+        mask = numpy.arange(-1, len(self)) >= k[:, numpy.newaxis]
+        mask[:, 0] = other != 0
+        return calc_marker_rmp_array(padded, theta, mask)
+
+
+def cache_info():
+    """
+    Return the hit and miss counts and sizes of the sorted allele table, pooled allele table and marker
+    RMP caches
+    """
+    return {'sorted': SORTED_CACHE.info(), 'pool': POOL_CACHE.info(), 'rmp': RMP_CACHE.info()}
+
+
+def clear_caches():
+    """
+    Discard all cached sorted and pooled allele tables and marker random match probabilities
+    """
+    SORTED_CACHE.clear()
+    POOL_CACHE.clear()
+    RMP_CACHE.clear()
+
+
+@instrument.hot_path
+def sorted_alleles(data, d):
+    """
+    Return the SortedAlleles of a marker's allele frequency record, cached as for pooled_alleles
+    """
+    token = getattr(data, 'token', None)
+    if token is None:
+        return SortedAlleles(d['alleles'])
+    key = (token, d.name, d.marker, d.version)
+    ret = SORTED_CACHE.get(key)
+    if ret is None:
+        ret = SortedAlleles(d['alleles'])
+        SORTED_CACHE.put(key, ret)
+    return ret
+
+
+@instrument.hot_path
+def pooled_alleles(data, d, cutoff):
+    """
+    Pool the low frequency alleles of a marker's allele frequency record, see pool_alleles
+
+    When data is a frequencies.FrequencyStore, the pooled allele table is cached, and is found from
+    the record's cached SortedAlleles rather than by sorting its alleles again. Cached entries are
+    keyed by the store's token and the record's version, so adding or replacing frequencies in the
+    store invalidates them; clear_caches discards everything. Each call returns a new dict, which the
+    caller may modify without changing the cached table.
+
+    Keyword arguments:
+    data -- the allele frequency data that d was selected from
+    d -- the allele frequency record for the marker
+    cutoff -- the minimum size of a frequency bin, items with a frequency lower than this will be pooled
+
+    """
+    token = getattr(data, 'token', None)
+    if token is None:
+        # note, count doubled since two allele values per person in sample
+        return pool_alleles(d['alleles'], cutoff, 2 * d['count'])
+    key = (token, d.name, d.marker, d.version, cutoff)
+    alleles = POOL_CACHE.get(key)
+    if alleles is None:
+        alleles = sorted_alleles(data, d).pool(cutoff, 2 * d['count'])
+        POOL_CACHE.put(key, alleles)
+    return dict(alleles)
+
+
+@instrument.hot_path
+def calc_pooled_marker_rmp(data, d, cutoff, theta):
+    """
+    Calculate the random match probability at a marker after pooling its low frequency alleles
+
+    When data is a frequencies.FrequencyStore, the result is cached in the same way as the pooled
+    allele table, see pooled_alleles.
+
+    Keyword arguments:
+    data -- the allele frequency data that d was selected from
+    d -- the allele frequency record for the marker
+    cutoff -- the minimum size of a frequency bin, items with a frequency lower than this will be pooled
+    theta -- the population subdivision coefficient, used to correct for subdivided populations
+
+    """
+    token = getattr(data, 'token', None)
+    if token is None:
+        return calc_marker_rmp_array(pooled_alleles(data, d, cutoff).values(), theta)
+    key = (token, d.name, d.marker, d.version, cutoff, theta)
+    p = RMP_CACHE.get(key)
+    if p is None:
+        p = calc_marker_rmp_array(pooled_alleles(data, d, cutoff).values(), theta)
+        RMP_CACHE.put(key, p)
+    return p
+
+
+def select_markers(data, name, markers):
+    """
+    Return the allele frequency records for the named sample set at the given markers
+
+    Keyword arguments:
+    data -- the allele frequency data, either a frequencies.FrequencyStore, which is looked up by
+    key, or a list of dicts in the form returned by sgm.read_csv, which is scanned
+    name -- the name of the sample set to be used
+    markers -- the genetic markers to be selected
+
+    """
+    if hasattr(data, 'select'):
+        return data.select(name, markers)
+    markers = frozenset(markers)
+    return [d for d in data if d['name'] == name and d['marker'] in markers]
+
+
+@instrument.hot_path
+def calc_rmps(data, name, cutoff, theta, kit=None):
     """
     Calculate the random match probabilities for each genetic marker for the named sample set
 
@@ -68,44 +293,208 @@ def calc_rmps(data, name, cutoff, theta):
     name -- the name of the sample set to be used
     cutoff -- the minimum size of a frequency bin, items with a frequency lower than this will be pooled
     theta -- the population subdivision coefficient, used to correct for subdivided populations
+    kit -- the marker kit, see kits.get_kit; defaults to SGM Plus
+
+    Raises ValueError if the sample set has frequencies for none of the kit's markers.
 
     """
     ret = {}
     rmp = 1.0
-    for d in data:
-        if d['name'] == name and d['marker'] in SGM_PLUS_MARKERS:
-            count = d['count']
-            # note, count doubled since two allele values per person in sample
-            alleles = pool_alleles(d['alleles'], cutoff, 2 * count)
-            p = calc_marker_rmp(alleles, theta)
-            ret[d['marker']] = p
-            rmp *= p
+    count = None
+    markers = kits.get_kit(kit).markers
+    for d in select_markers(data, name, markers):
+        count = d['count']
+        p = calc_pooled_marker_rmp(data, d, cutoff, theta)
+        ret[d['marker']] = p
+        rmp *= p
+    if not ret:
+        raise ValueError('sample set %s has none of the markers %s' % (name, ', '.join(markers)))
     ret['count'] = count
     ret['combined'] = rmp
     ret['reciprocal'] = 1.0 / rmp
     return ret
 
 
-def get_modal_profile(data, name):
+@instrument.hot_path
+def calc_kit_rmps(data, name, cutoff, theta, kit_list):
+    """
+    Calculate the random match probabilities of the named sample set for several marker kits
+
+    The random match probability of each marker is calculated once, for every marker of the store
+    that any of the kits has, and each kit's results are gathered with its marker indexes into the
+    store, see kits.Kit.indexes.
+
+    Keyword arguments:
+    data -- the allele frequency data; a list of records is indexed in a frequencies.FrequencyStore
+    name -- the name of the sample set to be used
+    cutoff -- the minimum size of a frequency bin, items with a frequency lower than this will be pooled
+    theta -- the population subdivision coefficient, used to correct for subdivided populations
+    kit_list -- the marker kits, see kits.get_kit
+
+    Returns a dict keyed by kit name (or by position in kit_list for unregistered kits), each in the
+    form returned by calc_rmps. Raises ValueError if the sample set has none of the markers of a kit.
+
+    """
+    if not hasattr(data, 'marker_indexes'):
+        data = frequencies.FrequencyStore(data)
+    kit_list = [kits.get_kit(kit) for kit in kit_list]
+    markers = data.markers()
+    indexes = [kit.indexes(data) for kit in kit_list]
+    used = numpy.zeros(len(markers), dtype=bool)
+    for i in indexes:
+        used[i[i >= 0]] = True
+    rmps = numpy.empty(len(markers))
+    rmps.fill(numpy.nan)
+    counts = [None] * len(markers)
+    for d in select_markers(data, name, [markers[j] for j in numpy.flatnonzero(used)]):
+        j = markers.index(d['marker'])
+        rmps[j] = calc_pooled_marker_rmp(data, d, cutoff, theta)
+        counts[j] = d['count']
+    ret = {}
+    for position, (kit, i) in enumerate(zip(kit_list, indexes)):
+        i = i[i >= 0]
+        i = i[~numpy.isnan(rmps[i])]
+        if not len(i):
+            raise ValueError('sample set %s has none of the markers %s' % (name, ', '.join(kit.markers)))
+        result = dict([(markers[j], rmps[j]) for j in i.tolist()])
+        result['count'] = counts[i[-1]]
+        result['combined'] = rmp = float(numpy.prod(rmps[i]))
+        result['reciprocal'] = 1.0 / rmp
+        ret[position if kit.name is None else kit.name] = result
+    return ret
+
+
+@instrument.hot_path
+def calc_cutoff_sweep(data, name, cutoffs, theta, kit=None):
+    """
+    Calculate the pooled allele tables and random match probabilities of each genetic marker for the
+    named sample set at each of a sequence of cutoffs, see SortedAlleles
+
+    Keyword arguments:
+    data -- the allele frequency data
+    name -- the name of the sample set to be used
+    cutoffs -- the minimum sizes of a frequency bin to be swept
+    theta -- the population subdivision coefficient, used to correct for subdivided populations
+    kit -- the marker kit, see kits.get_kit; defaults to SGM Plus
+
+    Returns a dict keyed by marker, each a dict with 'alleles', the list of pooled allele tables as
+    returned by pool_alleles, and 'rmp', an array of random match probabilities, one per cutoff; and
+    'combined', the array of the products of the markers' random match probabilities.
+
+    """
+    ret = {}
+    combined = numpy.ones(len(cutoffs))
+    for d in select_markers(data, name, kits.get_kit(kit).markers):
+        # note, count doubled since two allele values per person in sample
+        count = 2 * d['count']
+        alleles = sorted_alleles(data, d)
+        rmp = alleles.pooled_rmps(cutoffs, count, theta)
+        ret[d['marker']] = {'alleles': [alleles.pool(cutoff, count) for cutoff in cutoffs], 'rmp': rmp}
+        combined *= rmp
+    ret['combined'] = combined
+    return ret
+
+
+def _square_quadratic(c):
+    """
+    Square polynomials of degree 2, their coefficients in increasing order along the last axis
+    """
+    c0, c1, c2 = c[..., 0], c[..., 1], c[..., 2]
+    return numpy.concatenate([x[..., numpy.newaxis] for x in
+        [c0 * c0, 2 * c0 * c1, c1 * c1 + 2 * c0 * c2, 2 * c1 * c2, c2 * c2]], axis=-1)
+
+
+@instrument.hot_path
+def calc_rmp_cube(data, names, cutoff, thetas, kit=None):
+    """
+    Calculate the random match probabilities for each genetic marker, for several sample sets and a
+    grid of theta values, in one pass
+
+    As a function of theta the Balding and Nichols marker random match probability is N(theta) / D(theta)^2,
+    where D(theta) = (1 + theta) * (1 + 2 * theta) and N is a polynomial of degree 4. The coefficients
+    of N are found once for each sample set and marker, from the pooled allele frequencies, and N is
+    then evaluated at every theta together.
+
+    Keyword arguments:
+    data -- the allele frequency data
+    names -- the names of the sample sets to be used
+    cutoff -- the minimum size of a frequency bin, items with a frequency lower than this will be pooled
+    thetas -- a sequence of population subdivision coefficients
+    kit -- the marker kit, see kits.get_kit; defaults to SGM Plus
+
+    Returns a dict with:
+    'rmp' -- an array of shape (names, markers, thetas) of marker random match probabilities, NaN
+    where a sample set has no frequencies for a marker; markers are in the order of the kit
+    'combined' -- an array of shape (names, thetas), the product over the markers
+    'reciprocal' -- 1.0 / combined
+    'count' -- a list of the sample sizes, one per name
+
+    Raises ValueError if a sample set has frequencies for none of the kit's markers.
+
+    """
+    markers = list(kits.get_kit(kit).markers)
+    theta = numpy.asarray(thetas, dtype=float)
+    tables = []
+    counts = []
+    for name in names:
+        row = [None] * len(markers)
+        count = None
+        for d in select_markers(data, name, markers):
+            count = d['count']
+            row[markers.index(d['marker'])] = pooled_alleles(data, d, cutoff).values()
+        if row.count(None) == len(row):
+            raise ValueError('sample set %s has none of the markers %s' % (name, ', '.join(markers)))
+        tables.append(row)
+        counts.append(count)
+    width = max([len(alleles) for row in tables for alleles in row if alleles is not None] + [1])
+    p = numpy.zeros((len(names), len(markers), width))
+    mask = numpy.zeros(p.shape, dtype=bool)
+    for i, row in enumerate(tables):
+        for j, alleles in enumerate(row):
+            if alleles is not None:
+                p[i, j, :len(alleles)] = alleles
+                mask[i, j, :len(alleles)] = True
+    p = p[..., numpy.newaxis]
+    mask = mask[..., numpy.newaxis]
+    # coefficients in theta of a^2, where a = theta + (1 - theta) * p, and of the homozygote term
+    # h = (2 * theta + (1 - theta) * p) * (3 * theta + (1 - theta) * p)
+    het2 = numpy.where(mask, numpy.concatenate([p * p, 2 * p * (1 - p), (1 - p) * (1 - p)], axis=-1), 0.0)
+    hom = numpy.where(mask, numpy.concatenate([p * p, p * (5 - 2 * p), (2 - p) * (3 - p)], axis=-1), 0.0)
+    sum2 = het2.sum(axis=2)
+    numer = _square_quadratic(hom).sum(axis=2) + 2 * (_square_quadratic(sum2) - _square_quadratic(het2).sum(axis=2))
+    powers = theta[numpy.newaxis, :] ** numpy.arange(5)[:, numpy.newaxis]
+    denom = (1 + theta) * (1 + 2 * theta)
+    rmp = numpy.dot(numer, powers) / (denom * denom)
+    present = numpy.array([[alleles is not None for alleles in row] for row in tables], dtype=bool)
+    rmp[~present] = numpy.nan
+    combined = numpy.where(numpy.isnan(rmp), 1.0, rmp).prod(axis=1)
+    return {'rmp': rmp, 'combined': combined, 'reciprocal': 1.0 / combined, 'count': counts}
+
+
+@instrument.hot_path
+def get_modal_profile(data, name, kit=None):
     """
     Find the modal profile for in the named sample set.
 
+    Keyword arguments:
+    kit -- the marker kit, see kits.get_kit; defaults to SGM Plus
+
     """
     profile = {}
-    for d in data:
-        if d['name'] == name and d['marker'] in SGM_PLUS_MARKERS:
-            items = d['alleles'].items()
-            items.sort(key=itemgetter(1))
-            items.reverse()
-            p = items[0][1]
-            q = items[1][1]
-            if p * p > 2 * p * q:
-                profile[d['marker']] = ((items[0][0], p), (items[0][0], p))
-            else:
-                profile[d['marker']] = ((items[0][0], p), (items[1][0], q))
+    for d in select_markers(data, name, kits.get_kit(kit).markers):
+        items = d['alleles'].items()
+        items.sort(key=itemgetter(1))
+        items.reverse()
+        p = items[0][1]
+        q = items[1][1]
+        if p * p > 2 * p * q:
+            profile[d['marker']] = ((items[0][0], p), (items[0][0], p))
+        else:
+            profile[d['marker']] = ((items[0][0], p), (items[1][0], q))
     return profile
 
 
+@instrument.hot_path
 def calc_profile_match_probability(profile, theta):
     """
     Calculate the probability that a random individual matches the given profile
@@ -128,3 +517,61 @@ def calc_profile_match_probability(profile, theta):
         pmp *= mp
         #print marker, round(mp, 4)
     return pmp
+
+
+@instrument.hot_path
+def calc_profile_log_match_probabilities(genotypes, data, name, markers, thetas, chunk_size=65536,
+        minimum_frequency=0.0):
+    """
+    Calculate, for many profiles at once, the log10 probability that a random individual matches
+    each profile
+
+    The Balding and Nichols formulae of calc_profile_match_probability are evaluated over the whole
+    genotype array, one chunk of profiles at a time to bound the memory used. Working in log space
+    avoids underflow when many markers are combined.
+
+    Keyword arguments:
+    genotypes -- an integer array of shape (profiles, markers, 2), as returned by
+    FrequencyStore.encode_profiles; markers encoded -1 are untyped and do not contribute
+    data -- the allele frequency data, a frequencies.FrequencyStore
+    name -- the name of the sample set to be used
+    markers -- the genetic markers corresponding to the second axis of genotypes
+    thetas -- a population subdivision coefficient, or a sequence of them
+    chunk_size -- the number of profiles evaluated in each pass
+    minimum_frequency -- the lowest frequency used for any allele, eg for alleles not seen in the
+    sample set
+
+    Returns an array of shape (profiles,) for a single theta, or (profiles, thetas) for a sequence.
+
+    """
+    table = data.frequency_table(name, markers, minimum_frequency)
+    return log_match_probabilities(genotypes, table, thetas, chunk_size)
+
+
+@instrument.hot_path
+def log_match_probabilities(genotypes, table, thetas, chunk_size=65536):
+    """
+    Calculate the log10 match probabilities of an integer genotype array, given a table of allele
+    frequencies of shape (markers, codes) as returned by FrequencyStore.frequency_table; see
+    calc_profile_log_match_probabilities
+    """
+    genotypes = numpy.asarray(genotypes)
+    theta = numpy.atleast_1d(numpy.asarray(thetas, dtype=float))
+    rows = numpy.arange(len(table))
+    denom = (1 + theta) * (1 + 2 * theta)
+    ret = numpy.empty((len(genotypes), len(theta)))
+    for start in range(0, len(genotypes), chunk_size):
+        chunk = genotypes[start:start + chunk_size]
+        a = chunk[:, :, 0]
+        b = chunk[:, :, 1]
+        typed = ((a >= 0) & (b >= 0))[:, :, numpy.newaxis]
+        p = table[rows, numpy.maximum(a, 0)][:, :, numpy.newaxis]
+        q = table[rows, numpy.maximum(b, 0)][:, :, numpy.newaxis]
+        hom = (2 * theta + (1 - theta) * p) * (3 * theta + (1 - theta) * p)
+        het = 2 * (theta + (1 - theta) * p) * (theta + (1 - theta) * q)
+        mp = numpy.where((a == b)[:, :, numpy.newaxis], hom, het) / denom
+        with numpy.errstate(divide='ignore'):
+            ret[start:start + chunk_size] = numpy.where(typed, numpy.log10(mp), 0.0).sum(axis=1)
+    if numpy.ndim(thetas) == 0:
+        return ret[:, 0]
+    return ret
@@ -0,0 +1,125 @@
+"""
+synthetic
+
+Generation of synthetic allele frequency data and profiles, for benchmarking and testing.
+"""
+
+import numpy
+
+import sgm
+import strmarker
+
+
+def marker_names(loci):
+    """
+    Return the names of the given number of genetic markers, the SGM Plus markers followed by
+    made up names
+    """
+    names = strmarker.SGM_PLUS_MARKERS[:loci]
+    return names + ['L%02d' % i for i in range(len(names), loci)]
+
+
+def allele_labels(n_alleles):
+    """
+    Return n_alleles allele values, whole repeats interleaved with .2 microvariants, eg '6', '6.2', '7', ...
+    """
+    return ['%d%s' % (6 + i // 2, '.2' if i % 2 else '') for i in range(n_alleles)]
+
+
+def random_frequencies(n_alleles, rng):
+    """
+    Return a dict of random allele frequencies, summing to 1.0, in the form {'value': frequency, ...}
+
+    Keyword arguments:
+    n_alleles -- the number of alleles
+    rng -- a numpy.random.RandomState
+
+    """
+    frequencies = rng.dirichlet(numpy.ones(n_alleles))
+    return dict(zip(allele_labels(n_alleles), frequencies.tolist()))
+
+
+def frequency_data(populations, loci, n_alleles, seed=0):
+    """
+    Generate random allele frequency data, in the form returned by sgm.read_csv
+
+    Keyword arguments:
+    populations -- the number of sample sets, named 'P0', 'P1', ...
+    loci -- the number of genetic markers, see marker_names
+    n_alleles -- the number of alleles at each marker
+    seed -- the random seed
+
+    """
+    rng = numpy.random.RandomState(seed)
+    data = []
+    for marker in marker_names(loci):
+        for i in range(populations):
+            data.append({'marker': marker, 'name': 'P%d' % i, 'count': int(rng.randint(100, 500)),
+                'alleles': random_frequencies(n_alleles, rng)})
+    return data
+
+
+def write_csv(csvfile, data):
+    """
+    Write allele frequency data, in the form returned by sgm.read_csv, as a .csv file in the format
+    read by sgm.read_csv, see sgm.write_frequencies
+    """
+    sgm.write_frequencies(csvfile, data)
+
+
+def draw_genotypes(table, n, rng):
+    """
+    Draw random genotypes, with alleles sampled independently from the given frequencies
+
+    Keyword arguments:
+    table -- an array of allele frequencies of shape (markers, codes), as returned by
+    FrequencyStore.frequency_table
+    n -- the number of genotypes to draw
+    rng -- a numpy.random.RandomState
+
+    Returns an integer genotype array of shape (n, markers, 2).
+
+    """
+    cumulative = numpy.cumsum(table, axis=1)
+    cumulative /= cumulative[:, -1:]
+    genotypes = numpy.empty((n, len(table), 2), dtype=numpy.int32)
+    for j in range(len(table)):
+        codes = numpy.searchsorted(cumulative[j], rng.random_sample((n, 2)), side='right')
+        genotypes[:, j, :] = numpy.minimum(codes, table.shape[1] - 1)
+    return genotypes
+
+
+def random_profiles(data, name, markers, n, seed=0):
+    """
+    Draw random profiles from the named sample set's allele frequencies
+
+    Keyword arguments:
+    data -- the allele frequency data, a frequencies.FrequencyStore
+    name -- the name of the sample set
+    markers -- the genetic markers to be typed
+    n -- the number of profiles
+    seed -- the random seed
+
+    Returns an integer genotype array of shape (n, markers, 2), see FrequencyStore.encode_profiles.
+
+    """
+    rng = numpy.random.RandomState(seed)
+    return draw_genotypes(data.frequency_table(name, markers), n, rng)
+
+
+def decode_profiles(data, name, markers, genotypes):
+    """
+    Convert an integer genotype array into profiles in the form used by
+    strmarker.calc_profile_match_probability, {'marker': ((value, frequency), (value, frequency)), ...}
+    """
+    labels = [data.allele_labels(marker) for marker in markers]
+    table = data.frequency_table(name, markers)
+    profiles = []
+    for g in genotypes.tolist():
+        profile = {}
+        for j, marker in enumerate(markers):
+            a, b = g[j]
+            if a >= 0 and b >= 0:
+                profile[marker] = ((labels[j][a], table[j, a]), (labels[j][b], table[j, b]))
+        profiles.append(profile)
+    return profiles
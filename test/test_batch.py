@@ -0,0 +1,84 @@
+"""
+batch test module.
+"""
+
+import json
+import math
+import os
+import subprocess
+import sys
+import unittest
+from StringIO import StringIO
+
+from strprofiles import batch
+from strprofiles import frequencies
+from strprofiles import strmarker
+
+
+class BatchTestCase(unittest.TestCase):
+    """
+    Test scoring streams of profiles.
+    """
+    def setUp(self):
+        """Make allele frequency data available for all test functions."""
+        self.data = frequencies.FrequencyStore([
+            {'name': 'AB', 'count': 200, 'marker': 'FGA', 'alleles': {'20': 0.2, '21': 0.5, '22': 0.3}},
+            {'name': 'AB', 'count': 200, 'marker': 'TH01', 'alleles': {'6': 0.4, '9.3': 0.6}},
+            {'name': 'CD', 'count': 100, 'marker': 'FGA', 'alleles': {'20': 0.6, '21': 0.4}}])
+
+    def testIterProfiles(self):
+        """profiles read from JSON lines and .csv"""
+        jsonl = StringIO('{"id": "x", "profile": {"FGA": ["20", "21"]}}\n\n{"TH01": ["6", "9.3"]}\n')
+        self.assertEqual(list(batch.iter_profiles(jsonl)), [('x', {'FGA': ('20', '21')}), (2, {'TH01': ('6', '9.3')})])
+        text = StringIO('id,FGA,TH01\nx,20/21,\ny,"22,22",6/9.3\n')
+        self.assertEqual(list(batch.iter_profiles(text, 'csv')), [('x', {'FGA': ('20', '21')}),
+            ('y', {'FGA': ('22', '22'), 'TH01': ('6', '9.3')})])
+
+    def testBadLines(self):
+        """lines that are not profiles are reported with their line numbers and skipped"""
+        jsonl = '{"id": 1}\nnot json\n[1, 2]\n{"FGA": 21}\n{"id": 5, "profile": {"FGA": ["20", "21"]}}\n'
+        errors = []
+        self.assertEqual(list(batch.iter_profiles(StringIO(jsonl), errors=errors)), [(5, {'FGA': ('20', '21')})])
+        self.assertEqual([number for number, message in errors], [1, 2, 3, 4])
+        self.assertEqual(errors[0][1], 'no profile')
+        self.assertRaises(ValueError, list, batch.iter_profiles(StringIO(jsonl)))
+        errors = []
+        text = StringIO('id,FGA\nx,20/21/22\ny,20/21\n')
+        self.assertEqual(list(batch.iter_profiles(text, 'csv', errors)), [('y', {'FGA': ('20', '21')})])
+        self.assertEqual([number for number, message in errors], [2])
+
+    def testScoreProfiles(self):
+        """scores match calc_profile_match_probability, chunk by chunk"""
+        profiles = [(i, {'FGA': (a, '21'), 'TH01': ('6', '6')}) for i, a in enumerate(['20', '21', '22'])]
+        chunks = list(batch.score_profiles(self.data, profiles, ['AB', 'CD'], [0.0, 0.01], chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [8, 4])
+        scores = dict([((i, name, theta), log10) for chunk in chunks for i, name, theta, log10 in chunks[0] + chunk])
+        for i, profile in profiles:
+            for theta in (0.0, 0.01):
+                alleles = self.data.get('AB', 'FGA').alleles
+                expected = strmarker.calc_profile_match_probability({'FGA': [(a, alleles[a]) for a in profile['FGA']],
+                    'TH01': [('6', 0.4), ('6', 0.4)]}, theta)
+                self.assertAlmostEqual(scores[(i, 'AB', theta)], math.log10(expected))
+        # CD has no TH01 frequencies, and no allele 22
+        self.assertAlmostEqual(scores[(0, 'CD', 0.0)], math.log10(2 * 0.6 * 0.4))
+        self.assertEqual(scores[(2, 'CD', 0.0)], float('-inf'))
+
+        out = StringIO()
+        batch.write_scores(chunks[1], out)
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(lines[0]['id'], 2)
+        self.assertEqual(lines[-2]['log10'], None)
+        out = StringIO()
+        batch.write_scores(chunks[1], out, 'csv')
+        self.assertEqual(out.getvalue().splitlines()[-2], '2,CD,0.0,,')
+
+    def testLazyImports(self):
+        """jinja2 is not imported until a table is rendered"""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output([sys.executable, '-c',
+            'import sys; from strprofiles import batch; print "jinja2" in sys.modules'], cwd=root)
+        self.assertEqual(output.strip(), 'False')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+benchmark and synthetic test module.
+"""
+
+import unittest
+from StringIO import StringIO
+
+import numpy
+
+from strprofiles import benchmark
+from strprofiles import frequencies
+from strprofiles import sgm
+from strprofiles import synthetic
+
+
+class SyntheticTestCase(unittest.TestCase):
+    """
+    Test the synthetic data generator.
+    """
+    def testFrequencyData(self):
+        """synthetic frequency data survives a round trip through a .csv file"""
+        data = synthetic.frequency_data(3, 12, 8, seed=1)
+        self.assertEqual(len(data), 36)
+        self.assertEqual(data[-1]['marker'], 'L11')
+        for d in data:
+            self.assertEqual(len(d['alleles']), 8)
+            self.assertAlmostEqual(sum(d['alleles'].values()), 1.0)
+        csvfile = StringIO()
+        synthetic.write_csv(csvfile, data)
+        csvfile.seek(0)
+        self.assertEqual(list(sgm.iter_csv(csvfile, '', 1)), data)
+
+    def testRandomProfiles(self):
+        """random profiles follow the allele frequencies"""
+        store = frequencies.FrequencyStore([{'name': 'P', 'count': 100, 'marker': 'FGA',
+            'alleles': {'20': 0.1, '21': 0.9}}])
+        genotypes = synthetic.random_profiles(store, 'P', ['FGA'], 10000, seed=2)
+        self.assertEqual(genotypes.shape, (10000, 1, 2))
+        code = store.allele_labels('FGA').index('20')
+        self.assertAlmostEqual(numpy.mean(genotypes == code), 0.1, 1)
+        profiles = synthetic.decode_profiles(store, 'P', ['FGA'], genotypes[:2])
+        self.assertEqual(len(profiles), 2)
+        self.assertTrue(profiles[0]['FGA'][0] in [('20', 0.1), ('21', 0.9)])
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    """
+    Test running benchmarks and comparing them with a baseline.
+    """
+    def testRunBenchmarks(self):
+        """run a benchmark at a small scale"""
+        config = benchmark.Config(populations=2, loci=3, alleles=4, profiles=10, repeat=1)
+        results = benchmark.run_benchmarks(config, ['bench_calc_rmps', 'bench_read_csv'])
+        self.assertEqual(sorted(results), ['bench_calc_rmps', 'bench_read_csv'])
+        self.assertEqual(results['bench_calc_rmps']['items'], 2)
+        self.assertEqual(results['bench_read_csv']['items'], 6)
+        self.assertTrue('bench_calc_rmps' in benchmark.format_results(results, results))
+
+    def testCompare(self):
+        """regressions beyond the tolerance are reported"""
+        baseline = {'a': {'seconds': 1.0}, 'b': {'seconds': 1.0}}
+        results = {'a': {'seconds': 1.1}, 'b': {'seconds': 1.5}, 'c': {'seconds': 9.0}}
+        self.assertEqual(benchmark.compare(results, baseline, 0.2), [('b', 1.5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
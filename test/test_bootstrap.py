@@ -0,0 +1,64 @@
+"""
+bootstrap test module.
+"""
+
+import unittest
+
+import numpy
+
+from strprofiles import bootstrap
+from strprofiles import frequencies
+from strprofiles import strmarker
+
+
+class BootstrapTestCase(unittest.TestCase):
+    """
+    Test bootstrap confidence intervals for random match probabilities.
+    """
+    def setUp(self):
+        """Make allele frequency data available for all test functions."""
+        fga = {'18': 0.015, '19': 0.0625, '20': 0.1625, '20.2': 0.0075, '21': 0.1775, '22': 0.165,
+            '22.2': 0.005, '23': 0.14, '24': 0.1325, '25': 0.1125, '26': 0.015, '27': 0.005}
+        th01 = {'6': 0.2525, '7': 0.16, '8': 0.0925, '9': 0.1375, '9.3': 0.35, '10': 0.0075}
+        self.data = frequencies.FrequencyStore([
+            {'name': 'AB', 'count': 200, 'marker': 'FGA', 'alleles': fga},
+            {'name': 'AB', 'count': 200, 'marker': 'TH01', 'alleles': th01},
+            {'name': 'CD', 'count': 20000, 'marker': 'FGA', 'alleles': fga},
+            {'name': 'EF', 'marker': 'FGA', 'alleles': fga}])
+
+    def testPooledRmps(self):
+        """batched pooling matches strmarker.SortedAlleles for tables without zero frequencies"""
+        alleles = self.data.get('AB', 'FGA').alleles
+        table = strmarker.SortedAlleles(alleles)
+        rows = numpy.array([alleles.values(), alleles.values()[::-1]])
+        for cutoff in (0, 1, 5, 20, 400):
+            for theta in (0.0, 0.03):
+                expected = table.pooled_rmps([cutoff], 400, theta)[0]
+                result = bootstrap.pooled_rmps(rows, strmarker.pool_limit(cutoff, 400), theta)
+                self.assertAlmostEqual(result[0], expected, 12)
+                self.assertAlmostEqual(result[1], expected, 12)
+        # alleles not drawn in a replicate are left out
+        result = bootstrap.pooled_rmps(numpy.array([[0.0, 0.5, 0.5]]), 0.0, 0.01)
+        self.assertAlmostEqual(result[0], strmarker.calc_marker_rmp({'a': 0.5, 'b': 0.5}, 0.01))
+
+    def testIntervals(self):
+        """intervals contain the estimates, and narrow with the sample size"""
+        result = bootstrap.bootstrap_rmps(self.data, 'AB', 5, 0.01, 2000)
+        self.assertEqual(result['count'], 200)
+        for key in ('FGA', 'TH01', 'combined'):
+            interval = result[key]
+            self.assertTrue(interval['lower'] < interval['estimate'] < interval['upper'])
+            self.assertTrue(interval['bound'] < interval['upper'])
+        large = bootstrap.bootstrap_rmps(self.data, 'CD', 5, 0.01, 2000)['FGA']
+        self.assertLess(large['upper'] - large['lower'], (result['FGA']['upper'] - result['FGA']['lower']) / 5)
+        self.assertRaises(ValueError, bootstrap.bootstrap_rmps, self.data, 'EF', 5, 0.01)
+
+    def testReproducible(self):
+        """results depend on the seed, but not on the number of jobs"""
+        serial = bootstrap.bootstrap_samples(self.data, ['AB', 'CD'], 5, 0.01, 200, seed=3)
+        self.assertEqual(bootstrap.bootstrap_samples(self.data, ['AB', 'CD'], 5, 0.01, 200, seed=3, jobs=2), serial)
+        self.assertNotEqual(bootstrap.bootstrap_samples(self.data, ['AB', 'CD'], 5, 0.01, 200, seed=4), serial)
+
+
+if __name__ == '__main__':
+    unittest.main()
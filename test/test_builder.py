@@ -0,0 +1,118 @@
+"""
+builder test module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from strprofiles import builder
+from strprofiles import frequencies
+from strprofiles import sgm
+from strprofiles import strmarker
+
+
+GENOTYPES_CSV = ('id,population,FGA,TH01\n'
+    's1,Cau,20/21,6/9.3\n'
+    's2,Cau,21/21,9.3/9.3\n'
+    's3,AA,22/23,\n')
+
+
+class BuilderTestCase(unittest.TestCase):
+    """
+    Test building allele frequencies from raw genotypes.
+    """
+    def testCounts(self):
+        """counts and frequencies from .csv and JSON lines genotypes"""
+        counts = builder.AlleleCounts().add_profiles(builder.iter_genotypes(StringIO(GENOTYPES_CSV)))
+        self.assertEqual(counts.counts('Cau', 'FGA'), {'20': 1, '21': 3})
+        self.assertEqual(counts.samples('AA', 'TH01'), 0)
+        data = counts.data()
+        self.assertEqual([(d['name'], d['marker'], d['count']) for d in data],
+            [('Cau', 'FGA', 2), ('Cau', 'TH01', 2), ('AA', 'FGA', 1)])
+        self.assertEqual(data[0]['alleles'], {'20': 0.25, '21': 0.75})
+
+        jsonl = StringIO('{"population": "Cau", "profile": {"FGA": ["20", "21"], "TH01": ["6", "9.3"]}}\n')
+        self.assertEqual(list(builder.iter_genotypes(jsonl, 'jsonl')),
+            [('Cau', {'FGA': ('20', '21'), 'TH01': ('6', '9.3')})])
+
+    def testIncrementalUpdates(self):
+        """updating a store replaces only the changed records, invalidating their cached RMPs"""
+        counts = builder.AlleleCounts().add_profiles(builder.iter_genotypes(StringIO(GENOTYPES_CSV)))
+        store = frequencies.FrequencyStore()
+        self.assertEqual(counts.update_store(store), 3)
+        strmarker.clear_caches()
+        before = strmarker.calc_rmps(store, 'Cau', 0, 0.0)
+        self.assertAlmostEqual(before['FGA'], strmarker.calc_marker_rmp({'20': 0.25, '21': 0.75}, 0.0))
+
+        version = store.get('Cau', 'TH01').version
+        counts.add_profile('Cau', {'FGA': ('20', '20')})
+        self.assertEqual(counts.update_store(store), 1)
+        self.assertEqual(store.get('Cau', 'TH01').version, version)
+        after = strmarker.calc_rmps(store, 'Cau', 0, 0.0)
+        self.assertEqual(after['TH01'], before['TH01'])
+        self.assertAlmostEqual(after['FGA'], strmarker.calc_marker_rmp({'20': 0.5, '21': 0.5}, 0.0))
+        self.assertEqual(store.get('Cau', 'FGA')['count'], 3)
+
+    def testMergeAndSave(self):
+        """counts made separately merge to the counts made together, and survive a round trip"""
+        lines = GENOTYPES_CSV.splitlines(True)
+        first = builder.AlleleCounts().add_profiles(builder.iter_genotypes(StringIO(''.join(lines[:2]))))
+        second = builder.AlleleCounts().add_profiles(builder.iter_genotypes(StringIO(lines[0] + ''.join(lines[2:]))))
+        whole = builder.AlleleCounts().add_profiles(builder.iter_genotypes(StringIO(GENOTYPES_CSV)))
+        self.assertEqual(first.merge(second).data(), whole.data())
+
+        saved = StringIO()
+        whole.dump(saved)
+        saved.seek(0)
+        self.assertEqual(builder.AlleleCounts.load(saved).data(), whole.data())
+
+    def testCountFiles(self):
+        """counting files in parallel, and writing the frequencies in the format read by read_csv"""
+        directory = tempfile.mkdtemp()
+        try:
+            lines = GENOTYPES_CSV.splitlines(True)
+            filenames = []
+            for i, line in enumerate(lines[1:]):
+                filenames.append(os.path.join(directory, '%d.csv' % i))
+                with open(filenames[-1], 'w') as f:
+                    f.write(lines[0] + line)
+            counts = builder.count_files(filenames, jobs=2)
+            expected = builder.AlleleCounts().add_profiles(builder.iter_genotypes(StringIO(GENOTYPES_CSV)))
+            self.assertEqual(counts.data(), expected.data())
+        finally:
+            shutil.rmtree(directory)
+
+        text = StringIO()
+        sgm.write_frequencies(text, counts.data())
+        text.seek(0)
+        data = list(sgm.iter_csv(text, '', 1))
+        self.assertEqual(data, counts.data())
+
+    def testWriteFrequencies(self):
+        """non-numeric alleles and sample set names with spaces are read back by read_csv"""
+        genotypes = ('id,population,FGA,AMEL\n'
+            's1,AB Cau,20/OL,X/Y\n'
+            's2,AB Cau,<6/21,X/X\n')
+        counts = builder.AlleleCounts().add_profiles(builder.iter_genotypes(StringIO(genotypes)))
+        text = StringIO()
+        sgm.write_frequencies(text, counts.data())
+        self.assertEqual([line.split(',')[0] for line in text.getvalue().splitlines()[2:]],
+            ['20', '21', '<6', 'OL', 'X', 'Y'])
+        text.seek(0)
+        data = list(sgm.iter_csv(text, '', 1))
+        self.assertEqual(data, counts.data())
+        self.assertEqual(set([d['name'] for d in data]), set(['AB Cau']))
+        self.assertEqual(data[0]['count'], 2)
+
+        for name in (' AB', ''):
+            self.assertRaises(ValueError, sgm.write_frequencies, StringIO(),
+                [{'name': name, 'count': 1, 'marker': 'FGA', 'alleles': {'20': 1.0}}])
+        self.assertRaises(ValueError, sgm.write_frequencies, StringIO(),
+            [{'name': 'AB Cau', 'marker': 'FGA', 'alleles': {'20': 1.0}}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+columnar test module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import numpy
+
+from strprofiles import batch
+from strprofiles import columnar
+from strprofiles import frequencies
+from strprofiles import strmarker
+
+
+class ColumnarTestCase(unittest.TestCase):
+    """
+    Test the .csv and binary columnar exporters.
+    """
+    def setUp(self):
+        """Make allele frequency data and a temporary directory available for all test functions."""
+        self.data = frequencies.FrequencyStore([
+            {'name': 'AB', 'count': 200, 'marker': 'FGA', 'alleles': {'20': 0.2, '21': 0.5, '22': 0.3}},
+            {'name': 'AB', 'count': 200, 'marker': 'TH01', 'alleles': {'6': 0.4, '9.3': 0.6}},
+            {'name': 'CD', 'marker': 'FGA', 'alleles': {'20': 0.6, '21': 0.4}}])
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, rows, columns, **kwargs):
+        """Write rows to a columnar file, returning its reader."""
+        filename = os.path.join(self.tmpdir, 'table.col')
+        with open(filename, 'wb') as out:
+            with columnar.ColumnWriter(out, columns, **kwargs) as writer:
+                writer.write_rows(rows)
+        return columnar.ColumnReader(filename)
+
+    def testRoundTrip(self):
+        """every column type reads back, across spooled blocks and with missing values"""
+        columns = [('id', 'str'), ('name', 'category'), ('n', 'i8'), ('x', 'f8'), ('flag', 'u1')]
+        rows = [(str(i) * (i % 4), ['AB', u'\xe9', 'CD'][i % 3], i, i / 7.0, i % 2) for i in range(1000)]
+        rows[5] = (None, 'AB', None, None, 0)
+        reader = self.write(rows, columns, buffer_rows=64)
+        self.assertEqual(len(reader), 1000)
+        self.assertEqual(reader.columns, columns)
+        self.assertTrue(isinstance(reader['x'], numpy.memmap))
+        self.assertEqual(reader['n'].dtype, numpy.dtype('<i8'))
+        self.assertEqual(reader['x'][7], 1.0)
+        self.assertEqual(reader['name'].mask(u'\xe9').sum(), 333)
+        self.assertEqual(reader['name'].mask('EF').sum(), 0)
+        self.assertEqual(reader['id'][-1], '999999999')
+        self.assertEqual(reader['id'][3:5], ['333', ''])
+        self.assertEqual(list(reader.iter_rows(block_size=100))[5][:3], ('', 'AB', -1))
+        self.assertTrue(numpy.isnan(reader['x'][5]))
+        rows[5] = ('', 'AB', -1, reader['x'][5], 0)
+        for expected, row in zip(rows, reader.iter_rows(block_size=100)):
+            if expected[3] == expected[3]:
+                self.assertEqual(row, expected)
+
+    def testEmpty(self):
+        """a table without rows"""
+        reader = self.write([], columnar.SCORE_COLUMNS)
+        self.assertEqual(len(reader), 0)
+        self.assertEqual(list(reader.iter_rows()), [])
+        self.assertEqual(len(reader['id']), 0)
+
+    def testStream(self):
+        """files are written sequentially, and a failed write writes nothing"""
+        out = StringIO()
+        self.assertEqual(columnar.write_table([('x', 'AB', 0.0, -1.5)], out, columnar.SCORE_COLUMNS, 'columnar'), 1)
+        filename = os.path.join(self.tmpdir, 'scores.col')
+        with open(filename, 'wb') as f:
+            f.write(out.getvalue())
+        self.assertEqual(list(columnar.ColumnReader(filename).iter_rows()), [('x', 'AB', 0.0, -1.5)])
+        with open(filename, 'wb') as f:
+            f.write(out.getvalue()[:-1])
+        self.assertRaises(ValueError, columnar.ColumnReader, filename)
+
+        out = StringIO()
+        try:
+            with columnar.ColumnWriter(out, columnar.SCORE_COLUMNS) as writer:
+                writer.write_rows([('x', 'AB', 0.0, -1.5)])
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(out.getvalue(), '')
+
+    def testRmps(self):
+        """random match probabilities as .csv and columnar rows"""
+        result = strmarker.calc_rmps(self.data, 'AB', 5, 0.01)
+        rows = list(columnar.rmp_rows('AB', 5, 0.01, result, strmarker.SGM_PLUS_MARKERS))
+        self.assertEqual([row[4] for row in rows], ['FGA', 'TH01', 'combined'])
+        self.assertEqual(rows[-1][5], result['combined'])
+        out = StringIO()
+        columnar.write_csv(rows, out, columnar.RMP_COLUMNS)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], 'name,cutoff,theta,count,marker,rmp')
+        self.assertEqual(lines[1], 'AB,5,0.01,200,FGA,%r' % result['FGA'])
+
+        # the count is missing
+        rows = list(columnar.rmp_rows('CD', 0, 0.01, {'FGA': 0.5, 'combined': 0.5, 'reciprocal': 2.0}))
+        self.assertEqual(rows[0][3], None)
+        self.assertEqual(self.write(rows, columnar.RMP_COLUMNS)['count'].tolist(), [-1, -1])
+        self.assertEqual(list(columnar.pmp_rows('AB', {'0.03': 3.0, '0.0': 1.0})),
+            [('AB', 0.0, 1.0), ('AB', 0.03, 3.0)])
+
+    def testScores(self):
+        """batch scores written in chunks read back in order"""
+        profiles = [(i, {'FGA': ('20', ['20', '21', '22'][i % 3])}) for i in range(50)]
+        chunks = batch.score_profiles(self.data, profiles, ['AB', 'CD'], [0.0, 0.01], chunk_size=8)
+        expected = [score for chunk in batch.score_profiles(self.data, profiles, ['AB', 'CD'], [0.0, 0.01], 8)
+            for score in chunk]
+        filename = os.path.join(self.tmpdir, 'scores.col')
+        with open(filename, 'wb') as out:
+            with columnar.ColumnWriter(out, columnar.SCORE_COLUMNS, buffer_rows=16) as writer:
+                for scores in chunks:
+                    writer.write_rows(scores)
+        reader = columnar.ColumnReader(filename)
+        self.assertEqual([(int(ident), name, theta, log10) for ident, name, theta, log10 in reader.iter_rows()],
+            expected)
+        self.assertEqual(reader['log10'][reader['name'].mask('CD') & (reader['theta'] == 0.0)][2], float('-inf'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+dbmatch test module.
+"""
+
+import unittest
+
+import numpy
+
+from strprofiles import dbmatch
+from strprofiles import frequencies
+from strprofiles import strmarker
+from strprofiles import synthetic
+
+
+class FindMatchesTestCase(unittest.TestCase):
+    """
+    Test searching a profile database for matching pairs.
+    """
+    def setUp(self):
+        """Make a small database of random profiles, with a few untyped markers."""
+        self.store = frequencies.FrequencyStore(synthetic.frequency_data(1, 6, 3, seed=4))
+        self.markers = synthetic.marker_names(6)
+        self.table = self.store.frequency_table('P0', self.markers)
+        self.genotypes = synthetic.random_profiles(self.store, 'P0', self.markers, 300, seed=5)
+        self.genotypes[::7, 2, :] = -1
+
+    def _brute_force(self, min_matches):
+        """Compare every pair of profiles"""
+        keys = dbmatch.genotype_keys(self.genotypes)
+        expected = {}
+        for i in range(len(keys)):
+            for j in range(i + 1, len(keys)):
+                full = (keys[i] == keys[j]) & (keys[i] >= 0)
+                if full.sum() >= min_matches:
+                    shared = 0
+                    for m in range(len(self.markers)):
+                        if not full[m] and keys[i, m] >= 0 and set(self.genotypes[i, m]) & set(self.genotypes[j, m]):
+                            shared += 1
+                    expected[(i, j)] = (full.sum(), shared)
+        return expected
+
+    def testFindMatches(self):
+        """the indexed search finds the same pairs as comparing every pair"""
+        for min_matches in [3, 5]:
+            expected = self._brute_force(min_matches)
+            self.assertTrue(expected)
+            result = list(dbmatch.find_matches(self.genotypes, min_matches, block_size=50))
+            self.assertEqual(len(result), len(expected))
+            self.assertEqual(result, sorted(result))
+            for i, j, matches, partial, weight in result:
+                self.assertEqual((matches, partial), expected[(i, j)])
+                self.assertEqual(weight, None)
+
+    def testParallelAndWeights(self):
+        """pairs found in worker processes are the same, and are weighed by their matching markers"""
+        expected = list(dbmatch.find_matches(self.genotypes, 4, self.table, 0.01, block_size=40))
+        result = list(dbmatch.find_matches(self.genotypes, 4, self.table, 0.01, block_size=40, jobs=2))
+        self.assertEqual(result, expected)
+        keys = dbmatch.genotype_keys(self.genotypes)
+        for i, j, matches, partial, weight in expected[:10]:
+            matched = numpy.where(((keys[i] == keys[j]) & (keys[i] >= 0))[:, numpy.newaxis], self.genotypes[i], -1)
+            self.assertAlmostEqual(weight, strmarker.calc_profile_log_match_probabilities(matched[numpy.newaxis],
+                self.store, 'P0', self.markers, 0.01)[0])
+
+    def testIndex(self):
+        """the index finds every profile with the genotypes of a group of markers"""
+        keys = dbmatch.genotype_keys(self.genotypes)
+        index = dbmatch.GenotypeIndex(keys, 4)
+        self.assertEqual(len(index.groups), 3)
+        self.assertEqual(sorted(sum(index.groups, [])), range(6))
+        group = index.groups[0]
+        expected = numpy.flatnonzero((keys[:, group] == keys[1, group]).all(axis=1)).tolist()
+        self.assertEqual(sorted(index.lookup(0, index.group_keys[1, 0]).tolist()), expected)
+        self.assertEqual(len(index.lookup(1, -2)), 0)
+        self.assertRaises(ValueError, dbmatch.marker_groups, keys, 7)
+
+    def testEmpty(self):
+        """a database without profiles has no keys and no matches"""
+        genotypes = self.genotypes[:0]
+        self.assertEqual(dbmatch.genotype_keys(genotypes).shape, (0, 6))
+        self.assertEqual(dbmatch.genotype_keys([]).shape, (0, 0))
+        self.assertEqual(list(dbmatch.find_matches(genotypes, 4)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
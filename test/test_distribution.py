@@ -0,0 +1,76 @@
+"""
+distribution test module.
+"""
+
+import itertools
+import unittest
+
+import numpy
+
+from strprofiles import distribution
+from strprofiles import frequencies
+from strprofiles import strmarker
+
+
+class ProfileDistributionTestCase(unittest.TestCase):
+    """
+    Test the distribution of profile match probabilities.
+    """
+    def setUp(self):
+        """Make allele frequency data available for all test functions."""
+        self.data = frequencies.FrequencyStore([
+            {'name': 'AB', 'count': 200, 'marker': 'FGA', 'alleles': {'20': 0.2, '21': 0.5, '22': 0.3}},
+            {'name': 'AB', 'count': 200, 'marker': 'TH01', 'alleles': {'6': 0.4, '9.3': 0.6}},
+            {'name': 'AB', 'count': 200, 'marker': 'VWA', 'alleles': {'14': 0.1, '15': 0.15, '16': 0.25,
+                '17': 0.5}}])
+        self.markers = ['FGA', 'TH01', 'VWA']
+
+    def _enumerate(self, theta):
+        """Return the log10 match probabilities and frequencies of every profile, by enumeration"""
+        per_marker = [distribution.genotype_distribution(self.data['AB', m]['alleles'], theta) for m in self.markers]
+        values = []
+        weights = []
+        for combination in itertools.product(*[zip(v, w) for v, w in per_marker]):
+            values.append(sum([c[0] for c in combination]))
+            weights.append(numpy.prod([c[1] for c in combination]))
+        return numpy.array(values), numpy.array(weights)
+
+    def testGenotypeDistribution(self):
+        """genotype frequencies sum to one, and match probabilities agree with strmarker"""
+        alleles = self.data['AB', 'FGA']['alleles']
+        values, freq = distribution.genotype_distribution(alleles, 0.03)
+        self.assertEqual(len(values), 6)
+        self.assertAlmostEqual(freq.sum(), 1.0)
+        expected = strmarker.calc_profile_match_probability({'FGA': (('21', 0.5), ('21', 0.5))}, 0.03)
+        self.assertTrue(numpy.isclose(numpy.log10(expected), values).any())
+
+    def testAgainstEnumeration(self):
+        """the convolved distribution agrees with enumerating every profile"""
+        for theta in [0.0, 0.03]:
+            values, weights = self._enumerate(theta)
+            result = distribution.profile_distribution(self.data, 'AB', self.markers, theta, bin_width=0.01)
+            self.assertAlmostEqual(result.masses.sum(), 1.0)
+            self.assertAlmostEqual(result.error_bound, 0.015)
+            self.assertTrue(abs(result.mean() - numpy.dot(values, weights)) <= result.error_bound)
+            order = numpy.argsort(values)
+            cumulative = numpy.cumsum(weights[order])
+            for q in [0.01, 0.25, 0.5, 0.99]:
+                expected = values[order][numpy.searchsorted(cumulative, q)]
+                self.assertTrue(abs(result.quantile(q) - expected) <= result.error_bound + 1e-9)
+            self.assertAlmostEqual(result.cdf(0.0), 1.0)
+
+    def testFFT(self):
+        """convolution by FFT gives the same distribution"""
+        expected = distribution.profile_distribution(self.data, 'AB', self.markers, 0.01, bin_width=0.0001)
+        threshold = distribution.FFT_THRESHOLD
+        try:
+            distribution.FFT_THRESHOLD = 0
+            result = distribution.profile_distribution(self.data, 'AB', self.markers, 0.01, bin_width=0.0001)
+        finally:
+            distribution.FFT_THRESHOLD = threshold
+        self.assertEqual(result.offset, expected.offset)
+        self.assertTrue(numpy.allclose(result.masses, expected.masses, atol=1e-12))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+equilibrium test module.
+"""
+
+import unittest
+
+import numpy
+
+from strprofiles import equilibrium
+from strprofiles import synthetic
+
+
+class EquilibriumTestCase(unittest.TestCase):
+    """
+    Test Hardy-Weinberg and linkage equilibrium tests.
+    """
+    def setUp(self):
+        """Draw genotypes in equilibrium."""
+        rng = numpy.random.RandomState(3)
+        table = numpy.array([[0.1, 0.2, 0.3, 0.4], [0.5, 0.25, 0.25, 0.0], [0.6, 0.4, 0.0, 0.0]])
+        self.genotypes = synthetic.draw_genotypes(table, 400, rng)
+
+    def testHWE(self):
+        """genotypes drawn in equilibrium pass, and a deficit of heterozygotes fails"""
+        results = equilibrium.hwe_tests(self.genotypes, 500, seed=1)
+        self.assertEqual([r['alleles'] for r in results], [4, 3, 2])
+        self.assertEqual([r['exact'] for r in results], [False, False, True])
+        for result in results:
+            self.assertGreater(result['p_value'], 0.001)
+            self.assertAlmostEqual(result['observed_heterozygosity'], result['expected_heterozygosity'], 1)
+
+        inbred = self.genotypes[:, 0].copy()
+        inbred[:200, 1] = inbred[:200, 0]
+        result = equilibrium.hwe_test(inbred, 500, seed=1)
+        self.assertAlmostEqual(result['p_value'], 1 / 501.0)
+        inbred = self.genotypes[:, 2].copy()
+        inbred[:200, 1] = inbred[:200, 0]
+        self.assertLess(equilibrium.hwe_test(inbred)['p_value'], 1e-6)
+
+    def testHWEExact(self):
+        """the exact two allele test, against hand calculation"""
+        # 2 samples, 1 copy of the minor allele: only one heterozygote is possible
+        self.assertAlmostEqual(equilibrium.hwe_test([[0, 1], [1, 1]])['p_value'], 1.0)
+        # 2 samples, 2 copies: P(0 hets) = 1/3, P(2 hets) = 2/3
+        self.assertAlmostEqual(equilibrium.hwe_test([[0, 0], [1, 1]])['p_value'], 1 / 3.0)
+        self.assertAlmostEqual(equilibrium.hwe_test([[0, 1], [1, 0]])['p_value'], 1.0)
+        # untyped samples are left out
+        self.assertEqual(equilibrium.hwe_test([[0, 0], [1, 1], [-1, -1]])['samples'], 2)
+
+    def testLD(self):
+        """independent markers pass, and linked markers fail"""
+        results = equilibrium.ld_tests(self.genotypes, 200, seed=2)
+        self.assertEqual(sorted(results.keys()), [(0, 1), (0, 2), (1, 2)])
+        for result in results.values():
+            self.assertGreater(result['p_value'], 0.001)
+        linked = self.genotypes[:, [0, 2]].copy()
+        linked[:, 1] = numpy.minimum(linked[:, 0], 1)
+        result = equilibrium.ld_test(linked[:, 0], linked[:, 1], 200)
+        self.assertAlmostEqual(result['p_value'], 1 / 201.0)
+        self.assertGreater(result['statistic'], 0.0)
+
+    def testReproducible(self):
+        """results depend on the seed, but not on the number of jobs"""
+        serial = equilibrium.ld_tests(self.genotypes, 100, seed=5)
+        self.assertEqual(equilibrium.ld_tests(self.genotypes, 100, seed=5, jobs=2), serial)
+        self.assertEqual(equilibrium.hwe_tests(self.genotypes, 100, seed=5, jobs=2),
+            equilibrium.hwe_tests(self.genotypes, 100, seed=5))
+
+
+if __name__ == '__main__':
+    unittest.main()
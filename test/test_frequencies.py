@@ -0,0 +1,98 @@
+"""
+frequencies test module.
+"""
+
+import unittest
+from StringIO import StringIO
+
+from strprofiles import frequencies
+from strprofiles import sgm
+from strprofiles import strmarker
+
+
+class FrequencyStoreTestCase(unittest.TestCase):
+    """
+    Test the indexed allele frequency store.
+    """
+    def setUp(self):
+        """Make allele frequency data available for all test functions."""
+        self.data = [
+            {'name': 'AB', 'count': 200, 'marker': 'FGA', 'alleles': {'20': 0.2, '21': 0.5, '22': 0.3}},
+            {'name': 'AB', 'count': 200, 'marker': 'TH01', 'alleles': {'6': 0.4, '9.3': 0.6}},
+            {'name': 'AB', 'count': 200, 'marker': 'CSF1PO', 'alleles': {'10': 0.5, '11': 0.5}},
+            {'name': 'JFS', 'count': 300, 'marker': 'FGA', 'alleles': {'20': 0.2, '21': 0.3, '23': 0.5}},
+            {'name': 'JFS', 'count': 300, 'marker': 'TH01', 'alleles': {'6': 0.6, '9.3': 0.4}}]
+
+    def testLookup(self):
+        """look up records by sample set and marker"""
+        store = frequencies.FrequencyStore(self.data)
+        self.assertEqual(len(store), 5)
+        self.assertEqual(store.names(), ['AB', 'JFS'])
+        self.assertEqual(store.markers(), ['FGA', 'TH01', 'CSF1PO'])
+        record = store['JFS', 'FGA']
+        self.assertEqual(record['count'], 300)
+        self.assertEqual(record['alleles'], self.data[3]['alleles'])
+        self.assertTrue(('AB', 'CSF1PO') in store)
+        self.assertEqual(store.get('JFS', 'CSF1PO'), None)
+        self.assertEqual([r.marker for r in store.select('JFS', ['TH01', 'CSF1PO', 'FGA'])], ['TH01', 'FGA'])
+
+    def testReplace(self):
+        """replacing a record changes the version"""
+        store = frequencies.FrequencyStore(self.data)
+        version = store.version
+        store.add('AB', 'FGA', 100, {'20': 1.0})
+        self.assertTrue(store.version > version)
+        self.assertEqual(len(store), 5)
+        self.assertEqual(store['AB', 'FGA']['alleles'], {'20': 1.0})
+
+    def testMissingCount(self):
+        """records without a sample size behave like dicts without a count"""
+        store = frequencies.FrequencyStore([{'name': 'X', 'marker': 'FGA', 'alleles': {'20': 1.0}}])
+        self.assertRaises(KeyError, lambda: store['X', 'FGA']['count'])
+        record = store['X', 'FGA']
+        self.assertFalse('count' in record)
+        self.assertEqual(record.get('count'), None)
+        self.assertEqual(dict([(key, record[key]) for key in record.keys()]),
+            {'name': 'X', 'marker': 'FGA', 'alleles': {'20': 1.0}})
+
+    def testWriteFrequencies(self):
+        """a store is written as a .csv file like the list of dicts it was made from"""
+        data = self.data + [{'name': 'X', 'marker': 'FGA', 'alleles': {'20': 1.0}}]
+        store = frequencies.FrequencyStore(data)
+        expected = StringIO()
+        sgm.write_frequencies(expected, data)
+        text = StringIO()
+        sgm.write_frequencies(text, store)
+        self.assertEqual(text.getvalue(), expected.getvalue())
+        text.seek(0)
+        self.assertEqual(sgm.table_data(sgm.parse_csv(text), '', 1), data)
+
+    def testEncodeReadOnly(self):
+        """encoding without growing maps unknown alleles to a zero frequency slot and leaves the store unchanged"""
+        store = frequencies.FrequencyStore(self.data)
+        labels = store.allele_labels('FGA')
+        genotypes = store.encode_profiles([{'FGA': ('20', 'x')}, {'FGA': ('y', '23')}], ['FGA', 'D99'], grow=False)
+        self.assertEqual(store.allele_labels('FGA'), labels)
+        self.assertEqual(genotypes[:, 0].tolist(), [[labels.index('20'), 4], [4, labels.index('23')]])
+        self.assertEqual(genotypes[:, 1].tolist(), [[-1, -1], [-1, -1]])
+        table = store.frequency_table('JFS', ['FGA'], 0.01)
+        self.assertEqual(table.shape, (1, 5))
+        self.assertEqual(table[0, 4], 0.01)
+        grown = store.encode_profiles([{'FGA': ('20', 'x')}], ['FGA'])
+        self.assertEqual(grown[0, 0].tolist(), [labels.index('20'), 4])
+        self.assertEqual(store.allele_labels('FGA'), labels + ['x'])
+
+    def testStrmarkerCompatibility(self):
+        """strmarker functions give the same results for a store and a list"""
+        store = frequencies.FrequencyStore(self.data)
+        for name in ['AB', 'JFS']:
+            result = strmarker.calc_rmps(store, name, 5, 0.01)
+            expected = strmarker.calc_rmps(self.data, name, 5, 0.01)
+            self.assertEqual(sorted(result.keys()), sorted(expected.keys()))
+            for i in expected:
+                self.assertAlmostEqual(result[i] / expected[i], 1.0)
+            self.assertEqual(strmarker.get_modal_profile(store, name), strmarker.get_modal_profile(self.data, name))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+instrument test module.
+"""
+
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from strprofiles import frequencies
+from strprofiles import instrument
+from strprofiles import strmarker
+from strprofiles import synthetic
+
+
+@instrument.hot_path
+def _countdown(n):
+    """A recursive hot path."""
+    if n:
+        _countdown(n - 1)
+    return n
+
+
+class InstrumentTestCase(unittest.TestCase):
+    """
+    Test the instrumentation of the hot paths.
+    """
+    def setUp(self):
+        """Make allele frequency data and a temporary directory available for all test functions."""
+        self.data = frequencies.FrequencyStore(synthetic.frequency_data(2, 4, 10))
+        self.tmpdir = tempfile.mkdtemp()
+        strmarker.clear_caches()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testDisabled(self):
+        """nothing is recorded outside profiling"""
+        profile = instrument.Profile()
+        strmarker.calc_rmps(self.data, 'P0', 5, 0.01)
+        self.assertEqual(profile.functions(), {})
+        self.assertIsNone(instrument._active)
+
+    def testProfiling(self):
+        """call counts, timings and cache hits of nested hot paths"""
+        with instrument.profiling() as profile:
+            strmarker.calc_rmps(self.data, 'P0', 5, 0.01)
+            strmarker.calc_rmps(self.data, 'P0', 5, 0.01)
+        self.assertIsNone(instrument._active)
+        functions = profile.functions()
+        self.assertEqual(functions['strmarker.calc_rmps']['calls'], 2)
+        self.assertEqual(functions['strmarker.calc_pooled_marker_rmp']['calls'], 8)
+        for f in functions.values():
+            self.assertTrue(0.0 <= f['own'] <= f['total'] + 1e-9)
+            self.assertTrue(f['p50'] <= f['p90'] <= f['p99'] <= f['max'])
+        self.assertGreaterEqual(functions['strmarker.calc_rmps']['total'],
+            functions['strmarker.calc_pooled_marker_rmp']['total'])
+        self.assertEqual(profile.caches['strmarker.rmp'], {'hits': 4, 'misses': 4, 'hit_rate': 0.5})
+        self.assertGreater(profile.peak_memory, 0)
+        self.assertIn('strmarker.calc_rmps', profile.report())
+
+        # recording again adds to the statistics
+        with instrument.profiling(profile):
+            strmarker.calc_rmps(self.data, 'P1', 5, 0.01)
+        self.assertEqual(profile.functions()['strmarker.calc_rmps']['calls'], 3)
+        self.assertEqual(profile.caches['strmarker.rmp']['misses'], 8)
+
+    def testWindow(self):
+        """percentiles come from the most recent calls, and the counts and totals from every call"""
+        with instrument.profiling(instrument.Profile(window=10)) as profile:
+            for i in range(25):
+                _countdown(0)
+        (key,) = profile.durations.keys()
+        self.assertEqual(len(profile.durations[key]), 10)
+        f = profile.functions()['test_instrument._countdown']
+        self.assertEqual(f['calls'], 25)
+        self.assertAlmostEqual(f['mean'] * 25, profile.total[key])
+        self.assertTrue(f['p99'] <= f['max'])
+
+    def testRecursion(self):
+        """recursive calls are counted, but their time only once"""
+        with instrument.profiling() as profile:
+            _countdown(3)
+        (key,) = profile.stats().keys()
+        primitive, calls, own, total, callers = profile.stats()[key]
+        self.assertEqual((primitive, calls), (1, 4))
+        self.assertAlmostEqual(total, max(profile.durations[key]))
+        self.assertEqual(callers[key][:2], (3, 0))
+
+    def testExport(self):
+        """the statistics are written as JSON and read back by pstats"""
+        with instrument.profiling() as profile:
+            strmarker.calc_rmps(self.data, 'P0', 0, 0.0)
+        filename = os.path.join(self.tmpdir, 'profile.json')
+        profile.dump_json(filename)
+        with open(filename) as f:
+            result = json.load(f)
+        self.assertEqual(result['functions']['strmarker.calc_rmps']['calls'], 1)
+        self.assertIn('strmarker.rmp', result['caches'])
+
+        filename = os.path.join(self.tmpdir, 'profile.pstats')
+        profile.dump_stats(filename)
+        stats = pstats.Stats(filename)
+        self.assertEqual(stats.total_calls, sum(profile.calls.values()))
+        labels = dict([(key[2], value) for key, value in stats.stats.items()])
+        self.assertEqual(labels['strmarker.calc_marker_rmp_array'][1], 4)
+        callers = labels['strmarker.calc_pooled_marker_rmp'][4]
+        self.assertEqual([key[2] for key in callers], ['strmarker.calc_rmps'])
+
+
+if __name__ == '__main__':
+    unittest.main()
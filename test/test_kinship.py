@@ -0,0 +1,73 @@
+"""
+kinship test module.
+"""
+
+import unittest
+
+import numpy
+
+from strprofiles import frequencies
+from strprofiles import kinship
+from strprofiles import strmarker
+
+
+class KinshipTestCase(unittest.TestCase):
+    """
+    Test match probabilities and likelihood ratios for relatives.
+    """
+    def setUp(self):
+        """Make allele frequency data available for all test functions."""
+        self.data = frequencies.FrequencyStore([
+            {'name': 'AB', 'count': 200, 'marker': 'FGA', 'alleles': {'20': 0.2, '21': 0.5, '22': 0.3}},
+            {'name': 'AB', 'count': 200, 'marker': 'TH01', 'alleles': {'6': 0.4, '9.3': 0.6}}])
+        self.markers = ['FGA', 'TH01']
+        self.table = self.data.frequency_table('AB', self.markers)
+        self.profiles = [{'FGA': ('20', '21'), 'TH01': ('6', '6')}, {'FGA': ('20', '22'), 'TH01': ('6', '9.3')},
+            {'FGA': ('21', '21')}]
+        self.genotypes = self.data.encode_profiles(self.profiles, self.markers)
+
+    def testRelativeMatchProbabilities(self):
+        """match probabilities for relatives, against the NRC II formulae"""
+        theta = 0.01
+        result = kinship.relative_match_probabilities(self.genotypes, self.table, 'unrelated', theta)
+        expected = strmarker.calc_profile_log_match_probabilities(self.genotypes, self.data, 'AB', self.markers,
+            theta)
+        self.assertTrue(numpy.allclose(result, expected))
+
+        result = kinship.relative_match_probabilities(self.genotypes, self.table, 'parent-child', theta)
+        # heterozygote 20,21 and homozygote 6,6
+        expected = (2 * theta + (1 - theta) * 0.7) / (2 * (1 + theta)) * (2 * theta + (1 - theta) * 0.4) / (1 + theta)
+        self.assertAlmostEqual(result[0], numpy.log10(expected))
+
+        result = kinship.relative_match_probabilities(self.genotypes, self.table, 'full-siblings', 0.0)
+        # at theta = 0, full siblings match a heterozygote with probability (1 + p + q + 2pq) / 4,
+        # and a homozygote with probability (1 + p)^2 / 4
+        expected = (1 + 0.2 + 0.5 + 2 * 0.2 * 0.5) / 4 * (1 + 0.4) ** 2 / 4
+        self.assertAlmostEqual(result[0], numpy.log10(expected))
+        self.assertAlmostEqual(result[2], numpy.log10((1 + 0.5) ** 2 / 4))
+
+    def testKinshipIndices(self):
+        """likelihood ratios for relatives at theta = 0"""
+        query = self.data.encode_profiles([{'FGA': ('20', '21'), 'TH01': ('6', '9.3')}], self.markers)[0]
+        result = kinship.kinship_indices(query, self.genotypes, self.table, 'parent-child', 0.0)
+        # FGA has the same heterozygote, (p + q) / (4 * p * q); TH01 shares 6 with a 6,6 parent, 1 / (2 * p)
+        self.assertAlmostEqual(result[0], numpy.log10(0.7 / (4 * 0.2 * 0.5) * 1 / (2 * 0.4)))
+        # the third profile is typed at FGA only, sharing 21
+        self.assertAlmostEqual(result[2], numpy.log10(1 / (2 * 0.5)))
+        result = kinship.kinship_indices(query, self.genotypes, self.table, 'unrelated', 0.03)
+        self.assertTrue(numpy.allclose(result, 0.0))
+        result = kinship.kinship_indices(query, self.genotypes, self.table, (0.25, 0.5, 0.25), 0.0)
+        expected = kinship.kinship_indices(query, self.genotypes, self.table, 'full-siblings', 0.0)
+        self.assertTrue(numpy.allclose(result, expected))
+        self.assertRaises(ValueError, kinship.ibd_coefficients, (0.5, 0.5, 0.5))
+
+    def testChunks(self):
+        """results do not depend on the chunk size"""
+        genotypes = numpy.concatenate([self.genotypes] * 5)
+        expected = kinship.kinship_indices(genotypes[1], genotypes, self.table, 'half-siblings', 0.02)
+        result = kinship.kinship_indices(genotypes[1], genotypes, self.table, 'half-siblings', 0.02, chunk_size=4)
+        self.assertTrue(numpy.allclose(result, expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+kits test module.
+"""
+
+import unittest
+
+import numpy
+
+from strprofiles import bootstrap
+from strprofiles import frequencies
+from strprofiles import kits
+from strprofiles import strmarker
+from strprofiles import synthetic
+
+
+class KitsTestCase(unittest.TestCase):
+    """
+    Test the marker kit registry, and random match probabilities for several kits.
+    """
+    def setUp(self):
+        """Make allele frequency data for the union of the registered kits available for all test functions."""
+        rng = numpy.random.RandomState(7)
+        markers = sorted(set(kits.SGM_PLUS.markers + kits.CODIS_CORE.markers + kits.ESS.markers))
+        self.records = [{'name': name, 'count': 100, 'marker': marker, 'alleles': synthetic.random_frequencies(8, rng)}
+            for name in ('P0', 'P1') for marker in markers]
+        self.data = frequencies.FrequencyStore(self.records)
+
+    def testRegistry(self):
+        """kits are found by name, given as a Kit or a list of markers, and SGM Plus is the default"""
+        self.assertIs(kits.get_kit(), kits.SGM_PLUS)
+        self.assertIs(kits.get_kit('CODIS core'), kits.CODIS_CORE)
+        self.assertIs(kits.get_kit(kits.ESS), kits.ESS)
+        self.assertEqual(strmarker.SGM_PLUS_MARKERS, list(kits.SGM_PLUS))
+        self.assertEqual(len(kits.CODIS_CORE), 13)
+        self.assertTrue('D22S1045' in kits.ESS)
+        self.assertRaises(ValueError, kits.get_kit, 'no such kit')
+        kit = kits.get_kit(['FGA', 'TH01'])
+        self.assertIsNone(kit.name)
+        self.assertEqual(kit.markers, ('FGA', 'TH01'))
+        try:
+            self.assertIs(kits.get_kit(kits.register_kit('Mini', ['FGA', 'TH01'])), kits.KITS['Mini'])
+        finally:
+            del kits.KITS['Mini']
+
+    def testIndexes(self):
+        """marker indexes are cached, and recalculated when markers are added to the store"""
+        store = frequencies.FrequencyStore(self.records[:5])
+        kit = kits.Kit(None, [self.records[3]['marker'], 'D99', self.records[1]['marker']])
+        indexes = kit.indexes(store)
+        self.assertEqual(indexes.tolist(), [3, -1, 1])
+        self.assertIs(kit.indexes(store), indexes)
+        store.add('P0', 'D99', None, {'1': 1.0})
+        self.assertEqual(kit.indexes(store).tolist(), [3, 5, 1])
+
+    def testKitRmps(self):
+        """random match probabilities of several kits at once match those of each kit alone"""
+        kit_list = ['SGM Plus', 'CODIS core', kits.ESS, ['FGA', 'CSF1PO', 'D99']]
+        for data in (self.data, self.records):
+            results = strmarker.calc_kit_rmps(data, 'P1', 5, 0.01, kit_list)
+            self.assertEqual(sorted(results.keys()), [3, 'CODIS core', 'ESS', 'SGM Plus'])
+            for key, kit in zip(['SGM Plus', 'CODIS core', 'ESS', 3], kit_list):
+                expected = strmarker.calc_rmps(self.data, 'P1', 5, 0.01, kit)
+                self.assertEqual(sorted(results[key].keys()), sorted(expected.keys()))
+                for marker, rmp in expected.items():
+                    self.assertAlmostEqual(results[key][marker], rmp, 12)
+        self.assertEqual(len(strmarker.get_modal_profile(self.data, 'P0', 'CODIS core')), 13)
+        self.assertEqual(strmarker.calc_rmp_cube(self.data, ['P0'], 5, [0.0], kits.ESS)['rmp'].shape, (1, 12, 1))
+
+    def testMissingMarkers(self):
+        """a sample set with none of a kit's markers is an error, not an empty result"""
+        data = frequencies.FrequencyStore([r for r in self.records if r['marker'] != 'CSF1PO'])
+        self.assertRaises(ValueError, strmarker.calc_rmps, data, 'P0', 5, 0.01, ['CSF1PO'])
+        self.assertRaises(ValueError, strmarker.calc_rmp_cube, data, ['P0', 'P1'], 5, [0.0], ['CSF1PO'])
+        self.assertRaises(ValueError, bootstrap.bootstrap_rmps, data, 'P0', 5, 0.01, 10, kit=['CSF1PO'])
+        self.assertRaises(ValueError, strmarker.calc_kit_rmps, data, 'P0', 5, 0.01, ['SGM Plus', ['CSF1PO']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+mixture test module.
+"""
+
+import itertools
+import unittest
+
+from strprofiles import frequencies
+from strprofiles import mixture
+from strprofiles import synthetic
+
+
+def brute_force(observed, known, unknowns, frequencies, seen, theta):
+    """Sum the probabilities of every sequence of unknown alleles, drawn one at a time"""
+    observed = set(observed)
+    covered = set([a for genotype in known for a in genotype])
+    ret = 0.0
+    for alleles in itertools.product(sorted(frequencies), repeat=2 * unknowns):
+        if covered | set(alleles) != observed:
+            continue
+        p = 1.0
+        drawn = list(seen)
+        for a in alleles:
+            p *= (drawn.count(a) * theta + (1 - theta) * frequencies[a]) / (1 + (len(drawn) - 1) * theta)
+            drawn.append(a)
+        ret += p
+    return ret
+
+
+class MixtureTestCase(unittest.TestCase):
+    """
+    Test mixture likelihood ratios.
+    """
+    def setUp(self):
+        """Make allele frequency data available for all test functions."""
+        self.frequencies = {'10': 0.1, '11': 0.2, '12': 0.3, '13': 0.25, '14': 0.15}
+        self.data = frequencies.FrequencyStore([
+            {'name': 'AB', 'count': 200, 'marker': 'D3', 'alleles': self.frequencies}])
+
+    def testLocusProbability(self):
+        """locus probabilities, against enumeration of the unknown contributors' alleles"""
+        cases = [(['10', '11', '12'], [], 2), (['10', '11', '12'], [('10', '11')], 1),
+            (['10', '11', '12', '13'], [('10', '11')], 2), (['10', '11', '12', '13', '14'], [('12', '12')], 2),
+            (['10', '11'], [('10', '10')], 2), (['10', '11', '12'], [('10', '11'), ('11', '12')], 1),
+            (['10', '11', '12', '13', '14'], [], 3)]
+        for theta in (0.0, 0.03):
+            for observed, known, unknowns in cases:
+                seen = [a for genotype in known for a in genotype] + ['12', '13']
+                result = mixture.locus_probability(observed, known, unknowns, self.frequencies, seen, theta)
+                expected = brute_force(observed, known, unknowns, self.frequencies, seen, theta)
+                self.assertAlmostEqual(result, expected)
+
+    def testInconsistent(self):
+        """hypotheses inconsistent with the observed alleles have probability zero"""
+        self.assertEqual(mixture.locus_probability(['10', '11'], [('10', '12')], 1, self.frequencies, [], 0.0), 0.0)
+        self.assertEqual(mixture.locus_probability(['10', '11', '12'], [], 1, self.frequencies, [], 0.0), 0.0)
+        self.assertEqual(mixture.locus_probability(['10', '11'], [('10', '11')], 0, self.frequencies, [], 0.0), 1.0)
+
+    def testMixtureLR(self):
+        """a two person mixture of a victim and a suspect"""
+        victim = {'D3': ('10', '11')}
+        suspect = {'D3': ('12', '12')}
+        prosecution = mixture.Hypothesis([victim, suspect], 0)
+        defence = mixture.Hypothesis([victim], 1)
+        result = mixture.calc_mixture_lr({'D3': ['10', '11', '12']}, prosecution, defence, self.data, 'AB', 0.0)
+        # the unknown must be 12,12, 10,12 or 11,12
+        p = 0.3 * 0.3 + 2 * 0.1 * 0.3 + 2 * 0.2 * 0.3
+        self.assertAlmostEqual(result['lr'], 1 / p)
+        self.assertEqual(result['markers']['D3'][0], 1.0)
+
+    def testThreePerson(self):
+        """three person mixtures over 20 markers take one evaluation per marker and hypothesis"""
+        data = frequencies.FrequencyStore(synthetic.frequency_data(1, 20, 12, 0))
+        markers = synthetic.marker_names(20)
+        profiles = synthetic.decode_profiles(data, 'P0', markers,
+            synthetic.random_profiles(data, 'P0', markers, 3, 1))
+        observed = dict([(m, sorted(set([a for p in profiles for a in p[m]]))) for m in markers])
+        prosecution = mixture.Hypothesis(profiles[:1], 2)
+        defence = mixture.Hypothesis([], 3)
+        mixture.LOCUS_CACHE.clear()
+        result = mixture.calc_mixture_lr(observed, prosecution, defence, data, 'P0', 0.01)
+        self.assertEqual((mixture.LOCUS_CACHE.hits, mixture.LOCUS_CACHE.misses), (0, 2 * len(markers)))
+        self.assertGreater(result['log10_lr'], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
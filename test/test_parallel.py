@@ -0,0 +1,35 @@
+"""
+parallel test module.
+"""
+
+import unittest
+
+from strprofiles import parallel
+
+
+def _scale(task, factor):
+    """A task function."""
+    return task * factor
+
+
+class ParallelTestCase(unittest.TestCase):
+    """
+    Test running tasks in a pool of worker processes.
+    """
+    def testMapTasks(self):
+        """results are in the order of the tasks, whatever the number of jobs"""
+        tasks = range(20)
+        expected = [3 * task for task in tasks]
+        for jobs in (1, 2, 0):
+            self.assertEqual(parallel.map_tasks(_scale, tasks, 3, jobs), expected)
+        self.assertEqual(parallel.map_tasks(_scale, [], 3, 2), [])
+
+    def testImapTasks(self):
+        """results are yielded as they are ready, and the pool is stopped if they are not all consumed"""
+        results = parallel.imap_tasks(_scale, range(20), 2, 2)
+        self.assertEqual([results.next() for i in range(3)], [0, 2, 4])
+        results.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
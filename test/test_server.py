@@ -0,0 +1,116 @@
+"""
+server test module.
+"""
+
+import json
+import threading
+import unittest
+import urllib2
+
+from strprofiles import batch
+from strprofiles import frequencies
+from strprofiles import server
+from strprofiles import strmarker
+
+
+class ServerTestCase(unittest.TestCase):
+    """
+    Test the query server against localhost.
+    """
+    def setUp(self):
+        """Start a server on a free port."""
+        self.data = frequencies.FrequencyStore([
+            {'name': 'AB', 'count': 200, 'marker': 'FGA', 'alleles': {'20': 0.2, '21': 0.5, '22': 0.3}},
+            {'name': 'AB', 'count': 200, 'marker': 'TH01', 'alleles': {'6': 0.4, '9.3': 0.6}},
+            {'name': 'CD', 'count': 100, 'marker': 'FGA', 'alleles': {'20': 0.6, '21': 0.4}}])
+        self.server = server.QueryServer(('127.0.0.1', 0), self.data, max_delay=0.05)
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        self.thread.start()
+        self.url = 'http://%s:%d' % self.server.server_address
+
+    def tearDown(self):
+        """Stop the server."""
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def _post(self, path, query):
+        """Post a JSON query, returning the status and decoded response"""
+        try:
+            response = urllib2.urlopen(self.url + path, json.dumps(query))
+            return response.getcode(), json.loads(response.read())
+        except urllib2.HTTPError, e:
+            return e.code, json.loads(e.read())
+
+    def testQueries(self):
+        """rmps, pmp and modal queries"""
+        status, result = self._post('/rmps', {'name': 'AB', 'cutoff': 0, 'theta': 0.01})
+        self.assertEqual(status, 200)
+        expected = strmarker.calc_rmps(self.data, 'AB', 0, 0.01)
+        self.assertAlmostEqual(result['FGA'], expected['FGA'])
+        self.assertAlmostEqual(result['combined'], expected['combined'])
+
+        profile = {'FGA': ['20', '21'], 'TH01': ['6', '6']}
+        status, result = self._post('/pmp', {'name': 'AB', 'profile': profile, 'theta': 0.0})
+        self.assertEqual(status, 200)
+        self.assertAlmostEqual(result['pmp'], 2 * 0.2 * 0.5 * 0.4 * 0.4)
+
+        status, result = self._post('/modal', {'name': 'AB', 'thetas': [0.0]})
+        self.assertEqual(status, 200)
+        self.assertEqual(result['profile']['FGA'], [['21', 0.5], ['22', 0.3]])
+        self.assertAlmostEqual(result['reciprocal']['0.0'], 1 / (2 * 0.5 * 0.3 * 2 * 0.6 * 0.4))
+
+    def testErrors(self):
+        """bad queries are rejected"""
+        self.assertEqual(self._post('/pmp', {'name': 'XY', 'profile': {}})[0], 400)
+        self.assertEqual(self._post('/pmp', {'name': 'AB', 'profile': {'FGA': ['20']}})[0], 400)
+        self.assertEqual(self._post('/unknown', {})[0], 404)
+        self.assertEqual(self._post('/pmp', {'name': 'AB', 'profile': {'FGA': [21, 22]}})[0], 400)
+        self.assertEqual(self._post('/rmps', {'name': 'AB', 'kit': ['CSF1PO']})[0], 400)
+        self.assertEqual(self._post('/modal', {'name': 'AB', 'kit': 'no such kit'})[0], 400)
+
+    def testUnknownAlleles(self):
+        """allele values the store does not have score as unseen, without being added to the store"""
+        labels = self.data.allele_labels('FGA')
+        for i in range(20):
+            status, result = self._post('/pmp', {'name': 'AB', 'profile': {'FGA': ['x%d' % i, '21']},
+                'minimum_frequency': 0.01})
+            self.assertEqual(status, 200)
+            self.assertAlmostEqual(result['pmp'], 2 * 0.01 * 0.5)
+        self.assertEqual(self.data.allele_labels('FGA'), labels)
+
+    def testUnknownMarkers(self):
+        """markers the sample set has no frequencies for are untyped, as in batch scoring"""
+        profile = {'FGA': ['20', '21'], 'TH01': ['6', '6']}
+        status, result = self._post('/pmp', {'name': 'CD', 'profile': profile, 'theta': 0.0})
+        self.assertEqual(status, 200)
+        self.assertAlmostEqual(result['pmp'], 2 * 0.6 * 0.4)
+        scores = batch.score_profiles(self.data, [(1, profile)], ['CD'], [0.0])
+        self.assertAlmostEqual(result['log10'], list(scores)[0][0][3])
+
+    def testBatching(self):
+        """concurrent queries are batched, and counted in the metrics"""
+        profiles = [{'FGA': [a, b]} for a in ('20', '21', '22') for b in ('20', '21', '22')]
+        results = [None] * len(profiles)
+
+        def query(i):
+            results[i] = self._post('/pmp', {'name': 'CD', 'profile': profiles[i], 'theta': 0.01})[1]
+        threads = [threading.Thread(target=query, args=(i,)) for i in range(len(profiles))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        alleles = self.data.get('CD', 'FGA').alleles
+        for profile, result in zip(profiles, results):
+            pmp = strmarker.calc_profile_match_probability({'FGA': [(a, alleles.get(a, 0.0)) for a in profile['FGA']]},
+                0.01)
+            self.assertAlmostEqual(result['pmp'], pmp)
+
+        metrics = json.loads(urllib2.urlopen(self.url + '/metrics').read())
+        self.assertEqual(metrics['requests']['pmp'], len(profiles))
+        self.assertLess(metrics['batches'], len(profiles))
+        self.assertTrue(metrics['latency']['p99'] >= metrics['latency']['p50'])
+
+
+if __name__ == '__main__':
+    unittest.main()
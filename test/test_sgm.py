@@ -0,0 +1,137 @@
+"""
+sgm test module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from strprofiles import frequencies
+from strprofiles import sgm
+from strprofiles import strmarker
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+CSV_TEXT = (',"FGA","FGA","TH01","TH01",\n'
+    '"Allele","200 Cau","100 AA","200 Cau","100 AA","Allele"\n'
+    '6,,,25.25,12.5,6\n'
+    '20,50,25,,,20\n'
+    '21,50,75,74.75,87.5,21\n')
+
+
+class ReadCsvTestCase(unittest.TestCase):
+    """
+    Test reading allele frequency data from .csv files.
+    """
+    def setUp(self):
+        """Write a small allele frequency file to a temporary directory."""
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'freqs.csv')
+        csvfile = open(self.filename, 'wb')
+        csvfile.write(CSV_TEXT)
+        csvfile.close()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.tmpdir)
+
+    def testReadCsv(self):
+        """read a .csv file"""
+        data = sgm.read_csv(self.filename, "T ", 100, cache=False)
+        self.assertEqual(len(data), 4)
+        self.assertEqual(data[0], {'marker': 'FGA', 'name': 'T Cau', 'count': 200,
+            'alleles': {'20': 0.5, '21': 0.5}})
+        self.assertEqual(data[3], {'marker': 'TH01', 'name': 'T AA', 'count': 100,
+            'alleles': {'6': 0.125, '21': 0.875}})
+        self.assertFalse(os.path.exists(self.filename + sgm.CACHE_SUFFIX))
+
+    def testIterCsv(self):
+        """stream selected columns from a file-like object"""
+        expected = sgm.read_csv(self.filename, "T ", 100, cache=False)
+        self.assertEqual(list(sgm.iter_csv(self.filename, "T ", 100)), expected)
+        data = list(sgm.iter_csv(StringIO(CSV_TEXT), "T ", 100, names=['T AA']))
+        self.assertEqual(data, [expected[1], expected[3]])
+        data = list(sgm.iter_csv(StringIO(CSV_TEXT), "T ", 100, names=['T AA'], markers=['TH01']))
+        self.assertEqual(data, [expected[3]])
+        self.assertEqual(list(sgm.iter_csv(CSV_TEXT.splitlines(), "T ", 100, markers=['VWA'])), [])
+
+    def testCache(self):
+        """the parsed table is cached, and reparsed when the file changes"""
+        expected = sgm.read_csv(self.filename, "T ", 100, cache=False)
+        self.assertEqual(sgm.read_csv(self.filename, "T ", 100), expected)
+        self.assertTrue(os.path.exists(self.filename + sgm.CACHE_SUFFIX))
+        self.assertNotEqual(sgm.load_cache(self.filename), None)
+        self.assertEqual(sgm.read_csv(self.filename, "T ", 100), expected)
+
+        csvfile = open(self.filename, 'ab')
+        csvfile.write('22,0,0,,,22\n')
+        csvfile.close()
+        self.assertEqual(sgm.load_cache(self.filename), None)
+        data = sgm.read_csv(self.filename, "T ", 100)
+        self.assertEqual(data[0]['alleles'], {'20': 0.5, '21': 0.5, '22': 0.0})
+        self.assertEqual(sgm.read_csv(self.filename, "T ", 100), data)
+
+        # a truncated or damaged cache is parsed again, and replaced
+        with open(self.filename + sgm.CACHE_SUFFIX, 'rb') as f:
+            cached = f.read()
+        for damaged in (cached[:len(cached) // 2], cached[:200] + 'x' * 100 + cached[300:]):
+            with open(self.filename + sgm.CACHE_SUFFIX, 'wb') as f:
+                f.write(damaged)
+            self.assertEqual(sgm.load_cache(self.filename), None)
+            self.assertEqual(sgm.read_csv(self.filename, "T ", 100), data)
+            self.assertNotEqual(sgm.load_cache(self.filename), None)
+
+    def testDataFiles(self):
+        """cached and parsed data files agree"""
+        for name, normalizer in [('JFS2003IDresults.csv', 1), ('ABresults.csv', 100)]:
+            filename = os.path.join(self.tmpdir, name)
+            shutil.copy(os.path.join(DATA_DIR, name), filename)
+            expected = sgm.read_csv(filename, "X ", normalizer, cache=False)
+            self.assertEqual(sgm.read_csv(filename, "X ", normalizer), expected)
+            self.assertEqual(sgm.read_csv(filename, "X ", normalizer), expected)
+
+
+class TabulateTestCase(unittest.TestCase):
+    """
+    Test calculating and formatting tables.
+    """
+    def setUp(self):
+        """Read the allele frequency data files."""
+        data = sgm.read_csv(os.path.join(DATA_DIR, 'JFS2003IDresults.csv'), "JSF ", 1, cache=False)
+        data += sgm.read_csv(os.path.join(DATA_DIR, 'ABresults.csv'), "AB ", 100, cache=False)
+        self.data = frequencies.FrequencyStore(data)
+        self.samples = ['JSF AA', 'JSF Cau', 'JSF His', 'AB AA', 'AB Cau']
+
+    def testParallelColumns(self):
+        """columns calculated in worker processes match, in order, those calculated serially"""
+        tasks = [('rmp', sample, 5, 0.01) for sample in self.samples] + [('pmp', sample) for sample in self.samples]
+        expected = sgm.calc_columns(self.data, tasks)
+        self.assertEqual(expected[0], strmarker.calc_rmps(self.data, 'JSF AA', 5, 0.01))
+        self.assertEqual(sgm.calc_columns(self.data, tasks, 3), expected)
+
+    def testTabulate(self):
+        """tables are the same however they are calculated"""
+        expected = sgm.tabulate_rmps(self.data, self.samples, "text", "Theta = 0.01", 5, 0.01)
+        self.assertEqual(sgm.tabulate_rmps(self.data, self.samples, "text", "Theta = 0.01", 5, 0.01, jobs=2), expected)
+        self.assertTrue(expected.startswith('\nTheta = 0.01\n'))
+        expected = sgm.tabulate_pmps(self.data, self.samples, "html", "Modal Man")
+        self.assertEqual(sgm.tabulate_pmps(self.data, self.samples, "html", "Modal Man", jobs=2), expected)
+
+    def testStreamedTables(self):
+        """tables streamed to a file match the rendered strings, and templates are compiled once"""
+        columns = sgm.calc_columns(self.data, [('rmp', sample, 0, 0.0) for sample in self.samples])
+        for table_format in ["text", "html"]:
+            expected = sgm.format_rmps(columns, self.samples, table_format, "Raw")
+            out = StringIO()
+            self.assertEqual(sgm.format_rmps(columns, self.samples, table_format, "Raw", out), None)
+            self.assertEqual(out.getvalue(), expected)
+        compiled = dict(sgm._templates)
+        sgm.format_rmps(columns, self.samples, "text", "Raw again")
+        self.assertEqual(sgm._templates, compiled)
+
+
+if __name__ == "__main__":
+    unittest.main()
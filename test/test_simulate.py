@@ -0,0 +1,73 @@
+"""
+simulate test module.
+"""
+
+import unittest
+
+import numpy
+
+from strprofiles import frequencies
+from strprofiles import simulate
+from strprofiles import strmarker
+
+
+class SimulateTestCase(unittest.TestCase):
+    """
+    Test the Monte Carlo profile simulator.
+    """
+    def setUp(self):
+        """Make allele frequency data available for all test functions."""
+        self.data = frequencies.FrequencyStore([
+            {'name': 'AB', 'count': 200, 'marker': 'FGA', 'alleles': {'20': 0.2, '21': 0.5, '22': 0.3}},
+            {'name': 'AB', 'count': 200, 'marker': 'TH01', 'alleles': {'6': 0.4, '9.3': 0.6}}])
+        self.markers = ['FGA', 'TH01']
+
+    def testReproducible(self):
+        """results depend on the seed, not on the number of jobs"""
+        expected = simulate.simulate_profiles(self.data, 'AB', self.markers, 5000, 0.01, seed=7, chunk_size=1000)
+        result = simulate.simulate_profiles(self.data, 'AB', self.markers, 5000, 0.01, seed=7, chunk_size=1000,
+            jobs=2)
+        self.assertEqual(result['counts'].tolist(), expected['counts'].tolist())
+        self.assertEqual(result['matching_pairs'], expected['matching_pairs'])
+        self.assertEqual(result['quantiles'], expected['quantiles'])
+        result = simulate.simulate_profiles(self.data, 'AB', self.markers, 5000, 0.01, seed=8, chunk_size=1000)
+        self.assertNotEqual(result['counts'].tolist(), expected['counts'].tolist())
+
+    def testDistribution(self):
+        """simulated match probabilities and matching pairs agree with the calculated values"""
+        n = 20000
+        result = simulate.simulate_profiles(self.data, 'AB', self.markers, n, seed=1, chunk_size=3000)
+        self.assertEqual(result['counts'].sum(), n)
+        self.assertAlmostEqual(result['matching_pairs'] / result['expected_matching_pairs'], 1.0, 1)
+        expected = numpy.prod([strmarker.calc_marker_rmp(d['alleles'], 0.0) for d in self.data])
+        self.assertAlmostEqual(result['expected_matching_pairs'], n * (n - 1) / 2.0 * expected)
+        self.assertTrue(result['min'] <= result['quantiles'][0.01] <= result['quantiles'][0.5] <= result['max'])
+        # the most probable genotype, 21,22 6,9.3, has match probability 2 * 0.5 * 0.3 * 2 * 0.4 * 0.6
+        self.assertAlmostEqual(result['max'], numpy.log10(0.3 * 0.48))
+
+    def testMissingMarkers(self):
+        """markers without frequencies are left out, and a sample set with none of the markers is an error"""
+        expected = simulate.simulate_profiles(self.data, 'AB', self.markers, 2000, seed=3)
+        result = simulate.simulate_profiles(self.data, 'AB', ['CSF1PO'] + self.markers, 2000, seed=3)
+        self.assertEqual(result['markers'], self.markers)
+        self.assertEqual(result['counts'].tolist(), expected['counts'].tolist())
+        self.assertTrue(numpy.isfinite(result['mean']))
+        self.assertAlmostEqual(result['expected_matching_pairs'], expected['expected_matching_pairs'])
+        self.assertRaises(ValueError, simulate.simulate_profiles, self.data, 'AB', ['CSF1PO', 'TPOX'], 100)
+
+    def testEmpty(self):
+        """simulating no profiles gives an empty histogram and no matching pairs"""
+        result = simulate.simulate_profiles(self.data, 'AB', self.markers, 0)
+        self.assertEqual(result['counts'].sum(), 0)
+        self.assertEqual((result['matching_pairs'], result['expected_matching_pairs']), (0, 0.0))
+        self.assertEqual((result['mean'], result['min'], result['max'], result['quantiles'][0.5]),
+            (None, None, None, None))
+
+    def testHistogramQuantile(self):
+        """quantiles interpolated from a histogram"""
+        self.assertAlmostEqual(simulate.histogram_quantile(numpy.array([0.0, 1.0, 2.0]), [1, 3], 0.25), 1.0)
+        self.assertAlmostEqual(simulate.histogram_quantile(numpy.array([0.0, 1.0, 2.0]), [1, 3], 0.625), 1.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
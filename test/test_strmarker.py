@@ -4,6 +4,10 @@ strmarker test module.
 
 import unittest
 
+import numpy
+
+from strprofiles import frequencies
+from strprofiles import memo
 from strprofiles import strmarker
 
 
@@ -35,6 +39,22 @@ class StrProfilesTestCase(unittest.TestCase):
             alleles[i] /= 100.0
         return alleles
 
+    def _pairwiseMarkerRmp(self, alleles, theta):
+        """
+        Reference random match probability, summed over every ordered pair of alleles
+        """
+        rmp = 0.0
+        denom = (1 + theta) * (1 + 2 * theta)
+        for i in alleles:
+            for j in alleles:
+                if i == j:
+                    p = (2 * theta + (1 - theta) * alleles[i]) * (3 * theta + (1 - theta) * alleles[i]) / denom
+                    rmp += p * p
+                else:
+                    p = (theta + (1 - theta) * alleles[i]) * (theta + (1 - theta) * alleles[j]) / denom
+                    rmp += 2 * p * p
+        return rmp
+
     def testMarkerRandomMatchProbability(self):
         """marker random match probability"""
 
@@ -56,6 +76,27 @@ class StrProfilesTestCase(unittest.TestCase):
         result = strmarker.calc_marker_rmp(alleles, 0.0)
         self.assertAlmostEqual(result, expected, 3)
 
+    def testMarkerRandomMatchProbabilityArray(self):
+        """marker random match probability, closed form and batched"""
+        all_alleles = [self.AB_Cau_FGA_alleles, self.AB_Cau_TH01_alleles, self.AB_Cau_D16S539_alleles]
+        for theta in [0.0, 0.01, 0.03]:
+            for alleles in all_alleles:
+                expected = self._pairwiseMarkerRmp(alleles, theta)
+                self.assertAlmostEqual(strmarker.calc_marker_rmp(alleles, theta), expected, 12)
+
+            # rows of differing lengths padded into a single array
+            width = max([len(alleles) for alleles in all_alleles])
+            frequencies = numpy.zeros((len(all_alleles), width))
+            mask = numpy.zeros((len(all_alleles), width), dtype=bool)
+            for i, alleles in enumerate(all_alleles):
+                frequencies[i, :len(alleles)] = alleles.values()
+                mask[i, :len(alleles)] = True
+            result = strmarker.calc_marker_rmp_array(frequencies, theta, mask)
+            for i, alleles in enumerate(all_alleles):
+                self.assertAlmostEqual(result[i], self._pairwiseMarkerRmp(alleles, theta), 12)
+
+        self.assertEqual(strmarker.calc_marker_rmp({}, 0.01), 0.0)
+
     def testGetModalProfile(self):
         """Get modal profile."""
         item = {'name': 'AB', 'marker': 'VWA', 'alleles': {'5': 0.94, '6': 0.03, '7': 0.02, '8': 0.01}}
@@ -121,6 +162,42 @@ class StrProfilesTestCase(unittest.TestCase):
         #print "result 0.0", result, expected
         self.assertAlmostEqual(result, expected, 17)
 
+    def testProfileLogMatchProbabilities(self):
+        """batch profile match probabilities"""
+        data = frequencies.FrequencyStore([
+            {'name': 'AB', 'count': 200, 'marker': 'FGA', 'alleles': self.AB_Cau_FGA_alleles},
+            {'name': 'AB', 'count': 200, 'marker': 'TH01', 'alleles': self.AB_Cau_TH01_alleles},
+            {'name': 'AB', 'count': 200, 'marker': 'D16S539', 'alleles': self.AB_Cau_D16S539_alleles}])
+        markers = ['FGA', 'TH01', 'D16S539']
+        profiles = [strmarker.get_modal_profile(data, 'AB'),
+            {'FGA': ('18', '27'), 'TH01': (10, 10), 'D16S539': ('8', '15')},
+            {'FGA': ('20.2', '22.2'), 'D16S539': ('11', '11')}]
+        genotypes = data.encode_profiles(profiles, markers)
+        self.assertEqual(genotypes.shape, (3, 3, 2))
+        self.assertEqual(genotypes[2, 1].tolist(), [-1, -1])
+        thetas = [0.0, 0.01, 0.03]
+        result = strmarker.calc_profile_log_match_probabilities(genotypes, data, 'AB', markers, thetas, chunk_size=2)
+        self.assertEqual(result.shape, (3, 3))
+        for i, profile in enumerate(profiles):
+            pairs = {}
+            for marker in profile:
+                alleles = data['AB', marker]['alleles']
+                pairs[marker] = tuple([(a, alleles[a]) for a in [x[0] if isinstance(x, tuple) else x
+                    for x in profile[marker]]])
+            for j, theta in enumerate(thetas):
+                expected = numpy.log10(strmarker.calc_profile_match_probability(pairs, theta))
+                self.assertAlmostEqual(result[i, j], expected, 10)
+        result = strmarker.calc_profile_log_match_probabilities(genotypes, data, 'AB', markers, 0.01)
+        self.assertEqual(result.shape, (3,))
+
+        # an allele not seen in the sample set
+        genotypes = data.encode_profiles([{'FGA': ('17', '18')}], markers)
+        result = strmarker.calc_profile_log_match_probabilities(genotypes, data, 'AB', markers, 0.0)
+        self.assertEqual(result[0], -numpy.inf)
+        result = strmarker.calc_profile_log_match_probabilities(genotypes, data, 'AB', markers, 0.0,
+            minimum_frequency=0.01)
+        self.assertAlmostEqual(result[0], numpy.log10(2 * 0.01 * 0.015))
+
     def testRMPs(self):
         """test RMPs"""
         data = [{'name': 'AB', 'count': 400, 'marker': 'FGA', 'alleles': self.AB_Cau_FGA_alleles},
@@ -132,6 +209,67 @@ class StrProfilesTestCase(unittest.TestCase):
             print i
             self.assertAlmostEqual(result[i], expected[i], 3)
 
+    def testRMPCube(self):
+        """RMPs over a grid of theta values"""
+        data = frequencies.FrequencyStore([
+            {'name': 'AB', 'count': 200, 'marker': 'FGA', 'alleles': self.AB_Cau_FGA_alleles},
+            {'name': 'AB', 'count': 200, 'marker': 'TH01', 'alleles': self.AB_Cau_TH01_alleles},
+            {'name': 'AB', 'count': 200, 'marker': 'D16S539', 'alleles': self.AB_Cau_D16S539_alleles},
+            {'name': 'CD', 'count': 100, 'marker': 'FGA', 'alleles': {'20': 0.25, '21': 0.75}}])
+        thetas = numpy.linspace(0.0, 0.05, 11)
+        result = strmarker.calc_rmp_cube(data, ['AB', 'CD'], 5, thetas)
+        self.assertEqual(result['rmp'].shape, (2, len(strmarker.SGM_PLUS_MARKERS), len(thetas)))
+        self.assertEqual(result['count'], [200, 100])
+        for i, name in enumerate(['AB', 'CD']):
+            for k, theta in enumerate(thetas):
+                expected = strmarker.calc_rmps(data, name, 5, theta)
+                for j, marker in enumerate(strmarker.SGM_PLUS_MARKERS):
+                    if marker in expected:
+                        self.assertAlmostEqual(result['rmp'][i, j, k], expected[marker], 12)
+                    else:
+                        self.assertTrue(numpy.isnan(result['rmp'][i, j, k]))
+                self.assertAlmostEqual(result['combined'][i, k] / expected['combined'], 1.0, 10)
+                self.assertAlmostEqual(result['reciprocal'][i, k] / expected['reciprocal'], 1.0, 10)
+
+    def testRMPCache(self):
+        """pooled tables and marker RMPs are cached for a frequency store"""
+        data = frequencies.FrequencyStore([
+            {'name': 'AB', 'count': 200, 'marker': 'FGA', 'alleles': self.AB_Cau_FGA_alleles},
+            {'name': 'AB', 'count': 200, 'marker': 'TH01', 'alleles': self.AB_Cau_TH01_alleles},
+            {'name': 'AB', 'count': 200, 'marker': 'D16S539', 'alleles': self.AB_Cau_D16S539_alleles}])
+        strmarker.clear_caches()
+        expected = strmarker.calc_rmps(data, 'AB', 5, 0.0)
+        self.assertEqual(strmarker.cache_info()['pool']['misses'], 3)
+        self.assertEqual(strmarker.cache_info()['rmp']['misses'], 3)
+        self.assertEqual(strmarker.calc_rmps(data, 'AB', 5, 0.0), expected)
+        self.assertEqual(strmarker.cache_info()['rmp']['hits'], 3)
+        strmarker.calc_rmps(data, 'AB', 5, 0.01)
+        self.assertEqual(strmarker.cache_info()['pool']['hits'], 3)
+        pooled = strmarker.pooled_alleles(data, data['AB', 'FGA'], 5)
+        pooled.clear()
+        self.assertEqual(strmarker.pooled_alleles(data, data['AB', 'FGA'], 5),
+            strmarker.pool_alleles(self.AB_Cau_FGA_alleles, 5, 400))
+
+        # replacing the frequencies invalidates the cached results for that marker
+        data.add('AB', 'TH01', 200, {'6': 0.5, '9.3': 0.5})
+        result = strmarker.calc_rmps(data, 'AB', 5, 0.0)
+        self.assertEqual(result['FGA'], expected['FGA'])
+        self.assertAlmostEqual(result['TH01'], 0.375)
+        self.assertEqual(strmarker.cache_info()['rmp']['hits'], 5)
+
+        strmarker.clear_caches()
+        self.assertEqual(strmarker.cache_info()['rmp'], {'hits': 0, 'misses': 0, 'size': 0,
+            'maxsize': strmarker.RMP_CACHE.maxsize})
+
+        cache = memo.LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertFalse('b' in cache)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 1, 2))
+
     def testPoolAlleles(self):
         """test pool alleles"""
         # constructed counts (n=100)
@@ -169,6 +307,32 @@ class StrProfilesTestCase(unittest.TestCase):
         for i in expected:
             self.assertAlmostEqual(result[i], expected[i])
 
+    def testSortedAlleles(self):
+        """pooling with sorted allele tables matches pool_alleles exactly"""
+        tied = {'a': 0.01, 'b': 0.01, 'c': 0.01, 'd': 0.02, 'e': 0.45, 'f': 0.5}
+        for alleles in (self.AB_Cau_FGA_alleles, self.AB_Cau_TH01_alleles, self.AB_Cau_D16S539_alleles, tied):
+            table = strmarker.SortedAlleles(alleles)
+            for count in (0, 100, 400):
+                for cutoff in (0, 0.005, 0.01, 0.02, 1, 2, 3, 5, 10, 20, 40, 100, 400, 1000):
+                    self.assertEqual(table.pool(cutoff, count), strmarker.pool_alleles(alleles, cutoff, count))
+
+    def testCutoffSweep(self):
+        """pooled tables and RMPs for a sweep of cutoffs"""
+        data = frequencies.FrequencyStore([
+            {'name': 'AB', 'count': 200, 'marker': 'FGA', 'alleles': self.AB_Cau_FGA_alleles},
+            {'name': 'AB', 'count': 200, 'marker': 'TH01', 'alleles': self.AB_Cau_TH01_alleles},
+            {'name': 'AB', 'count': 200, 'marker': 'D16S539', 'alleles': self.AB_Cau_D16S539_alleles}])
+        cutoffs = [0, 1, 2, 5, 10, 50, 400]
+        result = strmarker.calc_cutoff_sweep(data, 'AB', cutoffs, 0.01)
+        for k, cutoff in enumerate(cutoffs):
+            expected = strmarker.calc_rmps(data, 'AB', cutoff, 0.01)
+            for d in data:
+                self.assertEqual(result[d.marker]['alleles'][k], strmarker.pool_alleles(d.alleles, cutoff, 400))
+                self.assertAlmostEqual(result[d.marker]['rmp'][k], expected[d.marker], 12)
+            self.assertAlmostEqual(result['combined'][k] / expected['combined'], 1.0, 10)
+        # everything pooled into a single bin
+        self.assertAlmostEqual(result['FGA']['rmp'][-1], 1.0)
+
 
 if __name__ == "__main__":
     unittest.main()